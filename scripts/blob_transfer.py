@@ -0,0 +1,159 @@
+# Parallel, chunked transfers between local files and Azure blobs
+# used by the integration tests and the data tooling.
+#
+# The blob service clients are cached per storage account. With a connection
+# string (AZURE_STORAGE_CONNECTION_STRING), the clients target the endpoint of
+# the connection string, for instance a local Azurite emulator.
+#
+import base64
+import hashlib
+import os
+import threading
+from typing import Dict, Optional
+
+from azure.identity import DefaultAzureCredential
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+DEFAULT_CHUNK_SIZE = 4 << 20
+DEFAULT_CONCURRENCY = 8
+
+
+class BlobTransferError(Exception):
+    pass
+
+
+def get_file_md5(local_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> bytes:
+    """return the MD5 digest of a file read by chunks"""
+    md5 = hashlib.md5()
+    with open(local_file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.digest()
+
+
+class BlobTransfer:
+    """Class used to upload and download blobs by blocks in parallel
+
+    The clients and the credential are shared by all the instances.
+    """
+
+    _lock = threading.Lock()
+    _credential = None
+    _clients: Dict[str, BlobServiceClient] = {}
+
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        connection_string: Optional[str] = None,
+    ) -> None:
+        # size of the blocks uploaded and of the ranges downloaded
+        self.chunk_size = chunk_size
+        # number of blocks or ranges transferred in parallel
+        self.concurrency = concurrency
+        self.connection_string = connection_string
+
+    @classmethod
+    def from_environment(cls) -> "BlobTransfer":
+        return cls(
+            chunk_size=int(
+                os.environ.get("BLOB_TRANSFER_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+            ),
+            concurrency=int(
+                os.environ.get("BLOB_TRANSFER_CONCURRENCY", DEFAULT_CONCURRENCY)
+            ),
+            connection_string=os.environ.get("AZURE_STORAGE_CONNECTION_STRING") or None,
+        )
+
+    def get_client_key(self, account_name: str) -> str:
+        return f"{account_name}|{self.connection_string}|{self.chunk_size}"
+
+    def get_blob_service_client(self, account_name: str) -> BlobServiceClient:
+        """return the cached client of the storage account"""
+        key = self.get_client_key(account_name)
+        with BlobTransfer._lock:
+            client = BlobTransfer._clients.get(key)
+            if client is not None:
+                return client
+            options = {
+                "max_block_size": self.chunk_size,
+                "max_single_put_size": self.chunk_size,
+                "max_chunk_get_size": self.chunk_size,
+                "max_single_get_size": self.chunk_size,
+            }
+            if self.connection_string:
+                client = BlobServiceClient.from_connection_string(
+                    self.connection_string, **options
+                )
+            else:
+                if BlobTransfer._credential is None:
+                    BlobTransfer._credential = DefaultAzureCredential()
+                client = BlobServiceClient(
+                    account_url=f"https://{account_name}.blob.core.windows.net/",
+                    credential=BlobTransfer._credential,
+                    **options,
+                )
+            BlobTransfer._clients[key] = client
+            return client
+
+    def upload_file(
+        self,
+        local_file_path: str,
+        account_name: str,
+        container_name: str,
+        blob_path: str,
+    ) -> str:
+        """upload the file by blocks staged in parallel, the MD5 of the file is
+        stored in the blob properties, return the MD5 (base64)"""
+        md5 = get_file_md5(local_file_path, self.chunk_size)
+        blob_client = self.get_blob_service_client(account_name).get_blob_client(
+            container_name, blob_path
+        )
+        with open(local_file_path, "rb") as data:
+            blob_client.upload_blob(
+                data,
+                blob_type="BlockBlob",
+                length=os.path.getsize(local_file_path),
+                overwrite=True,
+                max_concurrency=self.concurrency,
+                content_settings=ContentSettings(content_md5=bytearray(md5)),
+            )
+        return base64.b64encode(md5).decode()
+
+    def download_file(
+        self,
+        local_file_path: str,
+        account_name: str,
+        container_name: str,
+        blob_path: str,
+        verify: bool = True,
+    ) -> str:
+        """download the blob by ranges in parallel written directly in the
+        file, check the MD5 of the file if the blob has one, return the MD5
+        (base64)"""
+        blob_client = self.get_blob_service_client(account_name).get_blob_client(
+            container_name, blob_path
+        )
+        download_stream = blob_client.download_blob(max_concurrency=self.concurrency)
+        with open(local_file_path, "wb") as file:
+            download_stream.readinto(file)
+        md5 = get_file_md5(local_file_path, self.chunk_size)
+        expected = download_stream.properties.content_settings.content_md5
+        if verify and expected and bytes(expected) != md5:
+            raise BlobTransferError(
+                f"MD5 mismatch for {container_name}/{blob_path}: "
+                f"{base64.b64encode(bytes(expected)).decode()} != {base64.b64encode(md5).decode()}"
+            )
+        return base64.b64encode(md5).decode()
+
+    def blob_exists(self, account_name: str, container_name: str, blob_path: str):
+        blob_client = self.get_blob_service_client(account_name).get_blob_client(
+            container_name, blob_path
+        )
+        return blob_client.exists()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._clients.clear()
+            cls._credential = None
@@ -0,0 +1,307 @@
+# Integration Test Runner:
+# run several Data Factory scenarios concurrently through the Web App
+# (upload, create, run, wait, download, compare) and report the duration of
+# each stage.
+# Usage from the folder scripts (same environment variables as
+# test_datafactory.py):
+#   PYTHONPATH=.. python3 -m scripts.integration_runner --scenarios 8 --concurrency 8
+#
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+from pydantic import BaseModel
+
+from .configuration import Configuration
+from .models import (
+    ColumnDelimiter,
+    Dataset,
+    EscapeCharacter,
+    PipelineRequest,
+    QuoteCharacter,
+    Status,
+)
+from .test_common import (
+    compare_files,
+    download_file_from_azure_blob,
+    upload_file_to_azure_blob,
+)
+
+STAGES = ["upload", "create", "run", "wait", "download", "compare"]
+
+
+class ScenarioResult(BaseModel):
+    name: str
+    pipeline_name: str = ""
+    run_id: str = ""
+    status: str = ""
+    success: bool = False
+    error: str = ""
+    # duration of each stage in seconds
+    timings: Dict[str, float] = {}
+
+
+def get_backoff_delays(
+    initial: float = 1.0,
+    factor: float = 2.0,
+    maximum: float = 30.0,
+    jitter: float = 0.1,
+) -> Iterator[float]:
+    """yield the delays between two status requests: exponential backoff
+    with jitter (the polls of concurrent scenarios don't synchronize)"""
+    delay = initial
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * factor, maximum)
+
+
+def wait_for_run(
+    session: requests.Session,
+    run_url: str,
+    timeout: float = 3600,
+    delays: Iterator[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> dict:
+    """poll the run status with backoff until the run is completed,
+    return the last RunResponse (json)"""
+    delays = get_backoff_delays() if delays is None else delays
+    deadline = time.monotonic() + timeout
+    while True:
+        response = session.get(url=run_url)
+        response.raise_for_status()
+        run_response = response.json()
+        if run_response["status"]["status"] in [Status.SUCCEEDED, Status.FAILED]:
+            return run_response
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Run not completed after {timeout} s: {run_url}")
+        sleep(next(delays))
+
+
+class IntegrationRunner:
+    """Class used to run the integration scenarios concurrently"""
+
+    def __init__(
+        self,
+        configuration: Configuration,
+        base_url: str,
+        session: requests.Session = None,
+        upload: Callable[[str, str, str, str], bool] = upload_file_to_azure_blob,
+        download: Callable[[str, str, str, str], bool] = download_file_from_azure_blob,
+        timeout: float = 3600,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.configuration = configuration
+        self.base_url = base_url
+        # the HTTP connections are reused by the scenarios
+        self.session = requests.Session() if session is None else session
+        self.upload = upload
+        self.download = download
+        self.timeout = timeout
+        self.sleep = sleep
+
+    def get_dataset(self, container_name: str, folder_path: str, file_name: str):
+        return Dataset(
+            resource_group_name=self.configuration.RESOURCE_GROUP,
+            storage_account_name=self.configuration.STORAGE_ACCOUNT_NAME,
+            container_name=container_name,
+            folder_path=folder_path,
+            file_pattern_or_name=file_name,
+            first_row_as_header=True,
+            column_delimiter=ColumnDelimiter.SEMICOLON.value,
+            quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
+            escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
+        )
+
+    def get_pipeline_request(self, name: str) -> PipelineRequest:
+        """each scenario uses its own folders (and then its own pipeline)"""
+        configuration = self.configuration
+        return PipelineRequest(
+            source=self.get_dataset(
+                configuration.SOURCE_CONTAINER,
+                f"{configuration.SOURCE_BLOB_FOLDER}/{name}",
+                configuration.SOURCE_BLOB_FILE,
+            ),
+            join=self.get_dataset(
+                configuration.SOURCE_CONTAINER,
+                f"{configuration.JOIN_BLOB_FOLDER}/{name}",
+                configuration.JOIN_BLOB_FILE,
+            ),
+            columns=json.loads(configuration.SELECTED_COLUMNS),
+            sink=self.get_dataset(
+                configuration.SINK_CONTAINER,
+                f"{configuration.SINK_BLOB_FOLDER}/{name}",
+                configuration.SINK_BLOB_FILE,
+            ),
+        )
+
+    def run_scenario(self, name: str) -> ScenarioResult:
+        """run the stages of a scenario, stop at the first failed stage"""
+        result = ScenarioResult(name=name)
+        pipeline_request = self.get_pipeline_request(name)
+        account_name = self.configuration.STORAGE_ACCOUNT_NAME
+        stage = STAGES[0]
+        start = time.perf_counter()
+
+        def end_stage(next_stage: Optional[str]):
+            nonlocal stage, start
+            now = time.perf_counter()
+            result.timings[stage] = now - start
+            stage, start = next_stage, now
+
+        try:
+            for local_path, dataset in [
+                (self.configuration.SOURCE_LOCAL_PATH, pipeline_request.source),
+                (self.configuration.JOIN_LOCAL_PATH, pipeline_request.join),
+            ]:
+                if not self.upload(
+                    local_path,
+                    account_name,
+                    dataset.container_name,
+                    f"{dataset.folder_path}/{dataset.file_pattern_or_name}",
+                ):
+                    raise Exception(f"Upload of {local_path} failed")
+            end_stage("create")
+
+            response = self.session.post(
+                url=f"{self.base_url}/pipeline", json=pipeline_request.dict()
+            )
+            response.raise_for_status()
+            pipeline_response = response.json()
+            # the creation errors are returned with the status code 200
+            if pipeline_response["error"]["code"] != 0:
+                raise Exception(
+                    f"Creation failed: {pipeline_response['error']['message']}"
+                )
+            result.pipeline_name = pipeline_response["pipeline_name"]
+            end_stage("run")
+
+            pipeline_url = f"{self.base_url}/pipeline/{result.pipeline_name}"
+            response = self.session.post(url=f"{pipeline_url}/run")
+            response.raise_for_status()
+            result.run_id = response.json()["run_id"]
+            end_stage("wait")
+
+            run_response = wait_for_run(
+                self.session,
+                f"{pipeline_url}/run/{result.run_id}",
+                timeout=self.timeout,
+                sleep=self.sleep,
+            )
+            result.status = run_response["status"]["status"]
+            if result.status != Status.SUCCEEDED:
+                raise Exception(f"Run failed: {run_response['error']['message']}")
+            end_stage("download")
+
+            with tempfile.TemporaryDirectory() as folder:
+                sink = pipeline_request.sink
+                local_path = os.path.join(folder, sink.file_pattern_or_name)
+                if not self.download(
+                    local_path,
+                    account_name,
+                    sink.container_name,
+                    f"{sink.folder_path}/{sink.file_pattern_or_name}",
+                ):
+                    raise Exception("Download of the sink file failed")
+                end_stage("compare")
+
+                if not compare_files(
+                    self.configuration.SINK_LOCAL_PATH,
+                    local_path,
+                    ordered=False,
+                    header=True,
+                ):
+                    raise Exception("The sink file is not the expected file")
+                end_stage(None)
+            result.success = True
+        except Exception as ex:
+            result.error = f"{stage}: {ex}"
+            end_stage(None)
+        print(
+            f"Scenario {name} {'successful' if result.success else 'failed'} "
+            f"pipeline: {result.pipeline_name} run_id: {result.run_id} {result.error}"
+        )
+        return result
+
+    def run(self, scenarios: int, concurrency: int) -> List[ScenarioResult]:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(
+                executor.map(
+                    self.run_scenario,
+                    [f"scenario-{index:03d}" for index in range(scenarios)],
+                )
+            )
+
+
+def get_report(results: List[ScenarioResult], duration: float) -> dict:
+    """return the duration statistics of each stage"""
+    stages = {}
+    for stage in STAGES:
+        values = [
+            result.timings[stage] for result in results if stage in result.timings
+        ]
+        if values:
+            stages[stage] = {
+                "count": len(values),
+                "min": min(values),
+                "median": statistics.median(values),
+                "max": max(values),
+            }
+    return {
+        "scenarios": len(results),
+        "succeeded": sum(1 for result in results if result.success),
+        "duration": duration,
+        "stages": stages,
+        "results": [result.dict() for result in results],
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"Scenarios: {report['scenarios']} succeeded: {report['succeeded']} "
+        f"duration: {report['duration']:.1f} s"
+    )
+    print(
+        f"{'stage':<10} {'count':>6} {'min (s)':>10} {'median (s)':>11} "
+        f"{'max (s)':>10}"
+    )
+    for stage, values in report["stages"].items():
+        print(
+            f"{stage:<10} {values['count']:>6} {values['min']:>10.2f} "
+            f"{values['median']:>11.2f} {values['max']:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Integration test runner")
+    parser.add_argument("--scenarios", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--report", help="json file of the performance report")
+    args = parser.parse_args()
+
+    configuration = Configuration()
+    runner = IntegrationRunner(
+        configuration,
+        base_url=f"https://{configuration.WEB_APP_SERVER}",
+        timeout=args.timeout,
+    )
+    start = time.perf_counter()
+    results = runner.run(args.scenarios, args.concurrency)
+    report = get_report(results, time.perf_counter() - start)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=2)
+    if report["succeeded"] != report["scenarios"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
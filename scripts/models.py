@@ -1,8 +1,20 @@
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+
+
+class DatasetFormat(str, Enum):
+    DELIMITED_TEXT = "DelimitedText"
+    PARQUET = "Parquet"
+
+
+class CompressionCodec(str, Enum):
+    NONE = "none"
+    SNAPPY = "snappy"
+    GZIP = "gzip"
+    LZO = "lzo"
 
 
 class Dataset(BaseModel):
@@ -16,6 +28,74 @@ class Dataset(BaseModel):
     column_delimiter: str
     quote_char: str
     escape_char: str
+    format: DatasetFormat = DatasetFormat.DELIMITED_TEXT
+    # snappy by default for Parquet datasets, none for DelimitedText datasets
+    compression_codec: Optional[CompressionCodec] = None
+
+    @validator("compression_codec")
+    def check_compression_codec(cls, value, values):
+        # lzo is supported by the Parquet datasets only (format error reported otherwise)
+        dataset_format = values.get("format")
+        if (
+            value == CompressionCodec.LZO
+            and dataset_format is not None
+            and dataset_format != DatasetFormat.PARQUET
+        ):
+            raise ValueError(
+                f"compression codec {value.value} not supported by the {dataset_format.value} datasets"
+            )
+        return value
+
+
+class ComputeType(str, Enum):
+    GENERAL = "General"
+    MEMORY_OPTIMIZED = "MemoryOptimized"
+    COMPUTE_OPTIMIZED = "ComputeOptimized"
+
+
+class DataFlowCompute(BaseModel):
+    compute_type: ComputeType = ComputeType.GENERAL
+    # 8, 16, 32, 48, 80, 144 or 272 cores
+    core_count: int = 8
+    # managed integration runtime used to run the data flow,
+    # AutoResolveIntegrationRuntime if not set
+    integration_runtime_name: Optional[str] = None
+    # time to live of the integration runtime cluster in minutes
+    time_to_live: Optional[int] = None
+
+
+class JoinType(str, Enum):
+    INNER = "inner"
+    LEFT = "left"
+    RIGHT = "right"
+    OUTER = "outer"
+
+
+class Broadcast(str, Enum):
+    AUTO = "auto"
+    LEFT = "left"
+    RIGHT = "right"
+    OFF = "off"
+
+
+class PartitionType(str, Enum):
+    # use current partitioning
+    NONE = "none"
+    ROUND_ROBIN = "roundRobin"
+    # hash partitioning on the key column
+    HASH = "hash"
+
+
+class DataFlowOptions(BaseModel):
+    join_type: JoinType = JoinType.INNER
+    broadcast: Broadcast = Broadcast.AUTO
+    source_partition_type: PartitionType = PartitionType.NONE
+    source_partition_count: int = 8
+    sink_partition_type: PartitionType = PartitionType.NONE
+    sink_partition_count: int = 8
+    # read only the key and the selected columns from the source dataset
+    # and only the key from the join dataset (schema drift disabled)
+    projection: bool = False
 
 
 class PipelineRequest(BaseModel):
@@ -23,6 +103,11 @@ class PipelineRequest(BaseModel):
     join: Dataset
     columns: List[str]
     sink: Dataset
+    compute: Optional[DataFlowCompute] = None
+    options: Optional[DataFlowOptions] = None
+    # if set, check the headers of the source and join datasets (first bytes
+    # of the files) before creating the pipeline
+    preflight: Optional[bool] = None
 
 
 class Error(BaseModel):
@@ -37,6 +122,8 @@ class PipelineResponse(BaseModel):
     join: Dataset
     columns: List[str]
     sink: Dataset
+    compute: Optional[DataFlowCompute] = None
+    options: Optional[DataFlowOptions] = None
     pipeline_name: str
     error: Error
 
@@ -67,6 +154,13 @@ class QuoteCharacter(str, Enum):
     SINGLE_QUOTE = "'"
 
 
+class Backend(str, Enum):
+    DATA_FACTORY = "datafactory"
+    LOCAL = "local"
+    # each run is dispatched to the backend with the lowest estimated duration
+    AUTO = "auto"
+
+
 class StatusDetails(BaseModel):
     status: Status
     start: datetime
@@ -74,8 +168,104 @@ class StatusDetails(BaseModel):
     duration: int
 
 
+class RunRequest(BaseModel):
+    # if set, return the run already Queued/InProgress for the same pipeline
+    dedupe: Optional[bool] = None
+    # a second request with the same key returns the run launched by the first
+    idempotency_key: Optional[str] = None
+
+
+class RoutingDecision(BaseModel):
+    backend: Backend
+    # size in bytes of the source and join datasets (0 if unknown)
+    input_size: int
+    # estimated duration of the run in ms for each available backend
+    estimated_durations: Dict[Backend, int]
+    reason: str
+
+
 class RunResponse(BaseModel):
     run_id: str
     pipeline_name: str
     status: StatusDetails
     error: Error
+    metrics: Optional[Dict[str, int]] = None
+    routing: Optional[RoutingDecision] = None
+
+
+class GarbageCollectionRequest(BaseModel):
+    # if set, only report the objects which would be deleted
+    dry_run: bool = True
+    # the pipelines neither run nor created for retention_days days are
+    # deleted, DATAFACTORY_GC_RETENTION_DAYS if not set
+    retention_days: Optional[int] = None
+
+
+class GarbageCollectionReport(BaseModel):
+    dry_run: bool
+    retention_days: int
+    start: datetime
+    end: datetime
+    # number of pipelines created by the service in the factory
+    pipelines: int
+    stale_pipelines: List[str]
+    # objects deleted (to delete if dry_run) in dependency order:
+    # pipeline:{name}, dataflow:{name} or dataset:{name}
+    deleted_objects: List[str]
+    errors: List[str]
+
+
+class CredentialMetrics(BaseModel):
+    scope: str
+    # seconds since the token was acquired, seconds before it expires
+    token_age: Optional[float] = None
+    expires_in: Optional[float] = None
+    refreshes: int
+    # refreshes made while serving a request (token missing or expired)
+    blocking_refreshes: int
+    refresh_errors: int
+    # milliseconds
+    last_refresh_duration: float
+    average_refresh_duration: float
+    last_error: Optional[str] = None
+
+
+class TransportMetrics(BaseModel):
+    # scheme://host:port
+    host: str
+    pool_size: int
+    # connections created, requests sent, requests sent on a connection
+    # already open
+    connections: int
+    requests: int
+    reused_requests: int
+    idle_connections: int
+
+
+class ConfigurationReport(BaseModel):
+    # number of the snapshot of the settings
+    version: int
+    loaded: datetime
+    # environment variables changed by the reload
+    changed: List[str]
+    # changed settings read when the application starts
+    restart_required: List[str]
+
+
+class RebalanceRequest(BaseModel):
+    # if set, only report the pipelines which would be moved
+    dry_run: bool = True
+
+
+class RebalanceReport(BaseModel):
+    dry_run: bool
+    start: datetime
+    end: datetime
+    # factories of the ring: {resource group}/{factory}
+    factories: List[str]
+    # number of pipelines created by the service in the factories
+    pipelines: int
+    # pipelines moved (to move if dry_run) to the factory owning them:
+    # {pipeline}:{source factory}->{target factory}
+    moves: List[str]
+    errors: List[str]
@@ -0,0 +1,217 @@
+# Unit tests of the blob transfers against a local stand-in of the blob
+# service (subset of the Blob REST API used by the SDK: put blob, put block,
+# put block list, get blob with ranges, get blob properties), no Azure
+# subscription required.
+#
+import base64
+import hashlib
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from .blob_transfer import BlobTransfer, BlobTransferError
+from .test_common import compare_files
+
+ACCOUNT_NAME = "devstoreaccount1"
+# well-known key of the Azurite emulator
+ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="  # noqa: E501
+CONTAINER_NAME = "container"
+
+
+class BlobStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def get_blob_key(self) -> str:
+        path = urlparse(self.path).path
+        return path[len(f"/{ACCOUNT_NAME}/"):]
+
+    def get_query(self):
+        return {
+            name: values[0]
+            for name, values in parse_qs(urlparse(self.path).query).items()
+        }
+
+    def send(self, status: int, headers=None, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("x-ms-request-id", "stand-in")
+        self.send_header("x-ms-version", "2020-06-12")
+        self.send_header(
+            "Date", format_datetime(datetime.now(timezone.utc), usegmt=True)
+        )
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_error_code(self, status: int, code: str):
+        self.send(status, {"x-ms-error-code": code})
+
+    def get_properties_headers(self, blob) -> dict:
+        headers = {
+            "ETag": f'"{blob["etag"]}"',
+            "Last-Modified": format_datetime(blob["modified"], usegmt=True),
+            "x-ms-blob-type": "BlockBlob",
+            "Content-Type": "application/octet-stream",
+        }
+        if blob["md5"]:
+            headers["x-ms-blob-content-md5"] = blob["md5"]
+        return headers
+
+    def store_blob(self, data: bytes):
+        self.server.blobs[self.get_blob_key()] = {
+            "data": data,
+            "md5": self.headers.get("x-ms-blob-content-md5"),
+            "etag": hashlib.md5(data).hexdigest(),
+            "modified": datetime.now(timezone.utc),
+        }
+        blob = self.server.blobs[self.get_blob_key()]
+        self.send(
+            201,
+            {
+                "ETag": f'"{blob["etag"]}"',
+                "Last-Modified": format_datetime(blob["modified"], usegmt=True),
+            },
+        )
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        query = self.get_query()
+        key = self.get_blob_key()
+        if query.get("comp") == "block":
+            self.server.blocks[(key, query["blockid"])] = body
+            self.server.block_requests += 1
+            self.send(201)
+        elif query.get("comp") == "blocklist":
+            block_ids = re.findall(rb"<(?:Latest|Uncommitted|Committed)>([^<]*)<", body)
+            self.store_blob(
+                b"".join(
+                    self.server.blocks.pop((key, block_id.decode()))
+                    for block_id in block_ids
+                )
+            )
+        else:
+            self.store_blob(body)
+
+    def do_HEAD(self):
+        blob = self.server.blobs.get(self.get_blob_key())
+        if blob is None:
+            self.send_error_code(404, "BlobNotFound")
+            return
+        headers = self.get_properties_headers(blob)
+        headers["Content-Length"] = str(len(blob["data"]))
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_GET(self):
+        blob = self.server.blobs.get(self.get_blob_key())
+        if blob is None:
+            self.send_error_code(404, "BlobNotFound")
+            return
+        data = blob["data"]
+        headers = self.get_properties_headers(blob)
+        byte_range = self.headers.get("x-ms-range") or self.headers.get("Range")
+        if not byte_range:
+            self.send(200, headers, data)
+            return
+        start, end = [int(value) for value in byte_range.split("=")[1].split("-")]
+        if start >= len(data):
+            self.send_error_code(416, "InvalidRange")
+            return
+        end = min(end, len(data) - 1)
+        self.server.range_requests += 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        self.send(206, headers, data[start: end + 1])
+
+
+@pytest.fixture(scope="module")
+def blob_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BlobStandInHandler)
+    server.blobs = {}
+    server.blocks = {}
+    server.block_requests = 0
+    server.range_requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def get_transfer(server, chunk_size: int, concurrency: int = 4) -> BlobTransfer:
+    connection_string = (
+        f"DefaultEndpointsProtocol=http;AccountName={ACCOUNT_NAME};"
+        f"AccountKey={ACCOUNT_KEY};"
+        f"BlobEndpoint=http://127.0.0.1:{server.server_port}/{ACCOUNT_NAME};"
+    )
+    return BlobTransfer(
+        chunk_size=chunk_size,
+        concurrency=concurrency,
+        connection_string=connection_string,
+    )
+
+
+@pytest.mark.parametrize("size", [0, 1000, 1 << 20])
+def test_upload_download(blob_stand_in, tmp_path, size):
+    local_path = tmp_path / "data.bin"
+    local_path.write_bytes(os.urandom(size))
+    transfer = get_transfer(blob_stand_in, chunk_size=64 << 10)
+    block_requests = blob_stand_in.block_requests
+    md5 = transfer.upload_file(
+        str(local_path), ACCOUNT_NAME, CONTAINER_NAME, f"folder/data-{size}.bin"
+    )
+    assert (
+        md5 == base64.b64encode(hashlib.md5(local_path.read_bytes()).digest()).decode()
+    )
+    if size > 64 << 10:
+        # uploaded by blocks
+        assert blob_stand_in.block_requests - block_requests == -(-size // (64 << 10))
+
+    download_path = tmp_path / "download.bin"
+    range_requests = blob_stand_in.range_requests
+    assert (
+        transfer.download_file(
+            str(download_path), ACCOUNT_NAME, CONTAINER_NAME, f"folder/data-{size}.bin"
+        )
+        == md5
+    )
+    assert compare_files(str(local_path), str(download_path))
+    if size > 64 << 10:
+        # downloaded by ranges
+        assert blob_stand_in.range_requests - range_requests == -(-size // (64 << 10))
+    assert transfer.blob_exists(ACCOUNT_NAME, CONTAINER_NAME, f"folder/data-{size}.bin")
+    assert not transfer.blob_exists(ACCOUNT_NAME, CONTAINER_NAME, "folder/unknown.bin")
+
+
+def test_client_cache(blob_stand_in):
+    transfer = get_transfer(blob_stand_in, chunk_size=1 << 20)
+    assert transfer.get_blob_service_client(ACCOUNT_NAME) is get_transfer(
+        blob_stand_in, chunk_size=1 << 20
+    ).get_blob_service_client(ACCOUNT_NAME)
+
+
+def test_download_checksum_mismatch(blob_stand_in, tmp_path):
+    local_path = tmp_path / "data.bin"
+    local_path.write_bytes(os.urandom(200 << 10))
+    transfer = get_transfer(blob_stand_in, chunk_size=64 << 10)
+    transfer.upload_file(str(local_path), ACCOUNT_NAME, CONTAINER_NAME, "corrupted.bin")
+    blob = blob_stand_in.blobs[f"{CONTAINER_NAME}/corrupted.bin"]
+    blob["data"] = b"x" + blob["data"][1:]
+    with pytest.raises(BlobTransferError):
+        transfer.download_file(
+            str(tmp_path / "download.bin"),
+            ACCOUNT_NAME,
+            CONTAINER_NAME,
+            "corrupted.bin",
+        )
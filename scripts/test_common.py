@@ -3,73 +3,248 @@
 # Update the file conftest.py to define the parameters associated
 # with this test.
 #
-from azure.identity import DefaultAzureCredential
+import fnmatch
+import glob
+import hashlib
+import heapq
+import itertools
+import os
+import tempfile
+from typing import Callable, Iterable, Iterator, List, Tuple
+
 from azure.storage.blob import BlobServiceClient
 
+from .blob_transfer import BlobTransfer
+
+# size of the chunks read from the files
+CHUNK_SIZE = 1 << 20
+# number of records sorted in memory by the external sort
+SORT_RUN_RECORDS = 1 << 20
+# the multiset digest is the sum of the record hashes modulo 2^128
+DIGEST_MODULUS = 1 << 128
+
+
+def get_output_files(path: str) -> List[str]:
+    """return the files of an output: the file itself, the files matching a
+    pattern or the part-* files of a folder (Spark output, the other files
+    of the folder if there is no part-* file)"""
+    if os.path.isdir(path):
+        names = sorted(fnmatch.filter(os.listdir(path), "part-*"))
+        if not names:
+            names = sorted(
+                name
+                for name in os.listdir(path)
+                if not name.startswith((".", "_"))
+                and os.path.isfile(os.path.join(path, name))
+            )
+        return [os.path.join(path, name) for name in names]
+    if glob.has_magic(path):
+        return sorted(glob.glob(path))
+    return [path]
+
+
+def read_records(
+    path: str, header: bool = False, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """yield the records (lines without end of line) of the files of an
+    output reading fixed-size chunks, the first record of each file is
+    skipped if header is True"""
+    for file_path in get_output_files(path):
+        with open(file_path, "rb") as file:
+            rest = b""
+            skip = header
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                lines = (rest + chunk).split(b"\n")
+                rest = lines.pop()
+                for line in lines:
+                    if skip:
+                        skip = False
+                        continue
+                    yield line.rstrip(b"\r")
+            if rest and not skip:
+                yield rest.rstrip(b"\r")
+
+
+def read_header(path: str) -> bytes:
+    """return the first record of the first file of an output"""
+    for file_path in get_output_files(path):
+        with open(file_path, "rb") as file:
+            return file.readline().rstrip(b"\r\n")
+    return b""
+
 
-def compare_files(first_file_path: str, second_file_path: str) -> bool:
+def get_multiset_digest(records: Iterable[bytes]) -> Tuple[int, int]:
+    """return the number of records and an order-insensitive digest of the
+    records: the sum of the record hashes (duplicated records count)"""
+    count = 0
+    digest = 0
+    for record in records:
+        count += 1
+        digest += int.from_bytes(
+            hashlib.blake2b(record, digest_size=16).digest(), "little"
+        )
+    return count, digest % DIGEST_MODULUS
+
+
+def external_sort(
+    records: Iterable[bytes], folder: str, run_records: int = SORT_RUN_RECORDS
+) -> Iterator[bytes]:
+    """yield the records sorted, the records are sorted in memory by runs of
+    run_records records written in temporary files and merged"""
+    run_files = []
     try:
-        with open(first_file_path) as first:
-            with open(second_file_path) as second:
-                first_lines = first.readlines()
-                print(f"first_lines: {first_lines}")
-                second_lines = second.readlines()
-                print(f"second_lines: {second_lines}")
-                if not first_lines == second_lines:
-                    return False
+        while True:
+            run = sorted(itertools.islice(records, run_records))
+            if not run:
+                break
+            run_file = tempfile.TemporaryFile(dir=folder)
+            for record in run:
+                run_file.write(record.hex().encode() + b"\n")
+            run_file.seek(0)
+            run_files.append(run_file)
+        yield from heapq.merge(
+            *[
+                (bytes.fromhex(line.rstrip(b"\n").decode()) for line in run_file)
+                for run_file in run_files
+            ]
+        )
+    finally:
+        for run_file in run_files:
+            run_file.close()
+
+
+def get_differences(
+    first_records: Iterator[bytes], second_records: Iterator[bytes], limit: int
+) -> List[str]:
+    """return the first differences of two sorted record streams"""
+    differences = []
+    first = next(first_records, None)
+    second = next(second_records, None)
+    while (first is not None or second is not None) and len(differences) < limit:
+        if second is None or (first is not None and first < second):
+            differences.append(f"- {first}")
+            first = next(first_records, None)
+        elif first is None or second < first:
+            differences.append(f"+ {second}")
+            second = next(second_records, None)
+        else:
+            first = next(first_records, None)
+            second = next(second_records, None)
+    return differences
+
+
+def compare_records(
+    first_records: Iterable[bytes],
+    second_records: Iterable[bytes],
+    ordered: bool = True,
+    show_differences: int = 10,
+    first_sort_records: Callable[[], Iterable[bytes]] = None,
+    second_sort_records: Callable[[], Iterable[bytes]] = None,
+) -> bool:
+    """compare two record streams in bounded memory:
+    - ordered: record by record
+    - not ordered: multiset digests, if the digests are different the first
+      differences are found with an external sort of both outputs"""
+    if ordered:
+        for index, (first, second) in enumerate(
+            itertools.zip_longest(first_records, second_records), start=1
+        ):
+            if first != second:
+                print(f"Files differ at record {index}: {first} != {second}")
+                return False
+        return True
 
+    first_count, first_digest = get_multiset_digest(first_records)
+    second_count, second_digest = get_multiset_digest(second_records)
+    if first_count == second_count and first_digest == second_digest:
+        return True
+    print(f"Files differ: {first_count} records != {second_count} records")
+    if show_differences > 0 and first_sort_records and second_sort_records:
+        with tempfile.TemporaryDirectory() as folder:
+            for difference in get_differences(
+                external_sort(iter(first_sort_records()), folder),
+                external_sort(iter(second_sort_records()), folder),
+                show_differences,
+            ):
+                print(difference)
+    return False
+
+
+def compare_files(
+    first_file_path: str,
+    second_file_path: str,
+    ordered: bool = True,
+    header: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> bool:
+    """compare two outputs (a file, a file pattern or a folder of part-*
+    files) in bounded memory, with ordered False the order of the records
+    is ignored, with header True the first record of each file is compared
+    once"""
+    try:
+        if header and read_header(first_file_path) != read_header(second_file_path):
+            print("Files differ: headers are different")
+            return False
+        return compare_records(
+            read_records(first_file_path, header, chunk_size),
+            read_records(second_file_path, header, chunk_size),
+            ordered=ordered,
+            first_sort_records=lambda: read_records(
+                first_file_path, header, chunk_size
+            ),
+            second_sort_records=lambda: read_records(
+                second_file_path, header, chunk_size
+            ),
+        )
     except Exception as e:
         print(f"Error while comparing files: Exception: {repr(e)}")
         return False
-    return True
 
 
-def get_substring_after_sep(line: str, sep: str) -> str:
-    result = ""
-    if not line:
-        return line
-    pos = line.index(sep)
-    if pos > 0:
-        result = line[pos:]
-    return result
+def get_substring_after_sep(line: bytes, sep: bytes) -> bytes:
+    """return the record from the first separator (the key is removed)"""
+    pos = line.find(sep)
+    if pos < 0:
+        return b""
+    return line[pos:]
 
 
-def compare_files_without_key(ref_file_path: str, file_path: str) -> bool:
-    result = True
-    try:
-        with open(ref_file_path) as ref:
-            with open(file_path) as comp:
-                count = 0
-                while True:
-                    count += 1
-                    # Get next line from file
-                    first_line = get_substring_after_sep(ref.readline(), ";")
-                    second_line = get_substring_after_sep(comp.readline(), ";")
-                    if not first_line:
-                        break
-                    if first_line != second_line:
-                        result = False
-                        break
+def compare_files_without_key(
+    ref_file_path: str,
+    file_path: str,
+    ordered: bool = True,
+    header: bool = False,
+    sep: str = ";",
+    chunk_size: int = CHUNK_SIZE,
+) -> bool:
+    """compare two outputs ignoring the first column (generated keys)"""
 
+    def read_records_without_key(path: str) -> Iterator[bytes]:
+        for record in read_records(path, header, chunk_size):
+            yield get_substring_after_sep(record, sep.encode())
+
+    try:
+        return compare_records(
+            read_records_without_key(ref_file_path),
+            read_records_without_key(file_path),
+            ordered=ordered,
+            first_sort_records=lambda: read_records_without_key(ref_file_path),
+            second_sort_records=lambda: read_records_without_key(file_path),
+        )
     except Exception as e:
         print(f"Error while comparing files: Exception: {repr(e)}")
         return False
-    return result
 
 
 def get_blob_service_client(account_name: str) -> BlobServiceClient:
     try:
-        credentials = DefaultAzureCredential()
-        blob_service_client = BlobServiceClient(
-            account_url="https://{account}.blob.core.windows.net/".format(
-                account=account_name
-            ),
-            credential=credentials,
-        )
+        return BlobTransfer.from_environment().get_blob_service_client(account_name)
     except Exception as e:
         print(f"Error getting BlobServiceClient: Exception: {repr(e)}")
         return None
-    return blob_service_client
 
 
 def upload_file_to_azure_blob(
@@ -79,12 +254,9 @@ def upload_file_to_azure_blob(
     blob_path: str,
 ) -> bool:
     try:
-        blob_service_client = get_blob_service_client(account_name)
-        container_client = blob_service_client.get_container_client(container_name)
-        with open(local_file_path, "rb") as data:
-            container_client.upload_blob(
-                blob_path, data, blob_type="BlockBlob", overwrite=True
-            )
+        BlobTransfer.from_environment().upload_file(
+            local_file_path, account_name, container_name, blob_path
+        )
     except Exception as e:
         print(f"Error while uploading files: Exception: {repr(e)}")
         return False
@@ -98,12 +270,9 @@ def download_file_from_azure_blob(
     blob_path: str,
 ) -> bool:
     try:
-        blob_service_client = get_blob_service_client(account_name)
-        blob_client = blob_service_client.get_blob_client(container_name, blob_path)
-        # Download the file.
-        with open(local_file_path, "wb") as blob:
-            download_stream = blob_client.download_blob()
-            blob.write(download_stream.readall())
+        BlobTransfer.from_environment().download_file(
+            local_file_path, account_name, container_name, blob_path
+        )
     except Exception as e:
         print(f"Error while downloading files: Exception: {repr(e)}")
         return False
@@ -116,9 +285,9 @@ def azure_blob_exists(
     blob_path: str,
 ) -> bool:
     try:
-        blob_service_client = get_blob_service_client(account_name)
-        blob_client = blob_service_client.get_blob_client(container_name, blob_path)
-        return blob_client.exists()
+        return BlobTransfer.from_environment().blob_exists(
+            account_name, container_name, blob_path
+        )
     except Exception as e:
         print(f"Error while checking if blob exists: Exception: {repr(e)}")
         return False
@@ -0,0 +1,100 @@
+# Unit tests of the comparison of the test outputs (test_common.py) on small
+# local files, no Azure subscription required.
+#
+import os
+
+from .test_common import (
+    compare_files,
+    compare_records,
+    external_sort,
+    get_differences,
+    get_multiset_digest,
+    get_output_files,
+    read_records,
+)
+
+
+def write_file(path: str, lines) -> str:
+    with open(path, "wb") as file:
+        file.write(b"".join(line + b"\n" for line in lines))
+    return str(path)
+
+
+def test_multiset_digest():
+    records = [b"1;a", b"2;b", b"3;c"]
+    assert get_multiset_digest(records) == get_multiset_digest(reversed(records))
+    # the duplicated records are counted
+    count, digest = get_multiset_digest([b"1;a", b"1;a", b"2;b"])
+    assert count == 3
+    assert (count, digest) != get_multiset_digest([b"1;a", b"2;b", b"2;b"])
+    assert get_multiset_digest([]) == (0, 0)
+
+
+def test_external_sort(tmp_path):
+    records = [f"{i * 7 % 11};value".encode() for i in range(11)] + [b"3;value"]
+    # runs of 2 records merged
+    assert list(external_sort(iter(records), str(tmp_path), run_records=2)) == sorted(
+        records
+    )
+    assert list(external_sort(iter([]), str(tmp_path), run_records=2)) == []
+    # the run files are removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_get_differences():
+    assert get_differences(iter([b"a", b"b"]), iter([b"a", b"b"]), 10) == []
+    # missing and extra records
+    assert get_differences(
+        iter([b"a", b"b", b"b", b"d"]), iter([b"a", b"b", b"c", b"d", b"e"]), 10
+    ) == ["- b'b'", "+ b'c'", "+ b'e'"]
+    assert get_differences(iter([b"a", b"b", b"c"]), iter([]), 2) == [
+        "- b'a'",
+        "- b'b'",
+    ]
+
+
+def test_compare_records_not_ordered(capsys):
+    first = [b"1;a", b"2;b", b"2;b", b"3;c"]
+    assert compare_records(iter(first), iter(reversed(first)), ordered=False)
+    assert not compare_records(iter(first), iter(reversed(first)))
+
+    second = [b"3;c", b"2;b", b"1;a", b"4;d"]
+    assert not compare_records(
+        iter(first),
+        iter(second),
+        ordered=False,
+        first_sort_records=lambda: first,
+        second_sort_records=lambda: second,
+    )
+    output = capsys.readouterr().out
+    assert "Files differ: 4 records != 4 records" in output
+    assert "- b'2;b'" in output
+    assert "+ b'4;d'" in output
+
+
+def test_compare_files_part_folder(tmp_path):
+    reference = write_file(
+        tmp_path / "reference.csv", [b"key;value", b"1;a", b"2;b", b"3;c"]
+    )
+    folder = tmp_path / "output"
+    folder.mkdir()
+    # Spark output: part-* files with their own header
+    write_file(folder / "part-00001.csv", [b"key;value", b"3;c", b"1;a"])
+    write_file(folder / "part-00000.csv", [b"key;value", b"2;b"])
+    write_file(folder / "_SUCCESS", [])
+    assert get_output_files(str(folder)) == [
+        str(folder / "part-00000.csv"),
+        str(folder / "part-00001.csv"),
+    ]
+    assert list(read_records(str(folder), header=True)) == [b"2;b", b"3;c", b"1;a"]
+    assert compare_files(reference, str(folder), ordered=False, header=True)
+    assert not compare_files(reference, str(folder), header=True)
+
+    # a missing record
+    write_file(folder / "part-00000.csv", [b"key;value"])
+    assert not compare_files(reference, str(folder), ordered=False, header=True)
+    # small chunks: records split across the chunks
+    write_file(folder / "part-00000.csv", [b"key;value", b"2;b"])
+    assert compare_files(
+        reference, str(folder), ordered=False, header=True, chunk_size=3
+    )
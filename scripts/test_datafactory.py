@@ -1,13 +1,13 @@
 import json
 import os
 import tempfile
-import time
 
 import pytest
 import requests
 from fastapi import HTTPException
 
 from .configuration import Configuration
+from .integration_runner import wait_for_run
 from .models import (
     ColumnDelimiter,
     Dataset,
@@ -178,37 +178,22 @@ def test_wait_for_run_completion(
 ):
     try:
         result = False
-        status = Status.IN_PROGRESS
-        while status != Status.FAILED and status != Status.SUCCEEDED:
-            run_url = f"https://{configuration.WEB_APP_SERVER}/pipeline/{configuration.PIPELINE_NAME}/run/{configuration.RUN_ID}"
-            headers = {
-                "Content-Type": "application/json",
-            }
-            run_response = requests.get(
-                url=run_url,
-                headers=headers,
+        run_url = f"https://{configuration.WEB_APP_SERVER}/pipeline/{configuration.PIPELINE_NAME}/run/{configuration.RUN_ID}"
+        # poll the status with exponential backoff instead of fixed sleeps
+        response: RunResponse = wait_for_run(requests.Session(), run_url)
+        assert response["run_id"] == configuration.RUN_ID
+        assert response["pipeline_name"] == configuration.PIPELINE_NAME
+        status = response["status"]["status"]
+        if status == Status.FAILED:
+            message = response["error"]["message"]
+            print(
+                f"Run Status for pipeline '{configuration.PIPELINE_NAME}' run_id '{configuration.RUN_ID}' message: {message}"
             )
-            run_response.raise_for_status()
-            response: RunResponse = json.loads(run_response.text)
-            assert response["run_id"] == configuration.RUN_ID
-            assert response["pipeline_name"] == configuration.PIPELINE_NAME
-            status = response["status"]["status"]
-            if status == Status.FAILED:
-                message = response["error"]["message"]
-                print(
-                    f"Run Status for pipeline '{configuration.PIPELINE_NAME}' run_id '{configuration.RUN_ID}' message: {message}"
-                )
-            else:
-                if status == Status.SUCCEEDED:
-                    print(
-                        f"Run Status for pipeline '{configuration.PIPELINE_NAME}' run_id '{configuration.RUN_ID}' successful. Dataset in file: {configuration.SINK_BLOB_FOLDER}/{configuration.SINK_BLOB_FILE} "
-                    )
-                    result = True
-                else:
-                    print(
-                        f"Run Status for pipeline '{configuration.PIPELINE_NAME}' run_id '{configuration.RUN_ID}' status: '{status}'"
-                    )
-            time.sleep(20)
+        else:
+            print(
+                f"Run Status for pipeline '{configuration.PIPELINE_NAME}' run_id '{configuration.RUN_ID}' successful. Dataset in file: {configuration.SINK_BLOB_FOLDER}/{configuration.SINK_BLOB_FILE} "
+            )
+            result = True
 
     except HTTPException as e:
         print(f"HTTPException while calling {run_url}: {repr(e)}")
@@ -244,6 +229,8 @@ def test_check_received_file(
     result = compare_files(
         first_file_path=configuration.SINK_LOCAL_PATH,
         second_file_path=result_local_path,
+        ordered=False,
+        header=True,
     )
     assert result is True
 
@@ -0,0 +1,232 @@
+# Unit tests of the integration test runner against a simulated Web App and
+# a local folder standing in for the storage account, no Azure subscription
+# required.
+#
+import os
+import shutil
+import threading
+
+import pytest
+
+from .configuration import Configuration
+from .integration_runner import (
+    STAGES,
+    IntegrationRunner,
+    get_backoff_delays,
+    get_report,
+    wait_for_run,
+)
+
+ENVIRONMENT = {
+    "AZURE_SUBSCRIPTION_ID": "subscription",
+    "AZURE_TENANT_ID": "tenant",
+    "WEB_APP_SERVER": "webapp",
+    "RESOURCE_GROUP": "rg",
+    "DATAFACTORY_STORAGE_ACCOUNT_NAME": "storageaccount",
+    "DATAFACTORY_STORAGE_SOURCE_CONTAINER_NAME": "source",
+    "DATAFACTORY_STORAGE_SINK_CONTAINER_NAME": "sink",
+    "SOURCE_FOLDER_FORMAT": "source/{time}",
+    "JOIN_FOLDER_FORMAT": "join/{time}",
+    "SINK_FOLDER_FORMAT": "sink/{time}",
+    "SOURCE_LOCAL_RELATIVE_PATH": "data/sourcedata.csv",
+    "JOIN_LOCAL_RELATIVE_PATH": "data/joindata.csv",
+    "SINK_LOCAL_RELATIVE_PATH": "data/sinkdata.csv",
+    "SELECTED_COLUMNS": '["key", "phone", "email"]',
+    "SOURCE_BLOB_FILE": "sourcedata.csv",
+    "JOIN_BLOB_FILE": "joindata.csv",
+    "SINK_BLOB_FILE": "sinkdata-00001.csv",
+}
+
+
+class FakeResponse:
+    def __init__(self, body: dict, status_code: int = 200):
+        self.body = body
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP error {self.status_code}")
+
+    def json(self):
+        return self.body
+
+
+class FakeWebApp:
+    """session simulating the Web App: each run is in progress for a number of
+    status requests then copies the expected sink file in the storage folder"""
+
+    def __init__(
+        self, storage: str, sink_path: str, polls: int = 2, error: dict = None
+    ):
+        self.storage = storage
+        self.sink_path = sink_path
+        self.polls = polls
+        # error of the pipeline creation, returned with the status code 200
+        self.error = error or {"code": 0, "message": ""}
+        self.lock = threading.Lock()
+        self.pipelines = {}
+        self.runs = {}
+
+    def post(self, url: str, json: dict = None):
+        with self.lock:
+            if url.endswith("/pipeline"):
+                pipeline_name = f"pipeline-{len(self.pipelines)}"
+                self.pipelines[pipeline_name] = json
+                return FakeResponse(
+                    {"pipeline_name": pipeline_name, "error": self.error}
+                )
+            pipeline_name = url.split("/")[-2]
+            run_id = f"run-{len(self.runs)}"
+            self.runs[run_id] = {"pipeline_name": pipeline_name, "polls": 0}
+            return FakeResponse({"run_id": run_id, "pipeline_name": pipeline_name})
+
+    def get(self, url: str):
+        run_id = url.split("/")[-1]
+        with self.lock:
+            run = self.runs[run_id]
+            run["polls"] += 1
+            if run["polls"] <= self.polls:
+                status = "InProgress"
+            else:
+                status = "Succeeded"
+                sink = self.pipelines[run["pipeline_name"]]["sink"]
+                path = os.path.join(
+                    self.storage,
+                    sink["container_name"],
+                    sink["folder_path"],
+                    sink["file_pattern_or_name"],
+                )
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copyfile(self.sink_path, path)
+        return FakeResponse(
+            {
+                "run_id": run_id,
+                "pipeline_name": run["pipeline_name"],
+                "status": {"status": status},
+                "error": {"message": ""},
+            }
+        )
+
+
+@pytest.fixture(scope="function")
+def configuration(monkeypatch):
+    for name, value in ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    return Configuration()
+
+
+def get_storage_functions(storage: str):
+    def upload(local_file_path, account_name, container_name, blob_path):
+        path = os.path.join(storage, container_name, blob_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_file_path, path)
+        return True
+
+    def download(local_file_path, account_name, container_name, blob_path):
+        path = os.path.join(storage, container_name, blob_path)
+        if not os.path.exists(path):
+            return False
+        shutil.copyfile(path, local_file_path)
+        return True
+
+    return upload, download
+
+
+def test_backoff_delays():
+    delays = get_backoff_delays(initial=1.0, factor=2.0, maximum=5.0, jitter=0.0)
+    assert [next(delays) for _ in range(5)] == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_wait_for_run(configuration, tmp_path):
+    web_app = FakeWebApp(str(tmp_path), configuration.SINK_LOCAL_PATH, polls=3)
+    web_app.post("https://webapp/pipeline", json={"sink": {}})
+    web_app.post("https://webapp/pipeline/pipeline-0/run")
+    web_app.pipelines["pipeline-0"]["sink"] = {
+        "container_name": "sink",
+        "folder_path": "folder",
+        "file_pattern_or_name": "sink.csv",
+    }
+    sleeps = []
+    run_response = wait_for_run(
+        web_app,
+        "https://webapp/pipeline/pipeline-0/run/run-0",
+        delays=get_backoff_delays(jitter=0.0),
+        sleep=sleeps.append,
+    )
+    assert run_response["status"]["status"] == "Succeeded"
+    assert sleeps == [1.0, 2.0, 4.0]
+
+    web_app.post("https://webapp/pipeline/pipeline-0/run")
+    with pytest.raises(TimeoutError):
+        wait_for_run(
+            web_app,
+            "https://webapp/pipeline/pipeline-0/run/run-1",
+            timeout=0,
+            sleep=sleeps.append,
+        )
+
+
+def test_run_scenarios(configuration, tmp_path):
+    storage = str(tmp_path)
+    upload, download = get_storage_functions(storage)
+    web_app = FakeWebApp(storage, configuration.SINK_LOCAL_PATH)
+    runner = IntegrationRunner(
+        configuration,
+        base_url="https://webapp",
+        session=web_app,
+        upload=upload,
+        download=download,
+        sleep=lambda delay: None,
+    )
+    results = runner.run(scenarios=4, concurrency=4)
+    assert [result.success for result in results] == [True] * 4
+    # one pipeline per scenario
+    assert len({result.pipeline_name for result in results}) == 4
+    assert all(list(result.timings) == STAGES for result in results)
+
+    report = get_report(results, 1.0)
+    assert report["succeeded"] == 4
+    assert list(report["stages"]) == STAGES
+    assert report["stages"]["wait"]["count"] == 4
+
+
+def test_run_scenario_failed_stage(configuration, tmp_path):
+    upload, _ = get_storage_functions(str(tmp_path))
+    runner = IntegrationRunner(
+        configuration,
+        base_url="https://webapp",
+        session=FakeWebApp(str(tmp_path), configuration.SINK_LOCAL_PATH),
+        upload=upload,
+        download=lambda *args: False,
+        sleep=lambda delay: None,
+    )
+    result = runner.run_scenario("scenario-000")
+    assert not result.success
+    assert result.error.startswith("download:")
+    assert list(result.timings) == ["upload", "create", "run", "wait", "download"]
+    report = get_report([result], 1.0)
+    assert report["succeeded"] == 0
+    assert "compare" not in report["stages"]
+
+
+def test_run_scenario_creation_error(configuration, tmp_path):
+    upload, download = get_storage_functions(str(tmp_path))
+    web_app = FakeWebApp(
+        str(tmp_path),
+        configuration.SINK_LOCAL_PATH,
+        error={"code": 3, "message": "data flow not created"},
+    )
+    runner = IntegrationRunner(
+        configuration,
+        base_url="https://webapp",
+        session=web_app,
+        upload=upload,
+        download=download,
+        sleep=lambda delay: None,
+    )
+    result = runner.run_scenario("scenario-000")
+    assert not result.success
+    assert result.error == "create: Creation failed: data flow not created"
+    assert result.pipeline_name == ""
+    assert list(result.timings) == ["upload", "create"]
+    assert web_app.runs == {}
@@ -0,0 +1,139 @@
+# Benchmark of the local execution engine
+# Usage from the folder src/factory_rest_api:
+#   PYTHONPATH=. python3 benchmarks/local_engine_benchmark.py --rows 1000000
+#
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from src.local_engine_service import LocalEngineService
+from src.models import (
+    ColumnDelimiter,
+    Dataset,
+    EscapeCharacter,
+    PipelineRequest,
+    QuoteCharacter,
+)
+
+STORAGE_ACCOUNT_NAME = "storageaccount"
+CONTAINER_NAME = "container"
+
+
+def get_dataset(file_name: str) -> Dataset:
+    return Dataset(
+        resource_group_name="",
+        storage_account_name=STORAGE_ACCOUNT_NAME,
+        container_name=CONTAINER_NAME,
+        folder_path="",
+        file_pattern_or_name=file_name,
+        first_row_as_header=True,
+        column_delimiter=ColumnDelimiter.SEMICOLON.value,
+        quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
+        escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
+    )
+
+
+def generate_data(folder: str, rows: int, join_ratio: float):
+    """generate a source dataset with the columns of scripts/data/sourcedata.csv
+    and a join dataset with rows * join_ratio keys"""
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "sourcedata.csv"), "w") as file:
+        file.write("key;name;address;phone;zipcode;sum;order;email\n")
+        for i in range(rows):
+            file.write(
+                f"{i};Name{i};{i} Los Gatos street;+33656{i:07d};22700;7.50;2;user{i}@example.com\n"
+            )
+    random.seed(0)
+    with open(os.path.join(folder, "joindata.csv"), "w") as file:
+        file.write("key\n")
+        for i in random.sample(range(rows * 2), int(rows * join_ratio)):
+            file.write(f"{i}\n")
+
+
+def get_pipeline_request() -> PipelineRequest:
+    return PipelineRequest(
+        source=get_dataset("sourcedata.csv"),
+        join=get_dataset("joindata.csv"),
+        columns=["key", "phone", "email"],
+        sink=get_dataset("sinkdata.csv"),
+    )
+
+
+def benchmark(name: str, engine: LocalEngineService, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        metrics = engine.run(get_pipeline_request())
+        durations.append(time.perf_counter() - start)
+    duration = min(durations)
+    rows_per_second = metrics["source_rows"] / duration
+    print(
+        f"{name:<24} {duration:8.3f} s {rows_per_second:14,.0f} rows/s  metrics: {metrics}"
+    )
+    return rows_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local engine benchmark")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--join-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=0,
+        help="memory limit in bytes of the partitioned (spill to disk) run, "
+        "0: a quarter of the join dataset size",
+    )
+    parser.add_argument(
+        "--workers",
+        default="1,2,4,8,16",
+        help="comma separated numbers of processes of the process pool runs",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        generate_data(
+            os.path.join(root, STORAGE_ACCOUNT_NAME, CONTAINER_NAME),
+            args.rows,
+            args.join_ratio,
+        )
+        print(f"rows: {args.rows} join ratio: {args.join_ratio}")
+        reference = benchmark(
+            "csv (row by row)",
+            LocalEngineService(root, engine=LocalEngineService.CSV_ENGINE),
+            args.repeat,
+        )
+        result = benchmark(
+            "arrow (column batches)",
+            LocalEngineService(root, engine=LocalEngineService.ARROW_ENGINE),
+            args.repeat,
+        )
+        print(f"speedup: {result / reference:.2f}x")
+        join_size = os.path.getsize(
+            os.path.join(root, STORAGE_ACCOUNT_NAME, CONTAINER_NAME, "joindata.csv")
+        )
+        benchmark(
+            "arrow (spill to disk)",
+            LocalEngineService(
+                root,
+                engine=LocalEngineService.ARROW_ENGINE,
+                memory_limit=args.memory_limit or join_size // 4,
+            ),
+            args.repeat,
+        )
+        print(f"process pool scaling (CPUs: {os.cpu_count()})")
+        for workers in [int(value) for value in args.workers.split(",")]:
+            benchmark(
+                f"arrow ({workers} workers)",
+                LocalEngineService(
+                    root, engine=LocalEngineService.ARROW_ENGINE, workers=workers
+                ),
+                args.repeat,
+            )
+
+
+if __name__ == "__main__":
+    main()
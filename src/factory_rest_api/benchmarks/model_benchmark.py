@@ -0,0 +1,210 @@
+# Benchmark of the construction of the response models
+# Usage from the folder src/factory_rest_api:
+#   PYTHONPATH=. python3 benchmarks/model_benchmark.py --count 10000
+#
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from src.factory_service import FactoryService, FactoryServiceError
+from src.models import (
+    ColumnDelimiter,
+    DataFlowOptions,
+    Dataset,
+    DatasetFormat,
+    Error,
+    EscapeCharacter,
+    PipelineResponse,
+    QuoteCharacter,
+    RunResponse,
+    StatusDetails,
+)
+
+SERVICE = SimpleNamespace(
+    properties=SimpleNamespace(
+        service_endpoint="https://storageaccount.blob.core.windows.net/"
+    )
+)
+
+
+def get_dataset_resource(container_name: str, file_name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        properties=SimpleNamespace(
+            location=SimpleNamespace(
+                container=container_name,
+                folder_path="folder/2022-01-03-10-02-22",
+                file_name=file_name,
+            ),
+            first_row_as_header=True,
+            column_delimiter=";",
+            quote_char='"',
+            escape_char='"',
+            compression_codec=None,
+        )
+    )
+
+
+RESOURCES = [
+    get_dataset_resource("source", "sourcedata.csv"),
+    get_dataset_resource("source", "joindata.csv"),
+    get_dataset_resource("sink", "sinkdata-00001.csv"),
+]
+
+# pipeline run returned by the SDK
+PIPELINE_RUN = SimpleNamespace(
+    status="Succeeded",
+    run_start=datetime(2022, 1, 3, 10, 2, 22),
+    run_end=datetime(2022, 1, 3, 10, 3, 22),
+    duration_in_ms=60000,
+    message="",
+)
+
+
+def get_validated_dataset(resource: SimpleNamespace) -> Dataset:
+    """former construction of FactoryService.get_dataset_from_resource"""
+    properties = resource.properties
+    return Dataset(
+        resource_group_name="datafactory-rg",
+        storage_account_name="storageaccount",
+        container_name=properties.location.container,
+        folder_path=properties.location.folder_path,
+        file_pattern_or_name=properties.location.file_name,
+        first_row_as_header=properties.first_row_as_header,
+        column_delimiter=ColumnDelimiter.SEMICOLON.value,
+        quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
+        escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
+        format=DatasetFormat.DELIMITED_TEXT,
+        compression_codec=None,
+    )
+
+
+def get_validated_error() -> Error:
+    return Error(
+        code=FactoryServiceError.NO_ERROR,
+        message="",
+        source="factory_rest_api",
+        date=datetime.utcnow(),
+    )
+
+
+def validated_run_status():
+    """former construction of a RunResponse (run status)"""
+    return RunResponse(
+        run_id="run-id",
+        pipeline_name="Pipeline0001",
+        status=StatusDetails(
+            status=PIPELINE_RUN.status,
+            start=PIPELINE_RUN.run_start,
+            end=PIPELINE_RUN.run_end,
+            duration=PIPELINE_RUN.duration_in_ms,
+        ),
+        error=get_validated_error(),
+    )
+
+
+def validated_pipeline_status():
+    """former construction of a PipelineResponse (pipeline status)"""
+    source, join, sink = [get_validated_dataset(resource) for resource in RESOURCES]
+    return PipelineResponse(
+        source=source,
+        join=join,
+        columns=["key", "phone", "email"],
+        sink=sink,
+        options=DataFlowOptions(),
+        pipeline_name="Pipeline0001",
+        error=get_validated_error(),
+    )
+
+
+def get_trusted_functions(factory_service: FactoryService):
+    def trusted_run_status():
+        return factory_service.create_run_response(
+            run_id="run-id",
+            pipeline_name="Pipeline0001",
+            status=PIPELINE_RUN.status,
+            start=PIPELINE_RUN.run_start,
+            end=PIPELINE_RUN.run_end,
+            duration_in_ms=PIPELINE_RUN.duration_in_ms,
+            error_code=FactoryServiceError.NO_ERROR,
+            error_message=PIPELINE_RUN.message,
+        )
+
+    def trusted_pipeline_status():
+        source, join, sink = [
+            factory_service.get_dataset_from_resource(resource, SERVICE)
+            for resource in RESOURCES
+        ]
+        return PipelineResponse.construct(
+            source=source,
+            join=join,
+            columns=["key", "phone", "email"],
+            sink=sink,
+            options=DataFlowOptions(),
+            pipeline_name="Pipeline0001",
+            error=factory_service.get_error(FactoryServiceError.NO_ERROR, ""),
+        )
+
+    return trusted_run_status, trusted_pipeline_status
+
+
+def measure(name: str, count: int, function) -> float:
+    start = time.process_time()
+    for _ in range(count):
+        function()
+    duration = time.process_time() - start
+    # peak of the memory allocated while building a response (temporary
+    # objects of the validation included) and memory of the response
+    tracemalloc.start()
+    peaks = []
+    responses = []
+    for _ in range(100):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        responses.append(function())
+        after, peak = tracemalloc.get_traced_memory()
+        peaks.append((peak - current, after - current))
+    tracemalloc.stop()
+    peak = sum(peak for peak, _ in peaks) / len(peaks)
+    size = sum(size for _, size in peaks) / len(peaks)
+    print(
+        f"{name:<24} {duration * 1_000_000 / count:>8.2f} us CPU "
+        f"{peak:>8.0f} bytes peak {size:>8.0f} bytes retained per request"
+    )
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response model benchmark")
+    parser.add_argument("--count", type=int, default=10000)
+    args = parser.parse_args()
+
+    with patch.object(FactoryService, "initialize_azure_clients", return_value=True):
+        factory_service = FactoryService(
+            "subscription", "datafactory-rg", "datafactory", "source", "sink"
+        )
+    trusted_run_status, trusted_pipeline_status = get_trusted_functions(
+        factory_service
+    )
+    # same responses (except the date of the error)
+    assert trusted_run_status().dict(exclude={"error"}) == (
+        validated_run_status().dict(exclude={"error"})
+    )
+    assert trusted_pipeline_status().dict(exclude={"error"}) == (
+        validated_pipeline_status().dict(exclude={"error"})
+    )
+
+    for name, validated, trusted in [
+        ("Run status", validated_run_status, trusted_run_status),
+        ("Pipeline status", validated_pipeline_status, trusted_pipeline_status),
+    ]:
+        print(f"{name} ({args.count} requests)")
+        default = measure("validated models", args.count, validated)
+        fast = measure("trusted construction", args.count, trusted)
+        print(f"speed-up: {default / fast:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Benchmark of the serialization of the responses
+# Usage from the folder src/factory_rest_api:
+#   PYTHONPATH=. python3 benchmarks/response_benchmark.py --count 10000
+#
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from src.models import (
+    ColumnDelimiter,
+    DataFlowOptions,
+    Dataset,
+    Error,
+    EscapeCharacter,
+    PipelineResponse,
+    QuoteCharacter,
+)
+from src.response_service import BROTLI, GZIP, Compressor, brotli, dumps
+from starlette.responses import JSONResponse
+
+
+def get_dataset(container_name: str, file_name: str) -> Dataset:
+    return Dataset(
+        resource_group_name="datafactory-rg",
+        storage_account_name="storageaccount",
+        container_name=container_name,
+        folder_path="folder/2022-01-03-10-02-22",
+        file_pattern_or_name=file_name,
+        first_row_as_header=True,
+        column_delimiter=ColumnDelimiter.SEMICOLON.value,
+        quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
+        escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
+    )
+
+
+def get_pipeline_response(index: int) -> PipelineResponse:
+    return PipelineResponse(
+        source=get_dataset("source", "sourcedata.csv"),
+        join=get_dataset("source", "joindata.csv"),
+        columns=["key", "phone", "email"],
+        sink=get_dataset("sink", "sinkdata-00001.csv"),
+        options=DataFlowOptions(),
+        pipeline_name=f"Pipeline{index:032x}",
+        error=Error(
+            code=0, message="", source="factory_rest_api", date=datetime.utcnow()
+        ),
+    )
+
+
+def serialize(o):
+    """former encoder of FactoryService.raise_http_exception"""
+    if isinstance(o, dict):
+        return {k: serialize(v) for k, v in o.items()}
+    if isinstance(o, list):
+        return [serialize(e) for e in o]
+    if isinstance(o, datetime):
+        return o.isoformat()
+    return o
+
+
+def measure(name: str, count: int, function):
+    start = time.perf_counter()
+    function()
+    duration = time.perf_counter() - start
+    print(f"{name:<48} {duration * 1_000_000 / count:>10.2f} us per response")
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization benchmark")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--list-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    responses = [get_pipeline_response(index) for index in range(args.count)]
+    field = create_response_field(name="response", type_=PipelineResponse)
+
+    async def fastapi_default():
+        for response in responses:
+            content = await serialize_response(
+                field=field, response_content=response, is_coroutine=False
+            )
+            JSONResponse(content)
+
+    print(f"PipelineResponse serialization ({args.count} responses)")
+    default = measure(
+        "FastAPI default (validate + jsonable_encoder + json)",
+        args.count,
+        lambda: asyncio.run(fastapi_default()),
+    )
+    single_pass = measure(
+        "orjson single pass",
+        args.count,
+        lambda: [dumps(response) for response in responses],
+    )
+    print(f"speed-up: {default / single_pass:.1f}x")
+
+    errors = [response.error for response in responses]
+    print(f"\nError serialization ({args.count} errors)")
+    default = measure(
+        "json.dumps(serialize(error.dict())) + JSONResponse",
+        args.count,
+        lambda: [
+            JSONResponse({"detail": json.dumps(serialize(error.dict()))})
+            for error in errors
+        ],
+    )
+    single_pass = measure(
+        "orjson single pass",
+        args.count,
+        lambda: [dumps({"detail": error}) for error in errors],
+    )
+    print(f"speed-up: {default / single_pass:.1f}x")
+
+    body = dumps(responses[: args.list_size])
+    print(f"\nCompression of a list of {args.list_size} responses: {len(body)} bytes")
+    encodings = [GZIP] + ([BROTLI] if brotli is not None else [])
+    for encoding in encodings:
+        start = time.perf_counter()
+        compressor = Compressor(encoding, gzip_level=6, brotli_quality=4)
+        data = compressor.compress(body) + compressor.flush()
+        duration = time.perf_counter() - start
+        print(
+            f"{encoding:<6} {len(data):>10} bytes ratio {len(body) / len(data):>6.1f} "
+            f"{duration * 1000:>8.2f} ms"
+        )
+    if brotli is None:
+        print("br     brotli module not installed")
+
+
+if __name__ == "__main__":
+    main()
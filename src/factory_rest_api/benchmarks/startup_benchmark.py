@@ -0,0 +1,85 @@
+# Benchmark of the start time of the service
+# Usage from the folder src/factory_rest_api:
+#   PYTHONPATH=. python3 benchmarks/startup_benchmark.py --runs 5
+#
+# The time is measured from the start of the process to the first response
+# of GET /version: with the SDK modules imported on first use (lazy) and
+# imported before serving the requests (DATAFACTORY_WARM_UP=startup, same
+# imports as the former eager imports of the modules).
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+from src.import_service import ImportService
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_startup(warm_up: str, timeout: float = 60) -> float:
+    """start the service, return the time in seconds to the first response
+    of GET /version"""
+    port = get_free_port()
+    env = dict(os.environ, DATAFACTORY_WARM_UP=warm_up)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.app:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/version", timeout=1)
+                if response.status_code == 200:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.005)
+        raise TimeoutError(f"Service not started after {timeout} s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print("Slowest imports of src.app")
+    for name, _, cumulative, depth in ImportService().get_import_report(
+        "src.app", args.top, max_depth=1
+    ):
+        print(f"{cumulative / 1000:>10.1f} ms  {'  ' * depth}{name}")
+
+    print(f"\nTime to the first GET /version ({args.runs} runs)")
+    for warm_up in ["none", "startup"]:
+        durations = [measure_startup(warm_up) for _ in range(args.runs)]
+        print(
+            f"DATAFACTORY_WARM_UP={warm_up:<8} median {statistics.median(durations) * 1000:>8.0f} ms "
+            f"min {min(durations) * 1000:>8.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,46 @@
 import os
-from datetime import datetime
+import signal
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
 
-from fastapi import APIRouter, Body, FastAPI
+from fastapi import APIRouter, Body, FastAPI, Header, HTTPException
 from fastapi.params import Depends
+from pydantic import ValidationError
+from src.backend_router_service import BackendRouterService
 from src.configuration_service import ConfigurationService
+from src.credential_service import CredentialService
 from src.factory_service import FactoryService
+from src.import_service import ImportService
+from src.leader_election_service import LeaderElectionService
+from src.local_factory_service import LocalFactoryService
 from src.log_service import LogService
-from src.models import PipelineRequest, PipelineResponse, RunResponse
+from src.models import (
+    Backend,
+    ConfigurationReport,
+    CredentialMetrics,
+    GarbageCollectionReport,
+    GarbageCollectionRequest,
+    PipelineRequest,
+    PipelineResponse,
+    RebalanceReport,
+    RebalanceRequest,
+    RunRequest,
+    RunResponse,
+    TransportMetrics,
+)
+from src.response_service import (
+    CompressionMiddleware,
+    FactoryJSONResponse,
+    get_response,
+    http_exception_handler,
+)
+from src.routing_factory_service import RoutingFactoryService
+from src.run_poller_service import RunPollerService
+from src.shard_service import ShardService
+from src.sharded_factory_service import ShardedFactoryService
+from src.transport_service import TransportService
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.requests import Request
 
 router = APIRouter(prefix="")
@@ -17,6 +51,7 @@ app = FastAPI(
     title="factory REST API",
     description="Sample factory REST API.",
     version=app_version,
+    default_response_class=FactoryJSONResponse,
 )
 
 
@@ -25,14 +60,82 @@ def get_log_service() -> LogService:
     return LogService()
 
 
+def get_local_factory_service() -> LocalFactoryService:
+    """Getting a single instance of the LocalFactoryService"""
+    configuration = get_configuration_service()
+    return LocalFactoryService(
+        root=configuration.get_local_root(),
+        resource_group_name=configuration.get_datafactory_resource_group_name(),
+        engine=configuration.get_local_engine(),
+        batch_size=configuration.get_local_batch_size(),
+        memory_limit=configuration.get_local_memory_limit(),
+        spill_folder=configuration.get_local_spill_folder() or None,
+        scan_threads=configuration.get_local_scan_threads(),
+        workers=configuration.get_local_workers(),
+    )
+
+
+def get_backend_router_service() -> BackendRouterService:
+    """Getting a single instance of the BackendRouterService"""
+    configuration = get_configuration_service()
+    return BackendRouterService(
+        defaults={
+            Backend.LOCAL: (
+                configuration.get_router_local_startup(),
+                configuration.get_router_local_throughput(),
+            ),
+            Backend.DATA_FACTORY: (
+                configuration.get_router_datafactory_startup(),
+                configuration.get_router_datafactory_throughput(),
+            ),
+        }
+    )
+
+
+def get_datafactory_service(
+    configuration: ConfigurationService, resource_group_name: str, datafactory_name: str
+) -> FactoryService:
+    """Getting an instance of the FactoryService of a data factory"""
+    if configuration.get_execution_backend() == Backend.AUTO:
+        return RoutingFactoryService(
+            subscription_id=configuration.get_subscription_id(),
+            resource_group_name=resource_group_name,
+            datafactory_name=datafactory_name,
+            source_linked_service=configuration.get_datafactory_source_linked_service(),
+            sink_linked_service=configuration.get_datafactory_sink_linked_service(),
+            local_factory_service=get_local_factory_service(),
+            router=get_backend_router_service(),
+        )
+    return FactoryService(
+        subscription_id=configuration.get_subscription_id(),
+        resource_group_name=resource_group_name,
+        datafactory_name=datafactory_name,
+        source_linked_service=configuration.get_datafactory_source_linked_service(),
+        sink_linked_service=configuration.get_datafactory_sink_linked_service(),
+    )
+
+
 def get_factory_service() -> FactoryService:
     """Getting a single instance of the FactoryService"""
-    return FactoryService(
-        subscription_id=get_configuration_service().get_subscription_id(),
-        resource_group_name=get_configuration_service().get_datafactory_resource_group_name(),
-        datafactory_name=get_configuration_service().get_datafactory_account_name(),
-        source_linked_service=get_configuration_service().get_datafactory_source_linked_service(),
-        sink_linked_service=get_configuration_service().get_datafactory_sink_linked_service(),
+    configuration = get_configuration_service()
+    backend = configuration.get_execution_backend()
+    if backend == Backend.LOCAL:
+        return get_local_factory_service()
+    shards = configuration.get_shards()
+    drain = configuration.get_shard_drain()
+    if len(shards) > 1 or (shards and drain):
+        return ShardedFactoryService(
+            ring=ShardService(shards, vnodes=configuration.get_shard_vnodes()),
+            create_factory_service=lambda shard: get_datafactory_service(
+                configuration, *shard.split("/")
+            ),
+            concurrency=configuration.get_gc_concurrency(),
+            drain=drain,
+        )
+    return get_datafactory_service(
+        configuration,
+        configuration.get_datafactory_resource_group_name(),
+        configuration.get_datafactory_account_name(),
     )
 
 
@@ -86,7 +189,7 @@ def pipeline(
     request: Request,
     body: PipelineRequest = Body(...),
     factory_service: FactoryService = Depends(get_factory_service),
-) -> PipelineResponse:
+) -> FactoryJSONResponse:
     """Create pipeline using POST /pipeline BODY: PipelineRequest \
 RESPONSE: PipelineResponse"""
     get_log_service().log_information(f"HTTP REQUEST POST /pipeline BODY: {body}")
@@ -94,7 +197,7 @@ RESPONSE: PipelineResponse"""
     get_log_service().log_information(
         f"HTTP REQUEST POST /pipeline BODY: {body} RESPONSE: {pipelineresponse}"
     )
-    return pipelineresponse
+    return get_response(pipelineresponse)
 
 
 @router.get(
@@ -112,7 +215,7 @@ def pipeline_status(
     request: Request,
     pipeline_name: str,
     factory_service: FactoryService = Depends(get_factory_service),
-) -> PipelineResponse:
+) -> FactoryJSONResponse:
     """Get factory status using GET /pipeline/{pipeline_name} RESPONSE PipelineResponse"""
     get_log_service().log_information(
         f"HTTP REQUEST GET /pipeline PARAMS: {pipeline_name}"
@@ -124,7 +227,7 @@ def pipeline_status(
         f"HTTP REQUEST GET /pipeline PARAMS: {pipeline_name}\
 ... RESPONSE: {pipelineresponse}"
     )
-    return pipelineresponse
+    return get_response(pipelineresponse)
 
 
 @router.post(
@@ -141,18 +244,24 @@ def pipeline_status(
 def run(
     request: Request,
     pipeline_name: str,
+    body: RunRequest = Body(None),
+    idempotency_key: Optional[str] = Header(None),
     factory_service: FactoryService = Depends(get_factory_service),
-) -> RunResponse:
+) -> FactoryJSONResponse:
     """Launch pipeline run using POST /pipeline BODY: RunRequest \
 RESPONSE: RunResponse"""
     get_log_service().log_information(
         f"HTTP REQUEST POST /pipeline/{pipeline_name}/run parameter: {pipeline_name}"
     )
-    runresponse = factory_service.run(pipeline_name)
+    if body is None:
+        body = RunRequest()
+    if not body.idempotency_key and idempotency_key:
+        body.idempotency_key = idempotency_key
+    runresponse = factory_service.run(pipeline_name, body)
     get_log_service().log_information(
         f"HTTP REQUEST POST /pipeline/{pipeline_name}/run parameter: {pipeline_name} RESPONSE: {runresponse}"
     )
-    return runresponse
+    return get_response(runresponse)
 
 
 @router.get(
@@ -171,7 +280,7 @@ def pipeline_run_status(
     pipeline_name: str,
     run_id: str,
     factory_service: FactoryService = Depends(get_factory_service),
-) -> RunResponse:
+) -> FactoryJSONResponse:
     """Get factory status using GET /pipeline/{pipeline_name}/run/{run_id} RESPONSE RunResponse"""
     get_log_service().log_information(
         f"HTTP REQUEST GET /pipeline/{pipeline_name}/run/{run_id} PARAMS: {pipeline_name} and {run_id}"
@@ -181,7 +290,372 @@ def pipeline_run_status(
         f"HTTP REQUEST GET /pipeline /pipeline/{pipeline_name}/run/{run_id} PARAMS: {pipeline_name} and {run_id}\
 ... RESPONSE: {runresponse}"
     )
-    return runresponse
+    return get_response(runresponse)
+
+
+@router.post(
+    "/admin/gc",
+    responses={
+        200: {
+            "description": "return the garbage collection report\
+ (GarbageCollectionReport) with params: {GarbageCollectionRequest}"
+        },
+    },
+    summary="Delete the stale pipelines with Body: {GarbageCollectionRequest}",
+    response_model=GarbageCollectionReport,
+)
+def collect_garbage(
+    request: Request,
+    body: GarbageCollectionRequest = Body(None),
+    factory_service: FactoryService = Depends(get_factory_service),
+) -> FactoryJSONResponse:
+    """Delete the pipelines not run within the retention window using
+    POST /admin/gc BODY: GarbageCollectionRequest RESPONSE: GarbageCollectionReport"""
+    if body is None:
+        body = GarbageCollectionRequest()
+    get_log_service().log_information(f"HTTP REQUEST POST /admin/gc BODY: {body}")
+    report = factory_service.collect_garbage(body)
+    get_log_service().log_information(
+        f"HTTP REQUEST POST /admin/gc BODY: {body} RESPONSE: {report}"
+    )
+    return get_response(report)
+
+
+@router.post(
+    "/admin/rebalance",
+    responses={
+        200: {
+            "description": "return the rebalance report\
+ (RebalanceReport) with params: {RebalanceRequest}"
+        },
+        400: {"description": "Single factory"},
+    },
+    summary="Move the pipelines to the factory owning them with Body: {RebalanceRequest}",
+    response_model=RebalanceReport,
+)
+def rebalance(
+    request: Request,
+    body: RebalanceRequest = Body(None),
+    factory_service: FactoryService = Depends(get_factory_service),
+) -> FactoryJSONResponse:
+    """Move the pipelines placed on a factory not owning them using
+    POST /admin/rebalance BODY: RebalanceRequest RESPONSE: RebalanceReport"""
+    if body is None:
+        body = RebalanceRequest()
+    get_log_service().log_information(
+        f"HTTP REQUEST POST /admin/rebalance BODY: {body}"
+    )
+    report = factory_service.rebalance(body)
+    get_log_service().log_information(
+        f"HTTP REQUEST POST /admin/rebalance BODY: {body} RESPONSE: {report}"
+    )
+    return get_response(report)
 
 
+@router.get(
+    "/admin/credential",
+    responses={
+        200: {
+            "description": "return the metrics of the cached tokens\
+ (List[CredentialMetrics])"
+        },
+    },
+    summary="Get the age and the refresh latency of the cached tokens",
+    response_model=List[CredentialMetrics],
+)
+def credential_metrics(
+    request: Request,
+) -> FactoryJSONResponse:
+    """Get the metrics of the tokens of the credential using
+    GET /admin/credential RESPONSE: List[CredentialMetrics]"""
+    return get_response(CredentialService().get_metrics())
+
+
+@router.get(
+    "/admin/transport",
+    responses={
+        200: {
+            "description": "return the metrics of the connection pools\
+ (List[TransportMetrics])"
+        },
+    },
+    summary="Get the connections created and reused by the SDK clients",
+    response_model=List[TransportMetrics],
+)
+def transport_metrics(
+    request: Request,
+) -> FactoryJSONResponse:
+    """Get the metrics of the connection pools of the SDK clients using
+    GET /admin/transport RESPONSE: List[TransportMetrics]"""
+    return get_response(TransportService().get_metrics())
+
+
+# stop events of the background tasks: a new event for each start
+background_tasks: Dict[str, threading.Event] = {}
+
+
+def start_background_task(name: str, target: Callable[[threading.Event], None]):
+    """start the task in a thread, the task ends when its event is set"""
+    stop_background_task(name)
+    stop = threading.Event()
+    background_tasks[name] = stop
+    threading.Thread(target=target, args=(stop,), daemon=True).start()
+
+
+def stop_background_task(name: str):
+    stop = background_tasks.pop(name, None)
+    if stop is not None:
+        stop.set()
+
+
+def get_leader_election(name: str, ttl: float) -> LeaderElectionService:
+    """election of the worker running the background task among the workers
+    (and the replicas with a shared lease backend)"""
+    return LeaderElectionService(
+        LeaderElectionService.get_backend(
+            get_configuration_service().get_leader_backend(),
+            get_configuration_service().get_leader_url(),
+        ),
+        name=name,
+        ttl=ttl,
+    )
+
+
+def acquire_lease(election: LeaderElectionService, task: str) -> bool:
+    """acquire or renew the lease of the task, return True if the worker is
+    the leader"""
+    leader = election.leader
+    if not election.acquire():
+        if leader:
+            get_log_service().log_information(f"{task}: lease lost by {election.owner}")
+        return False
+    if not leader:
+        get_log_service().log_information(f"{task}: lease acquired by {election.owner}")
+    return True
+
+
+def release_lease(election: LeaderElectionService, task: str):
+    try:
+        election.release()
+    except Exception as ex:
+        get_log_service().log_error(f"EXCEPTION in {task.lower()} release: {ex}")
+
+
+def run_garbage_collection(stop: threading.Event):
+    """scheduled garbage collection of the stale pipelines: only the worker
+    holding the lease collects the pipelines of the factory"""
+    interval = get_configuration_service().get_gc_interval()
+    # the lease outlives the interval between two collections
+    election = get_leader_election(
+        "garbage-collection",
+        ttl=max(get_configuration_service().get_leader_ttl(), 2 * interval),
+    )
+    try:
+        while not stop.wait(interval):
+            try:
+                if not acquire_lease(election, "GARBAGE COLLECTION"):
+                    continue
+                report = get_factory_service().collect_garbage(
+                    GarbageCollectionRequest(
+                        dry_run=get_configuration_service().get_gc_dry_run()
+                    )
+                )
+                get_log_service().log_information(f"GARBAGE COLLECTION: {report}")
+            except Exception as ex:
+                get_log_service().log_error(f"EXCEPTION in garbage collection: {ex}")
+    finally:
+        release_lease(election, "GARBAGE COLLECTION")
+
+
+@app.on_event("startup")
+def start_garbage_collection():
+    if get_configuration_service().get_gc_interval() > 0:
+        start_background_task("garbage-collection", run_garbage_collection)
+
+
+@app.on_event("shutdown")
+def stop_garbage_collection():
+    stop_background_task("garbage-collection")
+
+
+def poll_runs(stop: threading.Event):
+    """poll the status of the runs for all the workers: only the worker
+    holding the lease polls Data Factory"""
+    interval = get_configuration_service().get_run_poll_interval()
+    # the lease outlives the interval between two renewals
+    ttl = max(get_configuration_service().get_leader_ttl(), 2 * interval)
+    election = get_leader_election("run-poller", ttl=ttl)
+    poller = RunPollerService(
+        window=timedelta(hours=get_configuration_service().get_run_poll_window()),
+        interval=interval,
+        pipeline_prefix=FactoryService.PIPELINE_PREFIX,
+    )
+    try:
+        while not stop.wait(interval):
+            try:
+                if not acquire_lease(election, "RUN POLLER"):
+                    continue
+                run_responses = get_factory_service().poll_runs(poller, ttl)
+                get_log_service().log_debug(
+                    f"RUN POLLER: {len(run_responses)} runs published"
+                )
+            except Exception as ex:
+                get_log_service().log_error(f"EXCEPTION in run poller: {ex}")
+    finally:
+        release_lease(election, "RUN POLLER")
+
+
+def get_run_poller_error() -> Optional[str]:
+    """return why the runs polled by the leader would not be read by all the
+    workers, None if the run poller can start"""
+    cache_backend = get_configuration_service().get_cache_backend()
+    if cache_backend in ["none", "memory"]:
+        return (
+            f"cache backend {cache_backend} not shared by the workers"
+            " (DATAFACTORY_CACHE_BACKEND sqlite or redis required)"
+        )
+    leader_backend = get_configuration_service().get_leader_backend()
+    if cache_backend == "redis" and leader_backend != "redis":
+        # a leader per node would poll the factory for each replica
+        return (
+            f"lease backend {leader_backend} not shared by the replicas of the"
+            " redis cache (DATAFACTORY_LEADER_BACKEND redis required)"
+        )
+    return None
+
+
+@app.on_event("startup")
+def start_run_poller():
+    if get_configuration_service().get_run_poll_interval() > 0:
+        error = get_run_poller_error()
+        if error is not None:
+            get_log_service().log_error(f"RUN POLLER not started: {error}")
+            return
+        start_background_task("run-poller", poll_runs)
+
+
+@app.on_event("shutdown")
+def stop_run_poller():
+    stop_background_task("run-poller")
+
+
+def reload_configuration() -> ConfigurationReport:
+    """replace the snapshot of the settings: the next requests create their
+    clients with the new settings (the shared HTTP session is created again
+    if its pool settings changed), the background tasks using a changed
+    setting are restarted"""
+    report = ConfigurationService.reload()
+    changed = set(report.changed)
+    if changed & {
+        "DATAFACTORY_GC_INTERVAL",
+        "DATAFACTORY_CACHE_BACKEND",
+        "DATAFACTORY_CACHE_URL",
+        "DATAFACTORY_LEADER_BACKEND",
+        "DATAFACTORY_LEADER_URL",
+        "DATAFACTORY_LEADER_TTL",
+    }:
+        stop_garbage_collection()
+        start_garbage_collection()
+    if changed & {
+        "DATAFACTORY_RUN_POLL_INTERVAL",
+        "DATAFACTORY_RUN_POLL_WINDOW",
+        "DATAFACTORY_CACHE_BACKEND",
+        "DATAFACTORY_CACHE_URL",
+        "DATAFACTORY_LEADER_BACKEND",
+        "DATAFACTORY_LEADER_URL",
+        "DATAFACTORY_LEADER_TTL",
+    }:
+        stop_run_poller()
+        start_run_poller()
+    get_log_service().log_information(f"CONFIGURATION RELOAD: {report}")
+    return report
+
+
+@router.post(
+    "/admin/config/reload",
+    responses={
+        200: {"description": "return the reload report (ConfigurationReport)"},
+        400: {
+            "description": "Invalid settings or settings file not read, the settings are not changed"
+        },
+    },
+    summary="Reload the settings from the settings file and the environment variables",
+    response_model=ConfigurationReport,
+)
+def reload_settings(
+    request: Request,
+) -> FactoryJSONResponse:
+    """Reload the settings of the worker serving the request (not of the
+    other workers) using POST /admin/config/reload RESPONSE: ConfigurationReport"""
+    get_log_service().log_information("HTTP REQUEST POST /admin/config/reload")
+    try:
+        report = reload_configuration()
+    except ValidationError as ex:
+        raise HTTPException(status_code=400, detail=f"Invalid settings: {ex}")
+    except OSError as ex:
+        raise HTTPException(status_code=400, detail=f"Settings file error: {ex}")
+    return get_response(report)
+
+
+def handle_reload_signal(signum, frame):
+    """reload the settings on SIGHUP, in a thread: the signal handler may
+    interrupt a thread reading the settings"""
+
+    def reload():
+        try:
+            reload_configuration()
+        except Exception as ex:
+            get_log_service().log_error(f"EXCEPTION in configuration reload: {ex}")
+
+    threading.Thread(target=reload, daemon=True).start()
+
+
+@app.on_event("startup")
+def register_reload_signal():
+    # signal handlers are registered by the main thread only
+    if (
+        hasattr(signal, "SIGHUP")
+        and threading.current_thread() is threading.main_thread()
+    ):
+        signal.signal(signal.SIGHUP, handle_reload_signal)
+
+
+@app.on_event("startup")
+def prefetch_token():
+    """acquire the token of the Data Factory clients before the first
+    request, then refreshed in the background"""
+    if (
+        get_configuration_service().get_credential_prefetch()
+        and get_configuration_service().get_execution_backend() != Backend.LOCAL
+    ):
+        CredentialService(
+            refresh_margin=get_configuration_service().get_credential_refresh_margin(),
+            retry_interval=get_configuration_service().get_credential_retry_interval(),
+        ).prefetch()
+
+
+@app.on_event("startup")
+def warm_up():
+    """import the SDK modules loaded on first use: before serving the
+    requests (startup) or while serving the first requests (background)"""
+    mode = get_configuration_service().get_warm_up()
+    if mode == "startup":
+        durations = ImportService().warm_up()
+        get_log_service().log_information(
+            "Warm-up: "
+            + ", ".join(
+                f"{name} {duration * 1000:.0f} ms"
+                for name, duration in durations.items()
+            )
+        )
+    elif mode == "background":
+        ImportService().start_warm_up()
+
+
+app.add_exception_handler(StarletteHTTPException, http_exception_handler)
+if get_configuration_service().get_compression():
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=get_configuration_service().get_compression_minimum_size(),
+    )
 app.include_router(router, prefix="")
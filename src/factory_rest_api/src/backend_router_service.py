@@ -0,0 +1,225 @@
+import fnmatch
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from src.import_service import ImportService
+from src.local_engine_service import get_local_file
+from src.models import Backend, Dataset, RoutingDecision
+
+# imported on first use (see ImportService)
+identity = ImportService.lazy_import("azure.identity")
+blob = ImportService.lazy_import("azure.storage.blob")
+
+
+class BackendModel(BaseModel):
+    """duration of a run = startup + input_size / throughput"""
+
+    backend: Backend
+    # start-up latency in seconds
+    startup: float
+    # bytes per second
+    throughput: float
+    # number of completed runs used to learn the model
+    samples: int = 0
+
+
+class Observations(BaseModel):
+    """sums (with exponential decay) of the sizes and durations of the
+    completed runs, used for the least squares fit of the model"""
+
+    weight: float = 0.0
+    size: float = 0.0
+    duration: float = 0.0
+    size_size: float = 0.0
+    size_duration: float = 0.0
+    samples: int = 0
+
+
+class RoutedRun(BaseModel):
+    backend: Backend
+    input_size: int
+    # time.monotonic() of the registration
+    registered: float = 0.0
+
+
+class BackendRouterService:
+    """Class used to choose the backend of each run
+
+    The start-up latency and the throughput of each backend are learned from
+    the durations of the completed runs. The tables are shared by all the
+    instances of the class as a new FactoryService is created for each HTTP
+    request.
+    """
+
+    _lock = threading.RLock()
+    _observations: Dict[Backend, Observations] = {}
+    _runs: Dict[str, RoutedRun] = {}
+
+    def __init__(
+        self,
+        defaults: Dict[Backend, Tuple[float, float]],
+        decay: float = 0.9,
+        max_runs: int = 10000,
+        run_ttl: float = 86400,
+    ) -> None:
+        # default (startup, throughput) of each backend before the first runs
+        self.defaults = defaults
+        # weight of the previous runs when a run completes
+        self.decay = decay
+        # runs kept until their completion: the status of a run may be
+        # served by another worker, the run is dropped after run_ttl seconds
+        # or when more than max_runs runs are registered
+        self.max_runs = max_runs
+        self.run_ttl = run_ttl
+
+    def get_model(self, backend: Backend) -> BackendModel:
+        """return the model of the backend fitted on the completed runs"""
+        startup, throughput = self.defaults[backend]
+        with BackendRouterService._lock:
+            observations = BackendRouterService._observations.get(backend)
+            if observations is None or observations.weight <= 0:
+                return BackendModel(
+                    backend=backend, startup=startup, throughput=throughput
+                )
+            observations = observations.copy()
+        mean_size = observations.size / observations.weight
+        mean_duration = observations.duration / observations.weight
+        variance = observations.size_size / observations.weight - mean_size**2
+        covariance = (
+            observations.size_duration / observations.weight - mean_size * mean_duration
+        )
+        if observations.samples >= 2 and variance > 0 and covariance > 0:
+            # linear regression duration = startup + size / throughput
+            slope = covariance / variance
+            throughput = 1 / slope
+            startup = max(mean_duration - slope * mean_size, 0.0)
+        else:
+            # not enough different sizes: keep the default throughput
+            startup = max(mean_duration - mean_size / throughput, 0.0)
+        return BackendModel(
+            backend=backend,
+            startup=startup,
+            throughput=throughput,
+            samples=observations.samples,
+        )
+
+    def estimate(self, backend: Backend, input_size: int) -> float:
+        """return the estimated duration of a run in seconds"""
+        model = self.get_model(backend)
+        return model.startup + input_size / model.throughput
+
+    def choose(
+        self, input_size: Optional[int], local_available: bool, reason: str = ""
+    ) -> RoutingDecision:
+        """return the backend with the lowest estimated duration,
+        Data Factory if the local backend can't run the pipeline"""
+        size = 0 if input_size is None else input_size
+        # the decisions are built without validation (values computed here)
+        estimated_durations = {
+            Backend.DATA_FACTORY: int(self.estimate(Backend.DATA_FACTORY, size) * 1000)
+        }
+        if not local_available:
+            return RoutingDecision.construct(
+                backend=Backend.DATA_FACTORY,
+                input_size=size,
+                estimated_durations=estimated_durations,
+                reason=reason or "Pipeline not available on the local backend",
+            )
+        estimated_durations[Backend.LOCAL] = int(
+            self.estimate(Backend.LOCAL, size) * 1000
+        )
+        backend = min(estimated_durations, key=estimated_durations.get)
+        return RoutingDecision.construct(
+            backend=backend,
+            input_size=size,
+            estimated_durations=estimated_durations,
+            reason=f"Lowest estimated duration: {estimated_durations[backend]} ms",
+        )
+
+    def register_run(self, run_id: str, decision: RoutingDecision):
+        """keep the input size of the run until its completion"""
+        now = time.monotonic()
+        with BackendRouterService._lock:
+            BackendRouterService._runs.pop(run_id, None)
+            BackendRouterService._runs[run_id] = RoutedRun(
+                backend=decision.backend,
+                input_size=decision.input_size,
+                registered=now,
+            )
+            self.purge(now)
+
+    def purge(self, now: float):
+        """drop the oldest runs (first registered) expired or above max_runs"""
+        runs = BackendRouterService._runs
+        while runs:
+            run_id, run = next(iter(runs.items()))
+            if len(runs) <= self.max_runs and now - run.registered < self.run_ttl:
+                break
+            del runs[run_id]
+
+    def get_run(self, run_id: str) -> Optional[RoutedRun]:
+        with BackendRouterService._lock:
+            return BackendRouterService._runs.get(run_id)
+
+    def observe(self, run_id: str, duration_in_ms: int) -> Optional[BackendModel]:
+        """learn from the duration of a completed run (once per run)"""
+        with BackendRouterService._lock:
+            run = BackendRouterService._runs.pop(run_id, None)
+            if run is None:
+                return None
+            observations = BackendRouterService._observations.setdefault(
+                run.backend, Observations()
+            )
+            size = float(run.input_size)
+            duration = duration_in_ms / 1000
+            observations.weight = observations.weight * self.decay + 1
+            observations.size = observations.size * self.decay + size
+            observations.duration = observations.duration * self.decay + duration
+            observations.size_size = observations.size_size * self.decay + size * size
+            observations.size_duration = (
+                observations.size_duration * self.decay + size * duration
+            )
+            observations.samples += 1
+        return self.get_model(run.backend)
+
+    def forget(self, run_id: str):
+        """drop a run completed without a duration to learn (failed run)"""
+        with BackendRouterService._lock:
+            BackendRouterService._runs.pop(run_id, None)
+
+    def clear(self):
+        with BackendRouterService._lock:
+            BackendRouterService._observations.clear()
+            BackendRouterService._runs.clear()
+
+
+def get_local_dataset_size(root: str, dataset: Dataset) -> Optional[int]:
+    """return the size of the local file of the dataset as read by the local
+    engine, None if the file is not found (file patterns not supported)"""
+    path = get_local_file(root, dataset)
+    return None if path is None else os.path.getsize(path)
+
+
+def get_blob_dataset_size(dataset: Dataset) -> Optional[int]:  # pragma: no cover
+    """return the size of the blobs of the dataset read from the blob
+    properties, None if the blobs can't be listed"""
+    try:
+        blob_service_client = blob.BlobServiceClient(
+            account_url=f"https://{dataset.storage_account_name}.blob.core.windows.net/",
+            credential=identity.DefaultAzureCredential(),
+        )
+        container_client = blob_service_client.get_container_client(
+            dataset.container_name
+        )
+        prefix = f"{dataset.folder_path}/" if dataset.folder_path else ""
+        sizes = [
+            blob.size
+            for blob in container_client.list_blobs(name_starts_with=prefix)
+            if fnmatch.fnmatch(blob.name[len(prefix):], dataset.file_pattern_or_name)
+        ]
+        return sum(sizes) if sizes else None
+    except Exception:
+        return None
@@ -0,0 +1,400 @@
+import os
+import queue
+import socket
+import sqlite3
+import ssl
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Type, TypeVar
+from urllib.parse import unquote, urlparse
+
+import orjson
+from pydantic import BaseModel
+from src.log_service import LogService
+from src.models import PipelineResponse, RunResponse, Status
+from src.response_service import dumps
+
+Model = TypeVar("Model", bound=BaseModel)
+
+MEMORY_BACKEND = "memory"
+SQLITE_BACKEND = "sqlite"
+REDIS_BACKEND = "redis"
+
+
+class CacheBackend:
+    """Interface of the cache backends: bytes values with a time to live in
+    seconds, the keys are strings"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, keys: List[str]):
+        raise NotImplementedError
+
+    def clear(self, prefix: str = ""):
+        """delete the keys starting with prefix"""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Cache of the process (LRU), each worker has its own entries"""
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # key: (expiration time, value)
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys: List[str]):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self, prefix: str = ""):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache shared by the workers of the node in a SQLite database (in
+    /dev/shm by default: shared memory)"""
+
+    # the expired entries are deleted every PURGE_INTERVAL writes
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+        with self.get_connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expiration REAL NOT NULL)"
+            )
+
+    def get_connection(self) -> sqlite3.Connection:
+        """return the connection of the thread"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = (
+            self.get_connection()
+            .execute(
+                "SELECT value FROM cache WHERE key = ? AND expiration > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return None if row is None else bytes(row[0])
+
+    def set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        with self.get_connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expiration) VALUES (?, ?, ?)",
+                (key, value, now + ttl),
+            )
+            self.writes += 1
+            if self.writes % SQLiteCacheBackend.PURGE_INTERVAL == 0:
+                connection.execute("DELETE FROM cache WHERE expiration <= ?", (now,))
+
+    def delete(self, keys: List[str]):
+        with self.get_connection() as connection:
+            connection.executemany(
+                "DELETE FROM cache WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def clear(self, prefix: str = ""):
+        with self.get_connection() as connection:
+            connection.execute(
+                "DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """Connection speaking the Redis protocol (RESP2)"""
+
+    def __init__(self, host: str, port: int, timeout: float, tls: bool) -> None:
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if tls:
+            self.socket = ssl.create_default_context().wrap_socket(
+                self.socket, server_hostname=host
+            )
+        self.file = self.socket.makefile("rb")
+
+    def execute(self, *arguments):
+        command = [b"*%d\r\n" % len(arguments)]
+        for argument in arguments:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode()
+            command.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+        self.socket.sendall(b"".join(command))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the Redis server")
+        prefix, value = line[:1], line[1:-2]
+        if prefix == b"+":
+            return value.decode()
+        if prefix == b"-":
+            raise RedisError(value.decode())
+        if prefix == b":":
+            return int(value)
+        if prefix == b"$":
+            length = int(value)
+            if length < 0:
+                return None
+            data = self.file.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(value)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def close(self):
+        try:
+            self.file.close()
+            self.socket.close()
+        except OSError:  # pragma: no cover
+            pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared by the replicas in a Redis server (or any server speaking
+    the Redis protocol: Azure Cache for Redis, KeyDB...)
+
+    url: redis://[:password@]host[:port][/db] or rediss:// (TLS, port 6380
+    by default as Azure Cache for Redis)
+    """
+
+    def __init__(self, url: str, pool_size: int = 8, timeout: float = 2.0) -> None:
+        parsed = urlparse(url)
+        if parsed.scheme not in ["redis", "rediss"]:
+            raise ValueError(f"Redis URL not supported: {url}")
+        self.tls = parsed.scheme == "rediss"
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or (6380 if self.tls else 6379)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        # idle connections
+        self.pool: queue.LifoQueue = queue.LifoQueue(maxsize=pool_size)
+
+    def connect(self) -> RedisConnection:
+        connection = RedisConnection(self.host, self.port, self.timeout, self.tls)
+        if self.password:
+            connection.execute("AUTH", self.password)
+        if self.db:
+            connection.execute("SELECT", self.db)
+        return connection
+
+    def execute(self, *arguments):
+        """execute the command on an idle connection of the pool"""
+        try:
+            connection = self.pool.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+        try:
+            reply = connection.execute(*arguments)
+        except RedisError:
+            self.release(connection)
+            raise
+        except Exception:
+            connection.close()
+            raise
+        self.release(connection)
+        return reply
+
+    def release(self, connection: RedisConnection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.execute("SET", key, value, "PX", max(int(ttl * 1000), 1))
+
+    def delete(self, keys: List[str]):
+        if keys:
+            self.execute("DEL", *keys)
+
+    def clear(self, prefix: str = ""):
+        pattern = "".join(f"\\{c}" if c in "*?[]\\" else c for c in prefix) + "*"
+        cursor = b"0"
+        while True:
+            cursor, keys = self.execute("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            self.delete(keys)
+            if cursor == b"0":
+                return
+
+
+class CacheService:
+    """Class used to cache the lookups of FactoryService (pipeline and
+    completed run status) in a backend shared or not by the workers
+
+    The backends are created once per process and shared by all the
+    instances of the class as a new FactoryService is created for each
+    HTTP request. The errors of the backend are logged and handled as cache
+    misses: the cache never fails a request.
+    """
+
+    # changed when the cached models change (entries of former versions ignored)
+    VERSION = 1
+
+    _lock = threading.Lock()
+    _backends: Dict[Tuple[str, str], CacheBackend] = {}
+
+    def __init__(self, backend: CacheBackend, namespace: str, ttl: float) -> None:
+        self.backend = backend
+        self.prefix = f"factory_rest_api:{CacheService.VERSION}:{namespace}:"
+        self.ttl = ttl
+
+    @staticmethod
+    def get_backend(kind: str, url: str = "", max_entries: int = 10000) -> CacheBackend:
+        """return the backend of the process for the kind (memory, sqlite or
+        redis) and the url (path of the SQLite database or Redis URL)"""
+        with CacheService._lock:
+            backend = CacheService._backends.get((kind, url))
+            if backend is None:
+                if kind == MEMORY_BACKEND:
+                    backend = MemoryCacheBackend(max_entries)
+                elif kind == SQLITE_BACKEND:
+                    backend = SQLiteCacheBackend(url or get_default_sqlite_path())
+                elif kind == REDIS_BACKEND:
+                    backend = RedisCacheBackend(url or "redis://localhost:6379/0")
+                else:
+                    raise ValueError(f"Cache backend {kind} not supported")
+                CacheService._backends[(kind, url)] = backend
+            return backend
+
+    def get_pipeline_key(self, pipeline_name: str) -> str:
+        return f"{self.prefix}pipeline:{pipeline_name}"
+
+    def get_run_key(self, pipeline_name: str, run_id: str) -> str:
+        return f"{self.prefix}run:{pipeline_name}:{run_id}"
+
+    def get_model(self, key: str, model: Type[Model]) -> Optional[Model]:
+        """return the cached model, validated: the entry may have been written
+        by another version of the service"""
+        try:
+            data = self.backend.get(key)
+            if data is None:
+                return None
+            return model.parse_obj(orjson.loads(data))
+        except Exception as ex:
+            LogService().log_error(f"EXCEPTION in cache get {key}: {ex}")
+            return None
+
+    def set_model(self, key: str, model: BaseModel):
+        try:
+            self.backend.set(key, dumps(model), self.ttl)
+        except Exception as ex:
+            LogService().log_error(f"EXCEPTION in cache set {key}: {ex}")
+
+    def get_pipeline(self, pipeline_name: str) -> Optional[PipelineResponse]:
+        return self.get_model(self.get_pipeline_key(pipeline_name), PipelineResponse)
+
+    def set_pipeline(self, pipeline_response: PipelineResponse):
+        if pipeline_response.error.code != 0:
+            return
+        self.set_model(
+            self.get_pipeline_key(pipeline_response.pipeline_name), pipeline_response
+        )
+
+    def invalidate_pipelines(self, pipeline_names: List[str]):
+        """remove the pipelines re-created or deleted, the status of their
+        completed runs is still valid"""
+        keys = [
+            self.get_pipeline_key(pipeline_name) for pipeline_name in pipeline_names
+        ]
+        try:
+            self.backend.delete(keys)
+        except Exception as ex:
+            LogService().log_error(f"EXCEPTION in cache delete {keys}: {ex}")
+
+    def get_run(self, pipeline_name: str, run_id: str) -> Optional[RunResponse]:
+        return self.get_model(self.get_run_key(pipeline_name, run_id), RunResponse)
+
+    def set_run(self, run_response: RunResponse):
+        """cache the status of a completed run (no more updated)"""
+        if run_response.error.code != 0 or run_response.status.status not in [
+            Status.SUCCEEDED,
+            Status.FAILED,
+        ]:
+            return
+        self.set_model(
+            self.get_run_key(run_response.pipeline_name, run_response.run_id),
+            run_response,
+        )
+
+    def publish_run(self, run_response: RunResponse, ttl: float):
+        """cache the status of a run polled by the leader (see
+        RunPollerService), the status of an active run expires after ttl
+        seconds if it's no more refreshed"""
+        if run_response.error.code != 0:
+            return
+        if run_response.status.status not in [Status.SUCCEEDED, Status.FAILED]:
+            ttl = min(ttl, self.ttl)
+        else:
+            ttl = self.ttl
+        try:
+            self.backend.set(
+                self.get_run_key(run_response.pipeline_name, run_response.run_id),
+                dumps(run_response),
+                ttl,
+            )
+        except Exception as ex:
+            LogService().log_error(
+                f"EXCEPTION in cache set {run_response.run_id}: {ex}"
+            )
+
+    def clear(self):
+        self.backend.clear(self.prefix)
+
+
+def get_default_sqlite_path(file_name: str = "factory_rest_api_cache.db") -> str:
+    """node-local path of a SQLite database: shared memory if available"""
+    folder = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(folder, file_name)
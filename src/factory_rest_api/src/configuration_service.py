@@ -1,8 +1,209 @@
 import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Literal, Mapping, Optional
+
+from pydantic import BaseModel, Extra, Field, validator
+from src.models import Backend, ConfigurationReport
+
+# settings read when the application starts: changed by a restart only
+STARTUP_SETTINGS = [
+    "APP_VERSION",
+    "PORT_HTTP",
+    "WEBSITES_HTTP",
+    "DATAFACTORY_COMPRESSION",
+    "DATAFACTORY_COMPRESSION_MINIMUM_SIZE",
+    "DATAFACTORY_WARM_UP",
+]
+
+# settings file read over the environment variables by each load: the
+# settings changed at runtime (a change of the App Service application
+# settings restarts the container)
+SETTINGS_FILE = "DATAFACTORY_SETTINGS_FILE"
+
+
+class Settings(BaseModel):
+    """Typed snapshot of the application settings read from the environment
+    variables (alias of the fields), validated when loaded and immutable"""
+
+    app_version: str = Field("1.0.0.0", alias="APP_VERSION")
+    http_port: int = Field(5000, alias="PORT_HTTP", gt=0)
+    websites_port: int = Field(5000, alias="WEBSITES_HTTP", gt=0)
+    datafactory_account_name: str = Field("", alias="DATAFACTORY_ACCOUNT_NAME")
+    datafactory_resource_group_name: str = Field(
+        "", alias="DATAFACTORY_RESOURCE_GROUP_NAME"
+    )
+    datafactory_source_linked_service: str = Field(
+        "", alias="DATAFACTORY_SOURCE_LINKED_SERVICE"
+    )
+    datafactory_sink_linked_service: str = Field(
+        "", alias="DATAFACTORY_SINK_LINKED_SERVICE"
+    )
+    subscription_id: str = Field("", alias="AZURE_SUBSCRIPTION_ID")
+    tenant_id: str = Field("", alias="AZURE_TENANT_ID")
+    run_dedupe: bool = Field(False, alias="DATAFACTORY_RUN_DEDUPE")
+    run_registry_ttl: int = Field(86400, alias="DATAFACTORY_RUN_REGISTRY_TTL", gt=0)
+    execution_backend: Backend = Field(
+        Backend.DATA_FACTORY, alias="DATAFACTORY_EXECUTION_BACKEND"
+    )
+    local_root: str = Field("/tmp/factory", alias="DATAFACTORY_LOCAL_ROOT")
+    local_engine: Literal["arrow", "csv"] = Field(
+        "arrow", alias="DATAFACTORY_LOCAL_ENGINE"
+    )
+    local_batch_size: int = Field(4194304, alias="DATAFACTORY_LOCAL_BATCH_SIZE", gt=0)
+    local_memory_limit: int = Field(
+        1073741824, alias="DATAFACTORY_LOCAL_MEMORY_LIMIT", ge=0
+    )
+    local_spill_folder: str = Field("", alias="DATAFACTORY_LOCAL_SPILL_FOLDER")
+    local_scan_threads: int = Field(0, alias="DATAFACTORY_LOCAL_SCAN_THREADS", ge=0)
+    local_workers: int = Field(1, alias="DATAFACTORY_LOCAL_WORKERS", gt=0)
+    router_local_startup: float = Field(
+        1, alias="DATAFACTORY_ROUTER_LOCAL_STARTUP", ge=0
+    )
+    router_local_throughput: float = Field(
+        50000000, alias="DATAFACTORY_ROUTER_LOCAL_THROUGHPUT", gt=0
+    )
+    router_datafactory_startup: float = Field(
+        300, alias="DATAFACTORY_ROUTER_DATAFACTORY_STARTUP", ge=0
+    )
+    router_datafactory_throughput: float = Field(
+        200000000, alias="DATAFACTORY_ROUTER_DATAFACTORY_THROUGHPUT", gt=0
+    )
+    preflight: bool = Field(False, alias="DATAFACTORY_PREFLIGHT")
+    preflight_size: int = Field(4096, alias="DATAFACTORY_PREFLIGHT_SIZE", gt=0)
+    gc_interval: int = Field(0, alias="DATAFACTORY_GC_INTERVAL", ge=0)
+    gc_retention_days: int = Field(30, alias="DATAFACTORY_GC_RETENTION_DAYS", gt=0)
+    gc_dry_run: bool = Field(True, alias="DATAFACTORY_GC_DRY_RUN")
+    gc_concurrency: int = Field(4, alias="DATAFACTORY_GC_CONCURRENCY", gt=0)
+    gc_rate_limit: float = Field(5, alias="DATAFACTORY_GC_RATE_LIMIT")
+    compression: bool = Field(True, alias="DATAFACTORY_COMPRESSION")
+    compression_minimum_size: int = Field(
+        1024, alias="DATAFACTORY_COMPRESSION_MINIMUM_SIZE", ge=0
+    )
+    warm_up: Literal["none", "background", "startup"] = Field(
+        "none", alias="DATAFACTORY_WARM_UP"
+    )
+    cache_backend: Literal["none", "memory", "sqlite", "redis"] = Field(
+        "none", alias="DATAFACTORY_CACHE_BACKEND"
+    )
+    # path of the SQLite database or Redis URL
+    cache_url: str = Field("", alias="DATAFACTORY_CACHE_URL")
+    cache_ttl: float = Field(300, alias="DATAFACTORY_CACHE_TTL", gt=0)
+    cache_max_entries: int = Field(10000, alias="DATAFACTORY_CACHE_MAX_ENTRIES", gt=0)
+    # empty: scope of the cache backend (see get_leader_backend)
+    leader_backend: Literal["", "file", "sqlite", "redis"] = Field(
+        "", alias="DATAFACTORY_LEADER_BACKEND"
+    )
+    # folder of the lock files, path of the SQLite database or Redis URL
+    leader_url: str = Field("", alias="DATAFACTORY_LEADER_URL")
+    leader_ttl: float = Field(30, alias="DATAFACTORY_LEADER_TTL", gt=0)
+    run_poll_interval: float = Field(0, alias="DATAFACTORY_RUN_POLL_INTERVAL", ge=0)
+    # hours
+    run_poll_window: float = Field(24, alias="DATAFACTORY_RUN_POLL_WINDOW", gt=0)
+    credential_prefetch: bool = Field(True, alias="DATAFACTORY_CREDENTIAL_PREFETCH")
+    credential_refresh_margin: float = Field(
+        600, alias="DATAFACTORY_CREDENTIAL_REFRESH_MARGIN", ge=0
+    )
+    credential_retry_interval: float = Field(
+        30, alias="DATAFACTORY_CREDENTIAL_RETRY_INTERVAL", gt=0
+    )
+    # connections per host: number of threads of the worker
+    http_pool_size: int = Field(32, alias="DATAFACTORY_HTTP_POOL_SIZE", gt=0)
+    # number of hosts
+    http_pool_connections: int = Field(
+        10, alias="DATAFACTORY_HTTP_POOL_CONNECTIONS", gt=0
+    )
+    http_connection_timeout: float = Field(
+        10, alias="DATAFACTORY_HTTP_CONNECTION_TIMEOUT", gt=0
+    )
+    http_read_timeout: float = Field(60, alias="DATAFACTORY_HTTP_READ_TIMEOUT", gt=0)
+    # seconds before the first TCP keep-alive probe, 0 to disable
+    http_keep_alive: int = Field(60, alias="DATAFACTORY_HTTP_KEEP_ALIVE", ge=0)
+    # factories of the pipelines: [resource_group/]factory_name,...
+    shards: str = Field("", alias="DATAFACTORY_SHARDS")
+    shard_vnodes: int = Field(100, alias="DATAFACTORY_SHARD_VNODES", gt=0)
+    # factories removed from the shards: their pipelines are still found and
+    # moved by the rebalance
+    shard_drain: str = Field("", alias="DATAFACTORY_SHARD_DRAIN")
+
+    class Config:
+        frozen = True
+        extra = Extra.ignore
+
+    @validator(
+        "execution_backend",
+        "local_engine",
+        "warm_up",
+        "cache_backend",
+        "leader_backend",
+        pre=True,
+    )
+    def lower(cls, value):
+        return value.lower() if isinstance(value, str) else value
+
+    @validator("shards", "shard_drain")
+    def check_shards(cls, value):
+        for shard in value.split(","):
+            parts = shard.strip().split("/")
+            if len(parts) > 2 or (shard.strip() and not all(parts)):
+                raise ValueError(f"Invalid factory {shard}")
+        return value
+
+    @staticmethod
+    def read_file(path: str) -> Dict[str, str]:
+        """return the variables of a settings file: KEY=value lines (format of
+        configuration/.default.env), value optionally quoted, # comments"""
+        variables = {}
+        with open(path) as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                name, value = line.split("=", 1)
+                name = name.strip()
+                if name.startswith("export "):
+                    name = name.replace("export ", "", 1).strip()
+                value = value.strip()
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                    quote = value[0]
+                    value = value[1:-1]
+                    if quote == '"':
+                        value = value.replace('\\"', '"')
+                variables[name] = value
+        return variables
+
+    @staticmethod
+    def get_environ() -> Dict[str, str]:
+        """return the environment variables of the process and, over them, the
+        variables of the file DATAFACTORY_SETTINGS_FILE (changed at runtime)"""
+        environ = dict(os.environ)
+        path = environ.get(SETTINGS_FILE)
+        if path:
+            environ.update(Settings.read_file(path))
+        return environ
+
+    @staticmethod
+    def load(environ: Mapping[str, str] = None) -> "Settings":
+        """return the settings of the environment variables (and of the
+        settings file), an empty variable is not set (default value)"""
+        environ = Settings.get_environ() if environ is None else environ
+        return Settings.parse_obj(
+            {
+                field.alias: environ[field.alias]
+                for field in Settings.__fields__.values()
+                if environ.get(field.alias)
+            }
+        )
 
 
 class ConfigurationService:
-    """Class used to read and write application service configuration"""
+    """Class used to read the application service configuration
+
+    The settings are loaded once and shared by all the instances of the
+    class: an instance reads the snapshot of the settings current when it
+    was created (consistent for a request), reload() replaces the snapshot
+    for the next instances.
+    """
 
     """ Below the existing configuration """
     """{ "name":"APP_VERSION", "value":"${APP_VERSION}"}, """
@@ -20,44 +221,292 @@ class ConfigurationService:
     """{ "name":"DATAFACTORY_STORAGE_SOURCE_FOLDER_FORMAT", "value":"factory/{node_id}/dataset-{date}"},"""
     """{ "name":"DATAFACTORY_SOURCE_LINKED_SERVICE", "value":"source_linked_service"},"""
     """{ "name":"DATAFACTORY_SINK_LINKED_SERVICE", "value":"sink_linked_service"},"""
+    """{ "name":"DATAFACTORY_RUN_DEDUPE", "value":"false"},"""
+    """{ "name":"DATAFACTORY_RUN_REGISTRY_TTL", "value":"86400"},"""
+    """{ "name":"DATAFACTORY_EXECUTION_BACKEND", "value":"datafactory"},"""
+    """{ "name":"DATAFACTORY_LOCAL_ROOT", "value":"/tmp/factory"},"""
+    """{ "name":"DATAFACTORY_LOCAL_ENGINE", "value":"arrow"},"""
+    """{ "name":"DATAFACTORY_LOCAL_BATCH_SIZE", "value":"4194304"},"""
+    """{ "name":"DATAFACTORY_LOCAL_MEMORY_LIMIT", "value":"1073741824"},"""
+    """{ "name":"DATAFACTORY_LOCAL_SPILL_FOLDER", "value":""},"""
+    """{ "name":"DATAFACTORY_LOCAL_SCAN_THREADS", "value":"0"},"""
+    """{ "name":"DATAFACTORY_LOCAL_WORKERS", "value":"1"},"""
+    """{ "name":"DATAFACTORY_ROUTER_LOCAL_STARTUP", "value":"1"},"""
+    """{ "name":"DATAFACTORY_ROUTER_LOCAL_THROUGHPUT", "value":"50000000"},"""
+    """{ "name":"DATAFACTORY_ROUTER_DATAFACTORY_STARTUP", "value":"300"},"""
+    """{ "name":"DATAFACTORY_ROUTER_DATAFACTORY_THROUGHPUT", "value":"200000000"},"""
+    """{ "name":"DATAFACTORY_PREFLIGHT", "value":"false"},"""
+    """{ "name":"DATAFACTORY_PREFLIGHT_SIZE", "value":"4096"},"""
+    """{ "name":"DATAFACTORY_GC_INTERVAL", "value":"0"},"""
+    """{ "name":"DATAFACTORY_GC_RETENTION_DAYS", "value":"30"},"""
+    """{ "name":"DATAFACTORY_GC_DRY_RUN", "value":"true"},"""
+    """{ "name":"DATAFACTORY_GC_CONCURRENCY", "value":"4"},"""
+    """{ "name":"DATAFACTORY_GC_RATE_LIMIT", "value":"5"},"""
+    """{ "name":"DATAFACTORY_COMPRESSION", "value":"true"},"""
+    """{ "name":"DATAFACTORY_COMPRESSION_MINIMUM_SIZE", "value":"1024"},"""
+    """{ "name":"DATAFACTORY_WARM_UP", "value":"none"},"""
+    """{ "name":"DATAFACTORY_CACHE_BACKEND", "value":"none"},"""
+    """{ "name":"DATAFACTORY_CACHE_URL", "value":""},"""
+    """{ "name":"DATAFACTORY_CACHE_TTL", "value":"300"},"""
+    """{ "name":"DATAFACTORY_CACHE_MAX_ENTRIES", "value":"10000"},"""
+    """{ "name":"DATAFACTORY_LEADER_BACKEND", "value":""},"""
+    """{ "name":"DATAFACTORY_LEADER_URL", "value":""},"""
+    """{ "name":"DATAFACTORY_LEADER_TTL", "value":"30"},"""
+    """{ "name":"DATAFACTORY_RUN_POLL_INTERVAL", "value":"0"},"""
+    """{ "name":"DATAFACTORY_RUN_POLL_WINDOW", "value":"24"},"""
+    """{ "name":"DATAFACTORY_CREDENTIAL_PREFETCH", "value":"true"},"""
+    """{ "name":"DATAFACTORY_CREDENTIAL_REFRESH_MARGIN", "value":"600"},"""
+    """{ "name":"DATAFACTORY_CREDENTIAL_RETRY_INTERVAL", "value":"30"},"""
+    """{ "name":"DATAFACTORY_HTTP_POOL_SIZE", "value":"32"},"""
+    """{ "name":"DATAFACTORY_HTTP_POOL_CONNECTIONS", "value":"10"},"""
+    """{ "name":"DATAFACTORY_HTTP_CONNECTION_TIMEOUT", "value":"10"},"""
+    """{ "name":"DATAFACTORY_HTTP_READ_TIMEOUT", "value":"60"},"""
+    """{ "name":"DATAFACTORY_HTTP_KEEP_ALIVE", "value":"60"},"""
+    """{ "name":"DATAFACTORY_SHARDS", "value":""},"""
+    """{ "name":"DATAFACTORY_SHARD_VNODES", "value":"100"},"""
+    """{ "name":"DATAFACTORY_SHARD_DRAIN", "value":""},"""
+    """{ "name":"DATAFACTORY_SETTINGS_FILE", "value":""},"""
 
-    def set_env_value(self, variable: str, value: str) -> str:
-        if not os.environ.get(variable):
-            os.environ.setdefault(variable, value)
-        else:
-            os.environ[variable] = value
-        return value
+    _lock = threading.Lock()
+    _settings: Optional[Settings] = None
+    _version = 0
+
+    def __init__(self, settings: Settings = None) -> None:
+        self.settings = settings or ConfigurationService.get_settings()
 
-    def get_env_value(self, variable: str, default_value: str) -> str:
-        if not os.environ.get(variable):
-            os.environ.setdefault(variable, default_value)
-            return default_value
-        else:
-            return os.environ[variable]
+    @staticmethod
+    def get_settings() -> Settings:
+        settings = ConfigurationService._settings
+        if settings is None:
+            with ConfigurationService._lock:
+                if ConfigurationService._settings is None:
+                    ConfigurationService._settings = Settings.load()
+                settings = ConfigurationService._settings
+        return settings
+
+    @staticmethod
+    def reload(environ: Mapping[str, str] = None) -> ConfigurationReport:
+        """load the settings and replace the snapshot of the worker, the
+        snapshot is kept if the settings are not valid (ValidationError) or
+        if the settings file cannot be read (OSError)"""
+        settings = Settings.load(environ)
+        with ConfigurationService._lock:
+            previous = ConfigurationService._settings
+            ConfigurationService._settings = settings
+            ConfigurationService._version += 1
+            version = ConfigurationService._version
+        changed = ConfigurationService.get_changes(previous, settings)
+        return ConfigurationReport.construct(
+            version=version,
+            loaded=datetime.utcnow(),
+            changed=changed,
+            restart_required=[name for name in changed if name in STARTUP_SETTINGS],
+        )
+
+    @staticmethod
+    def get_changes(previous: Optional[Settings], settings: Settings) -> List[str]:
+        """return the names of the environment variables changed"""
+        if previous is None:
+            return []
+        values: Dict[str, object] = previous.dict()
+        return [
+            field.alias
+            for name, field in Settings.__fields__.items()
+            if values[name] != getattr(settings, name)
+        ]
 
     def get_app_version(self) -> str:
-        return self.get_env_value("APP_VERSION", "1.0.0.0")
+        return self.settings.app_version
 
     def get_http_port(self) -> int:
-        return int(self.get_env_value("PORT_HTTP", "5000"))
+        return self.settings.http_port
 
     def get_websites_port(self) -> int:
-        return int(self.get_env_value("WEBSITES_HTTP", "5000"))
+        return self.settings.websites_port
 
     def get_datafactory_account_name(self) -> str:
-        return self.get_env_value("DATAFACTORY_ACCOUNT_NAME", "")
+        return self.settings.datafactory_account_name
 
     def get_datafactory_resource_group_name(self) -> str:
-        return self.get_env_value("DATAFACTORY_RESOURCE_GROUP_NAME", "")
+        return self.settings.datafactory_resource_group_name
 
     def get_datafactory_source_linked_service(self) -> str:
-        return self.get_env_value("DATAFACTORY_SOURCE_LINKED_SERVICE", "")
+        return self.settings.datafactory_source_linked_service
 
     def get_datafactory_sink_linked_service(self) -> str:
-        return self.get_env_value("DATAFACTORY_SINK_LINKED_SERVICE", "")
+        return self.settings.datafactory_sink_linked_service
 
     def get_subscription_id(self) -> str:
-        return self.get_env_value("AZURE_SUBSCRIPTION_ID", "")
+        return self.settings.subscription_id
 
     def get_tenant_id(self) -> str:
-        return self.get_env_value("AZURE_TENANT_ID", "")
+        return self.settings.tenant_id
+
+    def get_run_dedupe(self) -> bool:
+        return self.settings.run_dedupe
+
+    def get_run_registry_ttl(self) -> int:
+        return self.settings.run_registry_ttl
+
+    def get_execution_backend(self) -> str:
+        return self.settings.execution_backend
+
+    def get_local_root(self) -> str:
+        return self.settings.local_root
+
+    def get_local_engine(self) -> str:
+        return self.settings.local_engine
+
+    def get_local_batch_size(self) -> int:
+        return self.settings.local_batch_size
+
+    def get_local_memory_limit(self) -> int:
+        return self.settings.local_memory_limit
+
+    def get_local_spill_folder(self) -> str:
+        return self.settings.local_spill_folder
+
+    def get_local_scan_threads(self) -> int:
+        return self.settings.local_scan_threads
+
+    def get_local_workers(self) -> int:
+        return self.settings.local_workers
+
+    def get_router_local_startup(self) -> float:
+        return self.settings.router_local_startup
+
+    def get_router_local_throughput(self) -> float:
+        return self.settings.router_local_throughput
+
+    def get_router_datafactory_startup(self) -> float:
+        return self.settings.router_datafactory_startup
+
+    def get_router_datafactory_throughput(self) -> float:
+        return self.settings.router_datafactory_throughput
+
+    def get_preflight(self) -> bool:
+        return self.settings.preflight
+
+    def get_preflight_size(self) -> int:
+        return self.settings.preflight_size
+
+    def get_gc_interval(self) -> int:
+        return self.settings.gc_interval
+
+    def get_gc_retention_days(self) -> int:
+        return self.settings.gc_retention_days
+
+    def get_gc_dry_run(self) -> bool:
+        return self.settings.gc_dry_run
+
+    def get_gc_concurrency(self) -> int:
+        return self.settings.gc_concurrency
+
+    def get_gc_rate_limit(self) -> float:
+        return self.settings.gc_rate_limit
+
+    def get_compression(self) -> bool:
+        return self.settings.compression
+
+    def get_compression_minimum_size(self) -> int:
+        return self.settings.compression_minimum_size
+
+    def get_warm_up(self) -> str:
+        return self.settings.warm_up
+
+    def get_cache_backend(self) -> str:
+        return self.settings.cache_backend
+
+    def get_cache_url(self) -> str:
+        return self.settings.cache_url
+
+    def get_cache_ttl(self) -> float:
+        return self.settings.cache_ttl
+
+    def get_cache_max_entries(self) -> int:
+        return self.settings.cache_max_entries
+
+    def get_leader_backend(self) -> str:
+        """return the lease backend, by default the backend of the cache
+        when it's shared by the workers (sqlite: workers of the node,
+        redis: replicas), else file"""
+        if self.settings.leader_backend:
+            return self.settings.leader_backend
+        if self.settings.cache_backend in ["sqlite", "redis"]:
+            return self.settings.cache_backend
+        return "file"
+
+    def get_leader_url(self) -> str:
+        """return the url of the lease backend, the server of the cache by
+        default for the redis backend"""
+        if self.settings.leader_url:
+            return self.settings.leader_url
+        if (
+            self.get_leader_backend() == "redis"
+            and self.settings.cache_backend == "redis"
+        ):
+            return self.settings.cache_url
+        return ""
+
+    def get_leader_ttl(self) -> float:
+        return self.settings.leader_ttl
+
+    def get_run_poll_interval(self) -> float:
+        return self.settings.run_poll_interval
+
+    def get_run_poll_window(self) -> float:
+        return self.settings.run_poll_window
+
+    def get_credential_prefetch(self) -> bool:
+        return self.settings.credential_prefetch
+
+    def get_credential_refresh_margin(self) -> float:
+        return self.settings.credential_refresh_margin
+
+    def get_credential_retry_interval(self) -> float:
+        return self.settings.credential_retry_interval
+
+    def get_http_pool_size(self) -> int:
+        return self.settings.http_pool_size
+
+    def get_http_pool_connections(self) -> int:
+        return self.settings.http_pool_connections
+
+    def get_http_connection_timeout(self) -> float:
+        return self.settings.http_connection_timeout
+
+    def get_http_read_timeout(self) -> float:
+        return self.settings.http_read_timeout
+
+    def get_http_keep_alive(self) -> int:
+        return self.settings.http_keep_alive
+
+    def get_shards(self) -> List[str]:
+        """return the factories of the pipelines ({resource group}/{factory}),
+        the resource group of DATAFACTORY_RESOURCE_GROUP_NAME by default"""
+        return self.get_factories(self.settings.shards)
+
+    def get_shard_drain(self) -> List[str]:
+        """return the factories removed from the shards whose pipelines are
+        not moved yet"""
+        shards = self.get_shards()
+        return [
+            shard
+            for shard in self.get_factories(self.settings.shard_drain)
+            if shard not in shards
+        ]
+
+    def get_factories(self, value: str) -> List[str]:
+        shards = []
+        for shard in value.split(","):
+            shard = shard.strip()
+            if not shard:
+                continue
+            if "/" not in shard:
+                shard = f"{self.settings.datafactory_resource_group_name}/{shard}"
+            if shard not in shards:
+                shards.append(shard)
+        return shards
+
+    def get_shard_vnodes(self) -> int:
+        return self.settings.shard_vnodes
@@ -0,0 +1,232 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.import_service import ImportService
+from src.log_service import LogService
+from src.models import CredentialMetrics
+
+# imported on first use (see ImportService)
+identity = ImportService.lazy_import("azure.identity")
+
+# scope of the tokens of the Azure Resource Manager (Data Factory clients)
+MANAGEMENT_SCOPE = "https://management.azure.com/.default"
+# a cached token is used if it's valid for at least this number of seconds
+MINIMUM_VALIDITY = 30
+
+
+def get_log_service() -> LogService:
+    """Getting a single instance of the LogService"""
+    return LogService()
+
+
+class CachedToken:
+    """Token of a scope and the statistics of its refreshes"""
+
+    def __init__(self, scopes: Tuple[str, ...]) -> None:
+        self.scopes = scopes
+        # serialize the refreshes of the scope
+        self.lock = threading.Lock()
+        self.token = None
+        self.acquired = 0.0
+        self.next_refresh = 0.0
+        self.refreshes = 0
+        self.blocking_refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_duration = 0.0
+        self.total_refresh_duration = 0.0
+        self.last_error: Optional[str] = None
+
+    def is_valid(self, now: float) -> bool:
+        return (
+            self.token is not None and self.token.expires_on - now >= MINIMUM_VALIDITY
+        )
+
+
+class TokenCacheCredential:
+    """Credential returning the tokens of a credential from a cache
+
+    The tokens are refreshed by a background thread before they expire
+    (refresh_margin seconds, half of the lifetime of short-lived tokens): a
+    request waits for the token acquisition only if the token of its scope
+    is missing (first request if not prefetched) or can't be refreshed.
+    """
+
+    def __init__(
+        self, credential, refresh_margin: float = 600, retry_interval: float = 30
+    ) -> None:
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        # wakes the refresh thread up when a token is added
+        self.condition = threading.Condition()
+        self.tokens: Dict[Tuple[str, ...], CachedToken] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = False
+
+    def get_token(self, *scopes: str, **kwargs):
+        """return the cached token of the scopes, the tokens requested with
+        options (claims challenge, tenant) are not cached"""
+        if kwargs:
+            return self.credential.get_token(*scopes, **kwargs)
+        with self.condition:
+            cached = self.tokens.get(scopes)
+            if cached is None:
+                cached = self.tokens[scopes] = CachedToken(scopes)
+        if cached.is_valid(time.time()):
+            return cached.token
+        with cached.lock:
+            # refreshed by another thread while waiting for the lock
+            if not cached.is_valid(time.time()):
+                cached.blocking_refreshes += 1
+                self.refresh(cached)
+        self.start()
+        return cached.token
+
+    def refresh(self, cached: CachedToken):
+        """acquire a new token, the current token is kept on error"""
+        start = time.perf_counter()
+        try:
+            token = self.credential.get_token(*cached.scopes)
+        except Exception as ex:
+            cached.refresh_errors += 1
+            cached.last_error = str(ex)
+            cached.next_refresh = time.time() + self.retry_interval
+            raise
+        finally:
+            cached.last_refresh_duration = time.perf_counter() - start
+            cached.total_refresh_duration += cached.last_refresh_duration
+        now = time.time()
+        cached.token = token
+        cached.acquired = now
+        cached.refreshes += 1
+        cached.last_error = None
+        cached.next_refresh = token.expires_on - min(
+            self.refresh_margin, (token.expires_on - now) / 2
+        )
+        with self.condition:
+            self.condition.notify_all()
+
+    def start(self):
+        """start the refresh thread"""
+        with self.condition:
+            if self.thread is None and not self.stopped:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def run(self):
+        """refresh the tokens when they're due"""
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                now = time.time()
+                due = [
+                    cached
+                    for cached in self.tokens.values()
+                    if cached.token is not None and cached.next_refresh <= now
+                ]
+                if not due:
+                    next_refresh = min(
+                        (
+                            cached.next_refresh
+                            for cached in self.tokens.values()
+                            if cached.token is not None
+                        ),
+                        default=now + self.retry_interval,
+                    )
+                    self.condition.wait(max(next_refresh - now, 0.01))
+                    continue
+            for cached in due:
+                with cached.lock:
+                    if cached.next_refresh > time.time():
+                        continue
+                    try:
+                        self.refresh(cached)
+                    except Exception as ex:
+                        get_log_service().log_error(
+                            f"EXCEPTION while refreshing the token of {cached.scopes}: {ex}"
+                        )
+
+    def get_metrics(self) -> List[CredentialMetrics]:
+        now = time.time()
+        with self.condition:
+            tokens = list(self.tokens.values())
+        return [
+            CredentialMetrics.construct(
+                scope=" ".join(cached.scopes),
+                token_age=round(now - cached.acquired, 3) if cached.token else None,
+                expires_in=(
+                    round(cached.token.expires_on - now, 3) if cached.token else None
+                ),
+                refreshes=cached.refreshes,
+                blocking_refreshes=cached.blocking_refreshes,
+                refresh_errors=cached.refresh_errors,
+                last_refresh_duration=round(cached.last_refresh_duration * 1000, 3),
+                average_refresh_duration=round(
+                    cached.total_refresh_duration
+                    * 1000
+                    / max(cached.refreshes + cached.refresh_errors, 1),
+                    3,
+                ),
+                last_error=cached.last_error,
+            )
+            for cached in tokens
+        ]
+
+
+class CredentialService:
+    """Class used to share a single credential between the requests
+
+    A new FactoryService (and new SDK clients) is created for each HTTP
+    request: the credential and its tokens are shared by all the instances
+    of the class.
+    """
+
+    _lock = threading.Lock()
+    _credential: Optional[TokenCacheCredential] = None
+
+    def __init__(self, refresh_margin: float = 600, retry_interval: float = 30) -> None:
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+    def get_credential(self) -> TokenCacheCredential:
+        """return the credential of the process (DefaultAzureCredential)"""
+        with CredentialService._lock:
+            if CredentialService._credential is None:
+                CredentialService._credential = TokenCacheCredential(
+                    identity.DefaultAzureCredential(),
+                    refresh_margin=self.refresh_margin,
+                    retry_interval=self.retry_interval,
+                )
+            credential = CredentialService._credential
+        # settings reloaded: used from the next refresh
+        credential.refresh_margin = self.refresh_margin
+        credential.retry_interval = self.retry_interval
+        return credential
+
+    def prefetch(self, scopes: List[str] = [MANAGEMENT_SCOPE]) -> threading.Thread:
+        """acquire the tokens of the scopes in a background thread: before
+        the first requests"""
+
+        def run():
+            try:
+                credential = self.get_credential()
+                for scope in scopes:
+                    credential.get_token(scope)
+            except Exception as ex:
+                get_log_service().log_error(f"EXCEPTION while prefetching tokens: {ex}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def get_metrics(self) -> List[CredentialMetrics]:
+        with CredentialService._lock:
+            credential = CredentialService._credential
+        return credential.get_metrics() if credential is not None else []
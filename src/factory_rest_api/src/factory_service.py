@@ -1,42 +1,46 @@
 import hashlib
-import json
-import os
+import re
 from datetime import datetime
 from enum import Enum
-from typing import Any, List
-
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.datafactory import DataFactoryManagementClient
-from azure.mgmt.datafactory.models import (
-    AzureBlobStorageLocation,
-    DataFlowReference,
-    DataFlowResource,
-    DataFlowSink,
-    DataFlowSource,
-    DatasetReference,
-    DatasetResource,
-    DelimitedTextDataset,
-    ExecuteDataFlowActivity,
-    LinkedServiceReference,
-    MappingDataFlow,
-    PipelineResource,
-    Transformation,
-)
+from typing import Any, Dict, List, Optional
+
 from fastapi import HTTPException
+from src.cache_service import CacheService
 from src.configuration_service import ConfigurationService
+from src.credential_service import CredentialService
+from src.garbage_collector_service import GarbageCollectorService
+from src.import_service import ImportService
 from src.log_service import LogService
 from src.models import (
     ColumnDelimiter,
+    CompressionCodec,
+    DataFlowCompute,
+    DataFlowOptions,
     Dataset,
+    DatasetFormat,
     Error,
     EscapeCharacter,
+    GarbageCollectionReport,
+    GarbageCollectionRequest,
+    PartitionType,
     PipelineRequest,
     PipelineResponse,
     QuoteCharacter,
+    RebalanceReport,
+    RebalanceRequest,
+    RunRequest,
     RunResponse,
     Status,
     StatusDetails,
 )
+from src.run_poller_service import RunPollerService
+from src.run_registry_service import ACTIVE_STATUSES, RunRegistryService
+from src.schema_service import BlobHeadReader, SchemaService
+from src.transport_service import TransportService
+
+# imported on first use (see ImportService)
+datafactory = ImportService.lazy_import("azure.mgmt.datafactory")
+adf_models = ImportService.lazy_import("azure.mgmt.datafactory.models")
 
 
 class FactoryServiceError(int, Enum):
@@ -48,6 +52,9 @@ class FactoryServiceError(int, Enum):
     RUN_PIPELINE_EXCEPTION = 5
     PIPELINE_ID_NOT_FOUND = 6
     PIPELINE_GET_EXCEPTION = 7
+    INTEGRATION_RUNTIME_CREATION_ERROR = 8
+    LOCAL_ENGINE_ERROR = 9
+    PREFLIGHT_ERROR = 10
 
 
 def get_log_service() -> LogService:
@@ -89,50 +96,36 @@ class FactoryService:
         if not self.initialize_azure_clients():
             raise HTTPException(status_code=500, detail="Internal server error.")
 
+    def get_credential(self):  # pragma: no cover
+        """return the credential of the process: tokens cached and refreshed
+        in the background"""
+        return CredentialService(
+            refresh_margin=get_configuration_service().get_credential_refresh_margin(),
+            retry_interval=get_configuration_service().get_credential_retry_interval(),
+        ).get_credential()
+
+    def get_transport_service(self) -> TransportService:
+        """return the transports of the SDK clients: connections of the
+        process reused by the requests"""
+        return TransportService(
+            pool_size=get_configuration_service().get_http_pool_size(),
+            pool_connections=get_configuration_service().get_http_pool_connections(),
+            connection_timeout=get_configuration_service().get_http_connection_timeout(),
+            read_timeout=get_configuration_service().get_http_read_timeout(),
+            keep_alive=get_configuration_service().get_http_keep_alive(),
+        )
+
     def initialize_azure_clients(self) -> bool:  # pragma: no cover
         try:
-            credentials = DefaultAzureCredential()
-
-            self.adf_client = DataFactoryManagementClient(
-                credentials, self.subscription_id
+            self.adf_client = datafactory.DataFactoryManagementClient(
+                self.get_credential(),
+                self.subscription_id,
+                transport=self.get_transport_service().get_transport(),
             )
         except Exception:
             return False
         return True
 
-    def set_env_value(self, variable: str, value: str) -> str:
-        """set environment variable value (string type)"""
-        if not os.environ.get(variable):
-            os.environ.setdefault(variable, value)
-        else:
-            os.environ[variable] = value
-        return value
-
-    def get_env_value(self, variable: str, default_value: str) -> str:
-        """get environment variable value (string type)"""
-        if not os.environ.get(variable):
-            os.environ.setdefault(variable, default_value)
-            return default_value
-        else:
-            return os.environ[variable]
-
-    def serialize(self, o):
-        """serialize object"""
-        if isinstance(o, dict):
-            return {k: self.serialize(v) for k, v in o.items()}
-        if isinstance(o, list):
-            return [self.serialize(e) for e in o]
-        if isinstance(o, bytes):
-            return o.decode("utf-8")
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return o
-
-    def set_memory_persistent_node_list(self, list: Any):
-        """store list in environment variable (string)"""
-        o = self.serialize(list)
-        self.set_env_value("SHARE_NODE_LIST", json.dumps(o))
-
     def raise_http_exception(self, code: int, message: str, detail: str):
         """raise HTTP exception"""
         if not detail:
@@ -146,8 +139,19 @@ class FactoryService:
         error = Error(
             code=code, message=message, source="shareservice", date=datetime.utcnow()
         )
-        raise HTTPException(
-            status_code=code, detail=json.dumps(self.serialize(error.dict()))
+        # encoded once by the response class of the application
+        raise HTTPException(status_code=code, detail=error)
+
+    def get_error(self, code: int, message: str) -> Error:
+        """
+        Return the Error of a response, built without validation: the code and
+        the message come from the service or from the SDK
+        """
+        return Error.construct(
+            code=int(code),
+            message="" if message is None else str(message),
+            source="factory_rest_api",
+            date=datetime.utcnow(),
         )
 
     def pipeline(self, pipeline: PipelineRequest) -> PipelineResponse:
@@ -157,7 +161,21 @@ class FactoryService:
             PipelineRequest
         """
         try:
+            preflight = pipeline.preflight
+            if preflight is None:
+                preflight = get_configuration_service().get_preflight()
+            if preflight:
+                errors = self.get_schema_service().check(pipeline)
+                if errors:
+                    return self.create_pipeline_response(
+                        pipeline_request=pipeline,
+                        pipeline_name=f"{FactoryService.PIPELINE_PREFIX}{self.get_hash(pipeline)}",
+                        error_code=FactoryServiceError.PREFLIGHT_ERROR,
+                        error_message=f"Pipeline pre-flight check failed: {'; '.join(errors)}",
+                    )
             pipelineresponse = self.create_data_flow(input=pipeline)
+            # the pipeline may be re-created with new options
+            self.invalidate_pipelines([pipelineresponse.pipeline_name])
             return pipelineresponse
         except Exception as ex:
             get_log_service().log_error(f"EXCEPTION in pipeline: {ex}")
@@ -169,16 +187,26 @@ class FactoryService:
         with the following parameters:
             pipeline name
         """
+        cache = self.get_cache()
+        if cache is not None:
+            pipelineresponse = cache.get_pipeline(pipeline_name)
+            if pipelineresponse is not None:
+                pipelineresponse.error = self.get_error(
+                    FactoryServiceError.NO_ERROR, ""
+                )
+                return pipelineresponse
         pipelineresponse = self.get_data_flow(pipeline_name=pipeline_name)
+        if cache is not None and pipelineresponse is not None:
+            cache.set_pipeline(pipelineresponse)
         return pipelineresponse
 
-    def run(self, pipeline_name: str) -> RunResponse:
+    def run(self, pipeline_name: str, run_request: RunRequest = None) -> RunResponse:
         """
         Create Run
         with the following parameters:
             RunRequest
         """
-        runresponse = self.run_data_flow(pipeline_name)
+        runresponse = self.run_data_flow(pipeline_name, run_request)
         return runresponse
 
     def run_status(self, pipeline_name: str, run_id=str) -> RunResponse:
@@ -187,12 +215,89 @@ class FactoryService:
         with the following parameters:
             RunRequest
         """
+        cache = self.get_cache()
+        if cache is not None:
+            runresponse = cache.get_run(pipeline_name, run_id)
+            if runresponse is not None:
+                return runresponse
         try:
             runresponse = self.get_run_data_flow_status(pipeline_name, run_id)
-            return runresponse
         except Exception as ex:
             get_log_service().log_error(f"EXCEPTION in run_status: {ex}")
             return None
+        if cache is not None:
+            cache.set_run(runresponse)
+        return runresponse
+
+    def collect_garbage(
+        self, request: GarbageCollectionRequest
+    ) -> GarbageCollectionReport:
+        """
+        Delete the pipelines neither run nor created within the retention
+        window with their data flow and their datasets
+        """
+        retention_days = request.retention_days
+        if retention_days is None:
+            retention_days = get_configuration_service().get_gc_retention_days()
+        report = self.get_garbage_collector().collect(
+            retention_days=retention_days, dry_run=request.dry_run
+        )
+        if not report.dry_run:
+            self.invalidate_pipelines(report.stale_pipelines)
+        return report
+
+    def poll_runs(self, poller: RunPollerService, ttl: float) -> List[RunResponse]:
+        """
+        Publish the status of the active and recently completed runs in the
+        shared cache (leader of the workers only)
+        """
+        cache = self.get_cache()
+        if cache is None:
+            return []
+        return poller.poll(self, cache, ttl)
+
+    def rebalance(self, request: RebalanceRequest) -> RebalanceReport:
+        """
+        Move the pipelines to the factory owning them (several factories
+        only, see ShardedFactoryService)
+        """
+        raise HTTPException(
+            status_code=400,
+            detail="Rebalance requires several factories (DATAFACTORY_SHARDS)",
+        )
+
+    def get_pipeline_names(self) -> List[str]:
+        """return the names of the pipelines created by the service in the
+        factory"""
+        return [
+            pipeline_resource.name
+            for pipeline_resource in self.adf_client.pipelines.list_by_factory(
+                self.resource_group_name, self.datafactory_name
+            )
+            if pipeline_resource.name.startswith(FactoryService.PIPELINE_PREFIX)
+        ]
+
+    def delete_pipeline(self, pipeline_name: str) -> List[str]:
+        """delete the pipeline and its objects from the factory, the runs
+        are kept in the run history, return the errors"""
+        _, errors = self.get_garbage_collector().delete_pipeline(pipeline_name)
+        return errors
+
+    def get_garbage_collector(self) -> GarbageCollectorService:
+        return GarbageCollectorService(
+            self.adf_client,
+            self.resource_group_name,
+            self.datafactory_name,
+            pipeline_prefix=FactoryService.PIPELINE_PREFIX,
+            object_prefixes=[
+                ("dataflow", FactoryService.DATA_FLOW),
+                ("dataset", FactoryService.SOURCE_DATASET),
+                ("dataset", FactoryService.JOIN_DATASET),
+                ("dataset", FactoryService.SINK_DATASET),
+            ],
+            concurrency=get_configuration_service().get_gc_concurrency(),
+            rate_limit=get_configuration_service().get_gc_rate_limit(),
+        )
 
     def get_hash(
         self,
@@ -237,61 +342,40 @@ class FactoryService:
         activity_name = f"{FactoryService.ACTIVITY}"
         pipeline_name = f"{FactoryService.PIPELINE_PREFIX}{pipeline_id}"
 
-        sink_linked_service = LinkedServiceReference(
+        sink_linked_service = adf_models.LinkedServiceReference(
             reference_name=self.sink_linked_service
         )
-        source_linked_service = LinkedServiceReference(
+        source_linked_service = adf_models.LinkedServiceReference(
             reference_name=self.source_linked_service
         )
 
         # Folder path and file name not set
         # in source definition
         # will be defined in ADF script
-        source_location = AzureBlobStorageLocation(
+        source_location = adf_models.AzureBlobStorageLocation(
             container=input.source.container_name,
             folder_path="",
             file_name="",
         )
-        join_location = AzureBlobStorageLocation(
+        join_location = adf_models.AzureBlobStorageLocation(
             container=input.join.container_name,
             folder_path=input.join.folder_path,
             file_name=input.join.file_pattern_or_name,
         )
-        sink_location = AzureBlobStorageLocation(
+        sink_location = adf_models.AzureBlobStorageLocation(
             container=input.sink.container_name,
             folder_path=input.sink.folder_path,
             file_name="",
         )
 
-        source_dataset_resource = DatasetResource(
-            properties=DelimitedTextDataset(
-                linked_service_name=source_linked_service,
-                location=source_location,
-                first_row_as_header=input.source.first_row_as_header,
-                column_delimiter=input.source.column_delimiter,
-                quote_char=input.source.quote_char,
-                escape_char=input.source.escape_char,
-            )
+        source_dataset_resource = self.get_dataset_resource(
+            source_linked_service, source_location, input.source
         )
-        join_dataset_resource = DatasetResource(
-            properties=DelimitedTextDataset(
-                linked_service_name=source_linked_service,
-                location=join_location,
-                first_row_as_header=input.join.first_row_as_header,
-                column_delimiter=input.join.column_delimiter,
-                quote_char=input.join.quote_char,
-                escape_char=input.join.escape_char,
-            )
+        join_dataset_resource = self.get_dataset_resource(
+            source_linked_service, join_location, input.join
         )
-        sink_dataset_resource = DatasetResource(
-            properties=DelimitedTextDataset(
-                linked_service_name=sink_linked_service,
-                location=sink_location,
-                first_row_as_header=input.sink.first_row_as_header,
-                column_delimiter=input.sink.column_delimiter,
-                quote_char=input.sink.quote_char,
-                escape_char=input.sink.escape_char,
-            )
+        sink_dataset_resource = self.get_dataset_resource(
+            sink_linked_service, sink_location, input.sink
         )
 
         source_dataset = self.adf_client.datasets.create_or_update(
@@ -321,28 +405,28 @@ class FactoryService:
         if sink_dataset is None:
             raise HTTPException(status_code=500, detail="Internal server error.")
 
-        source_data_flow_source = DataFlowSource(
+        source_data_flow_source = adf_models.DataFlowSource(
             name=source_dataset_name,
-            dataset=DatasetReference(reference_name=source_dataset_name),
+            dataset=adf_models.DatasetReference(reference_name=source_dataset_name),
         )
-        join_data_flow_source = DataFlowSource(
+        join_data_flow_source = adf_models.DataFlowSource(
             name=join_dataset_name,
-            dataset=DatasetReference(reference_name=join_dataset_name),
+            dataset=adf_models.DatasetReference(reference_name=join_dataset_name),
         )
-        sink_data_flow_sink = DataFlowSink(
+        sink_data_flow_sink = adf_models.DataFlowSink(
             name=sink_dataset_name,
-            dataset=DatasetReference(reference_name=sink_dataset_name),
+            dataset=adf_models.DatasetReference(reference_name=sink_dataset_name),
         )
 
         # create transformations
-        join_data_flow = Transformation(name=join_flow_name)
-        select_data_flow = Transformation(name=select_flow_name)
+        join_data_flow = adf_models.Transformation(name=join_flow_name)
+        select_data_flow = adf_models.Transformation(name=select_flow_name)
 
         # if input.sink.file_pattern_or_name contains "-00001"
         # remove this substring as it will be automatically added
         # by data factory
         sink_pattern = input.sink.file_pattern_or_name.replace("-00001.", ".")
-        data_flow = MappingDataFlow(
+        data_flow = adf_models.MappingDataFlow(
             description="Prepare Data Flow",
             sources=[source_data_flow_source, join_data_flow_source],
             sinks=[sink_data_flow_sink],
@@ -357,10 +441,11 @@ class FactoryService:
                 columns=input.columns,
                 source_folder_path=input.source.folder_path,
                 source_file_name=input.source.file_pattern_or_name,
+                options=input.options,
             ),
         )
 
-        data_flow_resource = DataFlowResource(properties=data_flow)
+        data_flow_resource = adf_models.DataFlowResource(properties=data_flow)
 
         data_flow_created = self.adf_client.data_flows.create_or_update(
             resource_group_name=self.resource_group_name,
@@ -377,9 +462,23 @@ class FactoryService:
             )
             return pipeline_response
 
-        data_flow_ref = DataFlowReference(reference_name=dataflow_name)
-        data_flow_activity = ExecuteDataFlowActivity(
-            name=activity_name, data_flow=data_flow_ref
+        if (
+            input.compute is not None
+            and input.compute.integration_runtime_name
+            and not self.create_integration_runtime(input.compute)
+        ):
+            pipeline_response = self.create_pipeline_response(
+                pipeline_request=input,
+                pipeline_name=pipeline_name,
+                error_code=FactoryServiceError.INTEGRATION_RUNTIME_CREATION_ERROR,
+                error_message=f"Integration runtime creation failed for {input.compute.integration_runtime_name}",
+            )
+            return pipeline_response
+
+        data_flow_activity = self.get_data_flow_activity(
+            activity_name=activity_name,
+            dataflow_name=dataflow_name,
+            compute=input.compute,
         )
 
         # Create a pipeline with the copy activity
@@ -387,9 +486,11 @@ class FactoryService:
         tags_for_pipeline = [
             "{PIPELINE_ID}:{id}".format(
                 PIPELINE_ID=FactoryService.PIPELINE_ID, id=pipeline_id
-            )
+            ),
+            # used by the garbage collection of the pipelines never run
+            f"{GarbageCollectorService.CREATED_ANNOTATION}:{datetime.utcnow().isoformat()}",
         ]
-        p_obj = PipelineResource(
+        p_obj = adf_models.PipelineResource(
             activities=[data_flow_activity],
             parameters={},
             annotations=tags_for_pipeline,
@@ -415,6 +516,127 @@ class FactoryService:
         )
         return pipeline_response
 
+    def get_data_flow_activity(
+        self,
+        activity_name: str,
+        dataflow_name: str,
+        compute: DataFlowCompute,
+    ) -> "adf_models.ExecuteDataFlowActivity":
+        """
+        Return the activity running the data flow
+        with the compute settings and the integration runtime if defined
+        """
+        data_flow_ref = adf_models.DataFlowReference(reference_name=dataflow_name)
+        if compute is None:
+            return adf_models.ExecuteDataFlowActivity(
+                name=activity_name, data_flow=data_flow_ref
+            )
+        integration_runtime = None
+        if compute.integration_runtime_name:
+            integration_runtime = adf_models.IntegrationRuntimeReference(
+                reference_name=compute.integration_runtime_name
+            )
+        return adf_models.ExecuteDataFlowActivity(
+            name=activity_name,
+            data_flow=data_flow_ref,
+            compute=adf_models.ExecuteDataFlowActivityTypePropertiesCompute(
+                compute_type=compute.compute_type.value,
+                core_count=compute.core_count,
+            ),
+            integration_runtime=integration_runtime,
+        )
+
+    def get_compute_from_activity(
+        self, activity: "adf_models.ExecuteDataFlowActivity"
+    ) -> DataFlowCompute:
+        """
+        Return the compute settings of the activity running the data flow
+        """
+        if activity is None or (
+            getattr(activity, "compute", None) is None
+            and getattr(activity, "integration_runtime", None) is None
+        ):
+            return None
+        compute = DataFlowCompute()
+        if activity.compute is not None:
+            if activity.compute.compute_type is not None:
+                compute.compute_type = activity.compute.compute_type
+            if activity.compute.core_count is not None:
+                compute.core_count = activity.compute.core_count
+        if activity.integration_runtime is not None:
+            compute.integration_runtime_name = (
+                activity.integration_runtime.reference_name
+            )
+        return compute
+
+    def create_integration_runtime(
+        self, compute: DataFlowCompute
+    ) -> bool:  # pragma: no cover
+        """
+        Create or update the managed integration runtime used to run the data flow
+        if it doesn't exist or if its data flow properties are different.
+        With a time to live, successive runs reuse the same warm cluster.
+        """
+        data_flow_properties = adf_models.IntegrationRuntimeDataFlowProperties(
+            compute_type=compute.compute_type.value,
+            core_count=compute.core_count,
+            time_to_live=compute.time_to_live,
+        )
+        try:
+            integration_runtime = self.adf_client.integration_runtimes.get(
+                self.resource_group_name,
+                self.datafactory_name,
+                compute.integration_runtime_name,
+            )
+            current = (
+                integration_runtime.properties.compute_properties.data_flow_properties
+            )
+            if (
+                current is not None
+                and current.compute_type == data_flow_properties.compute_type
+                and current.core_count == data_flow_properties.core_count
+                and current.time_to_live == data_flow_properties.time_to_live
+            ):
+                return True
+        except Exception:
+            pass
+
+        try:
+            integration_runtime = self.adf_client.integration_runtimes.create_or_update(
+                self.resource_group_name,
+                self.datafactory_name,
+                compute.integration_runtime_name,
+                adf_models.IntegrationRuntimeResource(
+                    properties=adf_models.ManagedIntegrationRuntime(
+                        compute_properties=adf_models.IntegrationRuntimeComputeProperties(
+                            location="AutoResolve",
+                            data_flow_properties=data_flow_properties,
+                        )
+                    )
+                ),
+            )
+        except Exception as ex:
+            get_log_service().log_error(
+                f"EXCEPTION in create_integration_runtime: {ex}"
+            )
+            return False
+        return integration_runtime is not None
+
+    def get_integration_runtime_time_to_live(
+        self, integration_runtime_name: str
+    ) -> int:  # pragma: no cover
+        try:
+            integration_runtime = self.adf_client.integration_runtimes.get(
+                self.resource_group_name,
+                self.datafactory_name,
+                integration_runtime_name,
+            )
+            return (
+                integration_runtime.properties.compute_properties.data_flow_properties.time_to_live
+            )
+        except Exception:
+            return None
+
     def get_data_flow(
         self,
         pipeline_name: str,
@@ -430,6 +652,7 @@ class FactoryService:
                     pipeline_name=pipeline_name,
                     error_code=FactoryServiceError.NO_ERROR,
                     error_message="",
+                    pipeline_resource=pipeline_resource,
                 )
                 return pipeline_response
         except Exception as ex:
@@ -444,20 +667,136 @@ class FactoryService:
             )
             return pipeline_response
 
+    def get_schema_service(self) -> SchemaService:
+        """return the pre-flight check of the datasets"""
+        return SchemaService(
+            BlobHeadReader(self.get_credential(), self.get_transport_service()),
+            size=get_configuration_service().get_preflight_size(),
+        )
+
+    def get_cache(self) -> Optional[CacheService]:
+        """return the cache of the pipelines and of the completed runs, None
+        if DATAFACTORY_CACHE_BACKEND is none"""
+        kind = get_configuration_service().get_cache_backend()
+        if kind == "none":
+            return None
+        try:
+            backend = CacheService.get_backend(
+                kind,
+                get_configuration_service().get_cache_url(),
+                get_configuration_service().get_cache_max_entries(),
+            )
+        except Exception as ex:
+            get_log_service().log_error(f"EXCEPTION in cache backend {kind}: {ex}")
+            return None
+        return CacheService(
+            backend,
+            namespace=f"{self.resource_group_name}/{self.datafactory_name}",
+            ttl=get_configuration_service().get_cache_ttl(),
+        )
+
+    def invalidate_pipelines(self, pipeline_names: List[str]):
+        """remove the pipelines from the cache of all the workers (only from
+        the cache of this worker with the memory backend)"""
+        cache = self.get_cache()
+        if cache is not None:
+            cache.invalidate_pipelines(pipeline_names)
+
+    def get_registry(self) -> RunRegistryService:
+        """return the in-flight run table"""
+        return RunRegistryService(
+            ttl=get_configuration_service().get_run_registry_ttl()
+        )
+
+    def get_existing_run(
+        self,
+        pipeline_name: str,
+        parameters: Dict[str, str],
+        dedupe: bool,
+        idempotency_key: str,
+    ) -> RunResponse:
+        """
+        Return the run which can be reused instead of launching a new run:
+            - the run launched with the same idempotency key
+            - if dedupe is set, the Queued/InProgress run with the same parameters
+        """
+        registry = self.get_registry()
+        record = registry.find_run_by_idempotency_key(pipeline_name, idempotency_key)
+        if record is None and dedupe:
+            record = registry.find_active_run(pipeline_name, parameters)
+        if record is None:
+            return None
+
+        run_response = self.get_run_data_flow_status(pipeline_name, record.run_id)
+        if run_response.error.code != FactoryServiceError.NO_ERROR:
+            # the status can't be refreshed, use the status from the table
+            run_response = self.create_run_response(
+                run_id=record.run_id,
+                pipeline_name=pipeline_name,
+                status=record.status,
+                start=datetime.utcfromtimestamp(record.created),
+                end=datetime.utcnow(),
+                duration_in_ms=0,
+                error_code=FactoryServiceError.NO_ERROR,
+                error_message="",
+            )
+        if idempotency_key and record.idempotency_key == idempotency_key:
+            return run_response
+        if run_response.status.status in ACTIVE_STATUSES:
+            return run_response
+        return None
+
     def run_data_flow(
         self,
         pipeline_name: str,
+        run_request: RunRequest = None,
     ) -> RunResponse:  # pragma: no cover
+        pipeline_id = pipeline_name.replace(FactoryService.PIPELINE_PREFIX, "")
+        parameters = {f"{FactoryService.PIPELINE_ID}": pipeline_id}
+        dedupe = get_configuration_service().get_run_dedupe()
+        idempotency_key = None
+        if run_request is not None:
+            if run_request.dedupe is not None:
+                dedupe = run_request.dedupe
+            idempotency_key = run_request.idempotency_key
+
+        if not dedupe and not idempotency_key:
+            return self.create_run(pipeline_name, parameters)
+
+        registry = self.get_registry()
+        with registry.lock(registry.get_run_key(pipeline_name, parameters)):
+            run_response = self.get_existing_run(
+                pipeline_name, parameters, dedupe, idempotency_key
+            )
+            if run_response is not None:
+                get_log_service().log_information(
+                    f"Run {run_response.run_id} reused for pipeline {pipeline_name}"
+                )
+                return run_response
+            run_response = self.create_run(pipeline_name, parameters)
+            if run_response.error.code == FactoryServiceError.NO_ERROR:
+                registry.register_run(
+                    run_id=run_response.run_id,
+                    pipeline_name=pipeline_name,
+                    parameters=parameters,
+                    status=run_response.status.status,
+                    idempotency_key=idempotency_key,
+                )
+            return run_response
 
-        try:
-            pipeline_id = pipeline_name.replace(FactoryService.PIPELINE_PREFIX, "")
+    def create_run(
+        self,
+        pipeline_name: str,
+        parameters: Dict[str, str],
+    ) -> RunResponse:  # pragma: no cover
 
+        try:
             # Create a pipeline run
             create_run_response = self.adf_client.pipelines.create_run(
                 self.resource_group_name,
                 self.datafactory_name,
                 pipeline_name,
-                parameters={f"{FactoryService.PIPELINE_ID}": pipeline_id},
+                parameters=parameters,
             )
         except Exception as ex:
             run_response = self.create_run_response(
@@ -532,6 +871,7 @@ class FactoryService:
                     if pipeline_run.message is None
                     else pipeline_run.message,
                 )
+                self.get_registry().update_status(run_id, run_response.status.status)
             else:
                 run_response = self.create_run_response(
                     run_id=run_id,
@@ -570,7 +910,10 @@ class FactoryService:
         columns: List[str],
         source_folder_path: str,
         source_file_name: str,
+        options: DataFlowOptions = None,
     ) -> str:  # pragma: no cover
+        if options is None:
+            options = DataFlowOptions()
         typed_columns_list = ""
         columns_list = ""
         source_key_name = ""
@@ -608,20 +951,23 @@ class FactoryService:
             typed_columns_list = ""
             columns_list = ""
 
+        # In projection mode, the schema drift is disabled:
+        # the source dataset is restricted to the key and the selected columns
+        # and the join dataset to the key before the join.
         script = """source(output({typed_columns}),
-        allowSchemaDrift: true,
+        allowSchemaDrift: {schema_drift},
         validateSchema: false,
         ignoreNoFilesFound: false,
-        wildcardPaths:['{source_folder_path}/{source_file_name}']) ~> {source_ds}
+        wildcardPaths:['{source_folder_path}/{source_file_name}']{source_partition}) ~> {source_ds}
     source(output(
                     {{{key}}} as string
         ),
-        allowSchemaDrift: true,
+        allowSchemaDrift: {schema_drift},
         validateSchema: false,
         ignoreNoFilesFound: false) ~> {join_ds}
     {source_ds}, {join_ds} join({source_ds}@{{{key}}} == {join_ds}@{{{key}}},
-        joinType:'inner',
-        broadcast: 'auto') ~> {join_df}
+        joinType:'{join_type}',
+        broadcast: '{broadcast}') ~> {join_df}
     {join_df} select(mapColumn(
                 {columns}
         ),
@@ -629,7 +975,20 @@ class FactoryService:
         skipDuplicateMapOutputs: true) ~> {select_df}
     {select_df} sink(allowSchemaDrift: true,
         validateSchema: false,
-        filePattern:'{file_name}') ~> {sink_ds}""".format(
+        filePattern:'{file_name}'{sink_partition}) ~> {sink_ds}""".format(
+            source_partition=self.get_partition_script(
+                options.source_partition_type,
+                options.source_partition_count,
+                source_key_name,
+            ),
+            schema_drift="false" if options.projection else "true",
+            join_type=options.join_type.value,
+            broadcast=options.broadcast.value,
+            sink_partition=self.get_partition_script(
+                options.sink_partition_type,
+                options.sink_partition_count,
+                source_key_name,
+            ),
             typed_columns=typed_columns_list,
             columns=columns_list,
             source_ds=source_data_source_name,
@@ -645,6 +1004,48 @@ class FactoryService:
 
         return script
 
+    def get_partition_script(
+        self, partition_type: PartitionType, partition_count: int, key: str
+    ) -> str:
+        """
+        Return the partitionBy option of a source or a sink,
+        the hash partitioning uses the key column
+        """
+        if partition_type == PartitionType.HASH:
+            return f",\n        partitionBy('hash', {partition_count}, {{{key}}})"
+        if partition_type == PartitionType.ROUND_ROBIN:
+            return f",\n        partitionBy('roundRobin', {partition_count})"
+        return ""
+
+    def get_options_from_script(self, script: str) -> DataFlowOptions:
+        """
+        Return the join, partitioning and projection options defined in the
+        data flow script,
+        None if the script uses the default options
+        """
+        try:
+            values = {
+                "join_type": re.search(r"joinType:'(\w+)'", script).group(1),
+                "broadcast": re.search(r"broadcast: '(\w+)'", script).group(1),
+            }
+            source_script = script[0: script.index(") ~> ")]
+            sink_script = script[script.index(" sink("):]
+            values["projection"] = "allowSchemaDrift: false" in source_script
+            partition = re.search(r"partitionBy\('(\w+)', (\d+)", source_script)
+            if partition is not None:
+                values["source_partition_type"] = partition.group(1)
+                values["source_partition_count"] = int(partition.group(2))
+            partition = re.search(r"partitionBy\('(\w+)', (\d+)", sink_script)
+            if partition is not None:
+                values["sink_partition_type"] = partition.group(1)
+                values["sink_partition_count"] = int(partition.group(2))
+            options = DataFlowOptions(**values)
+        except Exception:
+            return None
+        if options == DataFlowOptions():
+            return None
+        return options
+
     def get_storage_account_name_from_endpoint(self, end_point: str) -> str:
         try:
             start = "https://"
@@ -670,8 +1071,9 @@ class FactoryService:
     def get_folder_file_from_script(self, script: str):
         try:
             start = "wildcardPaths:['"
-            end = "']) ~> Source"
-            result = script[script.index(start) + len(start): script.index(end)]
+            end = "']"
+            begin = script.index(start) + len(start)
+            result = script[begin: script.index(end, begin)]
             file = result[result.rfind("/") + 1:]
             folder = result[0: result.rfind("/")]
             return folder, file
@@ -683,29 +1085,104 @@ class FactoryService:
     def get_sink_file_from_script(self, script: str) -> str:
         try:
             start = "filePattern:'"
-            end = "') ~> Sink"
-            file = script[script.index(start) + len(start): script.index(end)]
+            end = "'"
+            begin = script.index(start) + len(start)
+            file = script[begin: script.index(end, begin)]
             return file
         except Exception:
             file = ""
         return file
 
+    def get_dataset_resource(
+        self,
+        linked_service: "adf_models.LinkedServiceReference",
+        location: "adf_models.AzureBlobStorageLocation",
+        dataset: Dataset,
+    ) -> "adf_models.DatasetResource":
+        """
+        Return the dataset resource associated with the format of the dataset
+        """
+        if dataset.format == DatasetFormat.PARQUET:
+            return adf_models.DatasetResource(
+                properties=adf_models.ParquetDataset(
+                    linked_service_name=linked_service,
+                    location=location,
+                    compression_codec=CompressionCodec.SNAPPY.value
+                    if dataset.compression_codec is None
+                    else dataset.compression_codec.value,
+                )
+            )
+        return adf_models.DatasetResource(
+            properties=adf_models.DelimitedTextDataset(
+                linked_service_name=linked_service,
+                location=location,
+                first_row_as_header=dataset.first_row_as_header,
+                column_delimiter=dataset.column_delimiter,
+                quote_char=dataset.quote_char,
+                escape_char=dataset.escape_char,
+                # none written: read back as none
+                compression_codec=None
+                if dataset.compression_codec is None
+                else dataset.compression_codec.value,
+            )
+        )
+
+    def get_dataset_from_resource(
+        self, dataset_resource: "adf_models.DatasetResource", service: Any
+    ) -> Dataset:
+        """
+        Return the Dataset associated with a DelimitedText or Parquet dataset resource
+        """
+        properties = dataset_resource.properties
+        location = properties.location
+        first_row_as_header = getattr(properties, "first_row_as_header", None)
+        column_delimiter = getattr(properties, "column_delimiter", None)
+        quote_char = getattr(properties, "quote_char", None)
+        escape_char = getattr(properties, "escape_char", None)
+        compression_codec = getattr(properties, "compression_codec", None)
+        if str(compression_codec).lower() not in [c.value for c in CompressionCodec]:
+            compression_codec = None
+        # trusted values read from the SDK models, the enums are converted here
+        return Dataset.construct(
+            resource_group_name=self.resource_group_name,
+            storage_account_name=self.get_storage_account_name_from_endpoint(
+                service.properties.service_endpoint
+            ),
+            container_name=location.container,
+            folder_path=location.folder_path,
+            file_pattern_or_name=location.file_name,
+            first_row_as_header=True
+            if first_row_as_header is None
+            else first_row_as_header,
+            column_delimiter=ColumnDelimiter.SEMICOLON.value
+            if column_delimiter is None
+            else column_delimiter,
+            quote_char=QuoteCharacter.DOUBLE_QUOTE.value
+            if quote_char is None
+            else quote_char,
+            escape_char=EscapeCharacter.DOUBLE_QUOTE.value
+            if escape_char is None
+            else escape_char,
+            format=DatasetFormat.PARQUET
+            if isinstance(properties, adf_models.ParquetDataset)
+            else DatasetFormat.DELIMITED_TEXT,
+            compression_codec=None
+            if compression_codec is None
+            else CompressionCodec(str(compression_codec).lower()),
+        )
+
     def get_pipeline_response(
         self,
         pipeline_name: str,
         error_code: int,
         error_message: str,
+        pipeline_resource: "adf_models.PipelineResource" = None,
     ) -> PipelineResponse:
         """
         Get a PipelineResponse using the pipeline name
         """
 
-        error = Error(
-            code=error_code,
-            message=error_message,
-            source="factory_rest_api",
-            date=datetime.utcnow(),
-        )
+        error = self.get_error(error_code, error_message)
         pipeline_id = pipeline_name.replace(f"{FactoryService.PIPELINE_PREFIX}", "")
 
         source_dataset_name = f"{FactoryService.SOURCE_DATASET}{pipeline_id}"
@@ -719,7 +1196,6 @@ class FactoryService:
             source_dataset_name,
         )
         if source_dataset is not None:
-            location = source_dataset.properties.location
             linked_service_name = (
                 source_dataset.properties.linked_service_name.reference_name
             )
@@ -727,27 +1203,7 @@ class FactoryService:
                 self.resource_group_name, self.datafactory_name, linked_service_name
             )
             if service is not None:
-                dataset_source = Dataset(
-                    resource_group_name=self.resource_group_name,
-                    storage_account_name=self.get_storage_account_name_from_endpoint(
-                        service.properties.service_endpoint
-                    ),
-                    container_name=location.container,
-                    folder_path=location.folder_path,
-                    file_pattern_or_name=location.file_name,
-                    first_row_as_header=True
-                    if source_dataset.properties.first_row_as_header is None
-                    else source_dataset.properties.first_row_as_header,
-                    column_delimiter=ColumnDelimiter.SEMICOLON.value
-                    if source_dataset.properties.column_delimiter is None
-                    else source_dataset.properties.column_delimiter,
-                    quote_char=QuoteCharacter.DOUBLE_QUOTE.value
-                    if source_dataset.properties.quote_char is None
-                    else source_dataset.properties.quote_char,
-                    escape_char=EscapeCharacter.DOUBLE_QUOTE.value
-                    if source_dataset.properties.escape_char is None
-                    else source_dataset.properties.escape_char,
-                )
+                dataset_source = self.get_dataset_from_resource(source_dataset, service)
 
         join_dataset = self.adf_client.datasets.get(
             self.resource_group_name,
@@ -755,7 +1211,6 @@ class FactoryService:
             join_dataset_name,
         )
         if join_dataset is not None:
-            location = join_dataset.properties.location
             linked_service_name = (
                 join_dataset.properties.linked_service_name.reference_name
             )
@@ -763,33 +1218,12 @@ class FactoryService:
                 self.resource_group_name, self.datafactory_name, linked_service_name
             )
             if service is not None:
-                dataset_join = Dataset(
-                    resource_group_name=self.resource_group_name,
-                    storage_account_name=self.get_storage_account_name_from_endpoint(
-                        service.properties.service_endpoint
-                    ),
-                    container_name=location.container,
-                    folder_path=location.folder_path,
-                    file_pattern_or_name=location.file_name,
-                    first_row_as_header=True
-                    if join_dataset.properties.first_row_as_header is None
-                    else join_dataset.properties.first_row_as_header,
-                    column_delimiter=ColumnDelimiter.SEMICOLON.value
-                    if join_dataset.properties.column_delimiter is None
-                    else join_dataset.properties.column_delimiter,
-                    quote_char=QuoteCharacter.DOUBLE_QUOTE.value
-                    if join_dataset.properties.quote_char is None
-                    else join_dataset.properties.quote_char,
-                    escape_char=EscapeCharacter.DOUBLE_QUOTE.value
-                    if join_dataset.properties.escape_char is None
-                    else join_dataset.properties.escape_char,
-                )
+                dataset_join = self.get_dataset_from_resource(join_dataset, service)
 
         sink_dataset = self.adf_client.datasets.get(
             self.resource_group_name, self.datafactory_name, sink_dataset_name
         )
         if sink_dataset is not None:
-            location = sink_dataset.properties.location
             linked_service_name = (
                 sink_dataset.properties.linked_service_name.reference_name
             )
@@ -797,27 +1231,7 @@ class FactoryService:
                 self.resource_group_name, self.datafactory_name, linked_service_name
             )
             if service is not None:
-                dataset_sink = Dataset(
-                    resource_group_name=self.resource_group_name,
-                    storage_account_name=self.get_storage_account_name_from_endpoint(
-                        service.properties.service_endpoint
-                    ),
-                    container_name=location.container,
-                    folder_path=location.folder_path,
-                    file_pattern_or_name=location.file_name,
-                    first_row_as_header=True
-                    if sink_dataset.properties.first_row_as_header is None
-                    else sink_dataset.properties.first_row_as_header,
-                    column_delimiter=ColumnDelimiter.SEMICOLON.value
-                    if sink_dataset.properties.column_delimiter is None
-                    else sink_dataset.properties.column_delimiter,
-                    quote_char=QuoteCharacter.DOUBLE_QUOTE.value
-                    if sink_dataset.properties.quote_char is None
-                    else sink_dataset.properties.quote_char,
-                    escape_char=EscapeCharacter.DOUBLE_QUOTE.value
-                    if sink_dataset.properties.escape_char is None
-                    else sink_dataset.properties.escape_char,
-                )
+                dataset_sink = self.get_dataset_from_resource(sink_dataset, service)
 
         data_flow = self.adf_client.data_flows.get(
             resource_group_name=self.resource_group_name,
@@ -825,6 +1239,7 @@ class FactoryService:
             data_flow_name=dataflow_name,
         )
 
+        options = None
         if data_flow is not None:
             script = data_flow.properties.script
             column_list = self.get_column_list_from_script(script)
@@ -835,12 +1250,23 @@ class FactoryService:
             # get sink file name from script
             file = self.get_sink_file_from_script(script)
             dataset_sink.file_pattern_or_name = file
+            options = self.get_options_from_script(script)
+
+        compute = None
+        if pipeline_resource is not None and pipeline_resource.activities:
+            compute = self.get_compute_from_activity(pipeline_resource.activities[0])
+            if compute is not None and compute.integration_runtime_name:
+                compute.time_to_live = self.get_integration_runtime_time_to_live(
+                    compute.integration_runtime_name
+                )
 
-        pipeline_response = PipelineResponse(
+        pipeline_response = PipelineResponse.construct(
             source=dataset_source,
             join=dataset_join,
             columns=column_list,
             sink=dataset_sink,
+            compute=compute,
+            options=options,
             pipeline_name=pipeline_name,
             error=error,
         )
@@ -857,23 +1283,21 @@ class FactoryService:
         Create a PipelineResponse using the input parameters
         """
 
-        error = Error(
-            code=error_code,
-            message=error_message,
-            source="factory_rest_api",
-            date=datetime.utcnow(),
-        )
+        error = self.get_error(error_code, error_message)
+        # the models of the request are already validated
         if pipeline_request is not None:
-            pipeline_response = PipelineResponse(
+            pipeline_response = PipelineResponse.construct(
                 source=pipeline_request.source,
                 join=pipeline_request.join,
                 columns=pipeline_request.columns,
                 sink=pipeline_request.sink,
+                compute=pipeline_request.compute,
+                options=pipeline_request.options,
                 pipeline_name=pipeline_name,
                 error=error,
             )
         else:
-            dataset = Dataset(
+            dataset = Dataset.construct(
                 resource_group_name=self.resource_group_name,
                 storage_account_name="",
                 container_name="",
@@ -884,7 +1308,7 @@ class FactoryService:
                 quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
                 escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
             )
-            pipeline_response = PipelineResponse(
+            pipeline_response = PipelineResponse.construct(
                 source=dataset,
                 join=dataset,
                 columns=[],
@@ -905,27 +1329,26 @@ class FactoryService:
         duration_in_ms: int,
         error_code: int,
         error_message: str,
+        metrics: Dict[str, int] = None,
     ) -> PipelineResponse:
         """
         Create a PipelineResponse using the input parameters
         """
-        status_detail = StatusDetails(
-            status=status,
+        # built without validation, only the status read from the SDK is
+        # checked (ValueError if not a Status)
+        status_detail = StatusDetails.construct(
+            status=Status(status),
             start=start,
             end=end,
-            duration=duration_in_ms,
-        )
-        error = Error(
-            code=error_code,
-            message=error_message,
-            source="factory_rest_api",
-            date=datetime.utcnow(),
+            duration=int(duration_in_ms),
         )
-        run_response = RunResponse(
+        error = self.get_error(error_code, error_message)
+        run_response = RunResponse.construct(
             run_id=run_id,
             pipeline_name=pipeline_name,
             status=status_detail,
             error=error,
+            metrics=metrics,
         )
 
         return run_response
@@ -0,0 +1,198 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+
+from src.import_service import ImportService
+from src.models import GarbageCollectionReport
+
+# imported on first use (see ImportService)
+adf_models = ImportService.lazy_import("azure.mgmt.datafactory.models")
+
+
+class RateLimiter:
+    """Class used to limit the number of requests per second of all the
+    threads (token bucket)"""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        # requests per second, no limit if <= 0
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """wait for a token"""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class GarbageCollectorService:
+    """Class used to delete the pipelines not run within the retention window
+    with their data flow and their datasets
+
+    The objects of a pipeline are deleted in dependency order (pipeline, data
+    flow, datasets), the pipelines are processed in parallel and the delete
+    requests are rate limited to preserve the ARM request quota.
+    """
+
+    # set on the pipelines by create_data_flow
+    CREATED_ANNOTATION = "Created"
+
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        adf_client,
+        resource_group_name: str,
+        datafactory_name: str,
+        pipeline_prefix: str,
+        object_prefixes: List[Tuple[str, str]],
+        concurrency: int = 4,
+        rate_limit: float = 5.0,
+    ) -> None:
+        self.adf_client = adf_client
+        self.resource_group_name = resource_group_name
+        self.datafactory_name = datafactory_name
+        # only the pipelines created by the service are collected
+        self.pipeline_prefix = pipeline_prefix
+        # (object type, name prefix) of the objects of a pipeline in
+        # dependency order: "dataflow" or "dataset"
+        self.object_prefixes = object_prefixes
+        # number of pipelines deleted in parallel
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_limit, burst=max(concurrency, 1))
+
+    def get_recent_pipelines(
+        self, last_updated_after: datetime, now: datetime
+    ) -> Set[str]:
+        """return the names of the pipelines run within the window"""
+        names = set()
+        continuation_token = None
+        while True:
+            response = self.adf_client.pipeline_runs.query_by_factory(
+                self.resource_group_name,
+                self.datafactory_name,
+                adf_models.RunFilterParameters(
+                    last_updated_after=last_updated_after,
+                    last_updated_before=now,
+                    continuation_token=continuation_token,
+                ),
+            )
+            names.update(run.pipeline_name for run in response.value or [])
+            continuation_token = response.continuation_token
+            if not continuation_token:
+                return names
+
+    def get_created(self, pipeline_resource) -> Optional[datetime]:
+        """return the creation date set in the annotations of the pipeline"""
+        for annotation in pipeline_resource.annotations or []:
+            if isinstance(annotation, str) and annotation.startswith(
+                f"{GarbageCollectorService.CREATED_ANNOTATION}:"
+            ):
+                try:
+                    return datetime.fromisoformat(annotation.split(":", 1)[1])
+                except ValueError:
+                    return None
+        return None
+
+    def find_stale_pipelines(
+        self, retention_days: int, now: datetime
+    ) -> Tuple[int, List[str]]:
+        """return the number of pipelines of the service and the names of the
+        pipelines neither run nor created within the retention window"""
+        last_updated_after = now - timedelta(days=retention_days)
+        recent = self.get_recent_pipelines(last_updated_after, now)
+        pipelines = 0
+        stale = []
+        for pipeline_resource in self.adf_client.pipelines.list_by_factory(
+            self.resource_group_name, self.datafactory_name
+        ):
+            if not pipeline_resource.name.startswith(self.pipeline_prefix):
+                continue
+            pipelines += 1
+            created = self.get_created(pipeline_resource)
+            if pipeline_resource.name in recent or (
+                created is not None and created > last_updated_after
+            ):
+                continue
+            stale.append(pipeline_resource.name)
+        return pipelines, sorted(stale)
+
+    def get_objects(self, pipeline_name: str) -> List[Tuple[str, str]]:
+        """return the objects of the pipeline in dependency order"""
+        pipeline_id = pipeline_name[len(self.pipeline_prefix):]
+        return [("pipeline", pipeline_name)] + [
+            (object_type, f"{prefix}{pipeline_id}")
+            for object_type, prefix in self.object_prefixes
+        ]
+
+    def delete_object(self, object_type: str, name: str):
+        self.rate_limiter.acquire()
+        operations = {
+            "pipeline": self.adf_client.pipelines,
+            "dataflow": self.adf_client.data_flows,
+            "dataset": self.adf_client.datasets,
+        }[object_type]
+        operations.delete(self.resource_group_name, self.datafactory_name, name)
+
+    def delete_pipeline(self, pipeline_name: str) -> Tuple[List[str], List[str]]:
+        """delete the objects of the pipeline, stop at the first error (the
+        next objects are still referenced), return the deleted objects and
+        the errors"""
+        deleted = []
+        for object_type, name in self.get_objects(pipeline_name):
+            try:
+                self.delete_object(object_type, name)
+            except Exception as ex:
+                return deleted, [f"{object_type} {name}: {ex}"]
+            deleted.append(f"{object_type}:{name}")
+        return deleted, []
+
+    def collect(
+        self, retention_days: int, dry_run: bool = True
+    ) -> GarbageCollectionReport:
+        """delete (or only list if dry_run) the stale pipelines, a single
+        collection runs at a time in the process"""
+        with GarbageCollectorService._lock:
+            start = datetime.utcnow()
+            pipelines, stale = self.find_stale_pipelines(retention_days, start)
+            deleted_objects = []
+            errors = []
+            if dry_run:
+                for pipeline_name in stale:
+                    deleted_objects.extend(
+                        f"{object_type}:{name}"
+                        for object_type, name in self.get_objects(pipeline_name)
+                    )
+            elif stale:
+                with ThreadPoolExecutor(
+                    max_workers=max(self.concurrency, 1)
+                ) as executor:
+                    for deleted, pipeline_errors in executor.map(
+                        self.delete_pipeline, stale
+                    ):
+                        deleted_objects.extend(deleted)
+                        errors.extend(pipeline_errors)
+            return GarbageCollectionReport(
+                dry_run=dry_run,
+                retention_days=retention_days,
+                start=start,
+                end=datetime.utcnow(),
+                pipelines=pipelines,
+                stale_pipelines=stale,
+                deleted_objects=deleted_objects,
+                errors=errors,
+            )
@@ -0,0 +1,141 @@
+import argparse
+import importlib
+import re
+import subprocess
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, List, Optional, Tuple
+
+# lines written by python -X importtime:
+# import time: self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+class LazyModule(ModuleType):
+    """Module imported on the first access to one of its attributes
+
+    The Azure SDK, numpy and pyarrow modules take most of the start time of
+    the service: they are imported by the first request which uses them (or
+    by the warm-up) instead of the import of the application.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def load(self) -> ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            # importlib serializes the concurrent imports of a module
+            start = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            ImportService.record(self.__name__, time.perf_counter() - start)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
+
+    def __dir__(self) -> List[str]:
+        return dir(self.load())
+
+
+class ImportService:
+    """Class used to import the heavy modules lazily, to warm them up and
+    to report the import times"""
+
+    _lock = threading.Lock()
+    # lazy modules by name
+    _modules: Dict[str, LazyModule] = {}
+    # duration in seconds of the first import of the lazy modules
+    _durations: Dict[str, float] = {}
+
+    @staticmethod
+    def lazy_import(name: str) -> LazyModule:
+        """return the lazy module (one instance per module name)"""
+        with ImportService._lock:
+            module = ImportService._modules.get(name)
+            if module is None:
+                module = LazyModule(name)
+                ImportService._modules[name] = module
+            return module
+
+    @staticmethod
+    def record(name: str, duration: float):
+        with ImportService._lock:
+            ImportService._durations[name] = duration
+
+    def get_durations(self) -> Dict[str, float]:
+        with ImportService._lock:
+            return dict(ImportService._durations)
+
+    def get_module_names(self) -> List[str]:
+        with ImportService._lock:
+            return sorted(ImportService._modules)
+
+    def warm_up(self, names: Optional[List[str]] = None) -> Dict[str, float]:
+        """import the lazy modules (all the modules registered if names is
+        None), return the duration of the imports done"""
+        for name in self.get_module_names() if names is None else names:
+            ImportService.lazy_import(name).load()
+        return self.get_durations()
+
+    def start_warm_up(self, names: Optional[List[str]] = None) -> threading.Thread:
+        """import the lazy modules in a background thread: the first requests
+        are served while the modules are imported"""
+        thread = threading.Thread(target=self.warm_up, args=(names,), daemon=True)
+        thread.start()
+        return thread
+
+    def get_import_times(self, output: str) -> List[Tuple[str, int, int, int]]:
+        """parse the output of python -X importtime, return the (module,
+        self time in us, cumulative time in us, depth) of the imports"""
+        import_times = []
+        for line in output.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match is None:
+                continue
+            self_time, cumulative, indent, name = match.groups()
+            import_times.append(
+                (name, int(self_time), int(cumulative), (len(indent) - 1) // 2)
+            )
+        return import_times
+
+    def get_import_report(
+        self, module: str = "src.app", top: int = 20, max_depth: int = 2
+    ) -> List[Tuple[str, int, int, int]]:
+        """import the module in a new interpreter with -X importtime, return
+        the slowest imports up to max_depth (0: imported by the module)"""
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        import_times = [
+            import_time
+            for import_time in self.get_import_times(result.stderr)
+            if import_time[3] <= max_depth
+        ]
+        return sorted(import_times, key=lambda item: item[2], reverse=True)[:top]
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description="Import time report")
+    parser.add_argument("--module", default="src.app")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--max-depth", type=int, default=2)
+    args = parser.parse_args()
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for name, self_time, cumulative, depth in ImportService().get_import_report(
+        args.module, args.top, args.max_depth
+    ):
+        print(
+            f"{cumulative / 1000:>16.1f} {self_time / 1000:>10.1f}  {'  ' * depth}{name}"
+        )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
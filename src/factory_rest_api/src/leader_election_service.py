@@ -0,0 +1,207 @@
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict
+
+from src.cache_service import RedisCacheBackend, get_default_sqlite_path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+FILE_BACKEND = "file"
+SQLITE_BACKEND = "sqlite"
+REDIS_BACKEND = "redis"
+
+# renew the lease only if it's still owned by the caller
+REDIS_RENEW_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+)
+# release the lease only if it's still owned by the caller
+REDIS_RELEASE_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('del', KEYS[1]) else return 0 end"
+)
+
+
+class LeaseBackend:
+    """Interface of the lease backends: a lease is owned by a single owner
+    until it expires or is released"""
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """acquire the lease or renew it if already owned by owner, return
+        True if owner holds the lease for ttl seconds"""
+        raise NotImplementedError
+
+    def release(self, name: str, owner: str):
+        raise NotImplementedError
+
+
+class FileLeaseBackend(LeaseBackend):
+    """Lease of the node: lock of a file held by the process while it's the
+    leader, released by the system if the process ends (no expiration)"""
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self.lock = threading.Lock()
+        # lock files opened by this process: name -> (owner, file)
+        self.files: Dict[str, tuple] = {}
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.folder, f"factory_rest_api.{name}.lock")
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        with self.lock:
+            if name in self.files:
+                return self.files[name][0] == owner
+            file = open(self.get_path(name), "a+")
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file.close()
+                return False
+            self.files[name] = (owner, file)
+            return True
+
+    def release(self, name: str, owner: str):
+        with self.lock:
+            if name in self.files and self.files[name][0] == owner:
+                file = self.files.pop(name)[1]
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+                file.close()
+
+
+class SQLiteLeaseBackend(LeaseBackend):
+    """Lease of the node in a SQLite database shared by the workers"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+        with self.get_connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS lease "
+                "(name TEXT PRIMARY KEY, owner TEXT NOT NULL, expiration REAL NOT NULL)"
+            )
+
+    def get_connection(self) -> sqlite3.Connection:
+        """return the connection of the thread (transactions started
+        explicitly)"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.connection = connection
+        return connection
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        connection = self.get_connection()
+        now = time.time()
+        # write lock taken before the read: a single worker checks the lease
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT owner, expiration FROM lease WHERE name = ?", (name,)
+            ).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO lease (name, owner, expiration) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            )
+            return True
+        finally:
+            connection.execute("COMMIT")
+
+    def release(self, name: str, owner: str):
+        self.get_connection().execute(
+            "DELETE FROM lease WHERE name = ? AND owner = ?", (name, owner)
+        )
+
+
+class RedisLeaseBackend(LeaseBackend):
+    """Lease shared by the replicas in a server speaking the Redis protocol:
+    SET NX PX to acquire, compare and expire (script) to renew"""
+
+    def __init__(self, url: str) -> None:
+        self.redis = RedisCacheBackend(url)
+
+    def get_key(self, name: str) -> str:
+        return f"factory_rest_api:lease:{name}"
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        milliseconds = max(int(ttl * 1000), 1)
+        key = self.get_key(name)
+        if self.redis.execute("SET", key, owner, "NX", "PX", milliseconds) == "OK":
+            return True
+        return (
+            self.redis.execute("EVAL", REDIS_RENEW_SCRIPT, 1, key, owner, milliseconds)
+            == 1
+        )
+
+    def release(self, name: str, owner: str):
+        self.redis.execute("EVAL", REDIS_RELEASE_SCRIPT, 1, self.get_key(name), owner)
+
+
+class LeaderElectionService:
+    """Class used to elect a single leader among the workers (and the
+    replicas with a shared backend) for a background task
+
+    The leader renews its lease before each execution of the task, the lease
+    expires after ttl seconds if the leader stops: another worker takes the
+    lease at its next attempt.
+    """
+
+    _lock = threading.Lock()
+    _backends: Dict[tuple, LeaseBackend] = {}
+
+    def __init__(
+        self, backend: LeaseBackend, name: str, ttl: float, owner: str = None
+    ) -> None:
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.owner = (
+            owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.leader = False
+
+    @staticmethod
+    def get_backend(kind: str, url: str = "") -> LeaseBackend:
+        """return the backend of the process for the kind (file, sqlite or
+        redis) and the url (folder of the lock files, path of the SQLite
+        database or Redis URL)"""
+        with LeaderElectionService._lock:
+            backend = LeaderElectionService._backends.get((kind, url))
+            if backend is None:
+                if kind == FILE_BACKEND:
+                    backend = FileLeaseBackend(url or tempfile.gettempdir())
+                elif kind == SQLITE_BACKEND:
+                    backend = SQLiteLeaseBackend(
+                        url or get_default_sqlite_path("factory_rest_api_leases.db")
+                    )
+                elif kind == REDIS_BACKEND:
+                    backend = RedisLeaseBackend(url or "redis://localhost:6379/0")
+                else:
+                    raise ValueError(f"Lease backend {kind} not supported")
+                LeaderElectionService._backends[(kind, url)] = backend
+            return backend
+
+    def acquire(self) -> bool:
+        """acquire or renew the lease, an error of the backend means the
+        lease is lost"""
+        try:
+            self.leader = self.backend.acquire(self.name, self.owner, self.ttl)
+        except Exception:
+            self.leader = False
+            raise
+        return self.leader
+
+    def release(self):
+        if self.leader:
+            self.leader = False
+            self.backend.release(self.name, self.owner)
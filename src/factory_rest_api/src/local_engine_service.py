@@ -0,0 +1,862 @@
+import csv
+import glob
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from src.import_service import ImportService
+from src.models import Dataset, DatasetFormat, JoinType, PipelineRequest
+
+# imported on first use (see ImportService)
+np = ImportService.lazy_import("numpy")
+pa = ImportService.lazy_import("pyarrow")
+pc = ImportService.lazy_import("pyarrow.compute")
+pacsv = ImportService.lazy_import("pyarrow.csv")
+
+
+class LocalEngineError(Exception):
+    pass
+
+
+def is_file_pattern(file_name: str) -> bool:
+    """return True if the file name has wildcards: accepted by Data Factory,
+    not by the local engine which reads a single file"""
+    return any(char in file_name for char in "*?[")
+
+
+def get_local_path(root: str, dataset: Dataset, file_name: str = None) -> str:
+    """return the local path of the dataset:
+    {root}/{storage_account_name}/{container_name}/{folder_path}/{file}"""
+    return os.path.join(
+        root,
+        dataset.storage_account_name,
+        dataset.container_name,
+        dataset.folder_path,
+        dataset.file_pattern_or_name if file_name is None else file_name,
+    )
+
+
+def get_local_file(root: str, dataset: Dataset) -> Optional[str]:
+    """return the path of the file read by the local engine for the dataset,
+    None if the file name is a pattern or if the file is not found"""
+    if is_file_pattern(dataset.file_pattern_or_name):
+        return None
+    path = get_local_path(root, dataset)
+    return path if os.path.isfile(path) else None
+
+
+class LocalEngineService:
+    """Class used to run the join/select pipeline on local CSV files
+
+    The semantics are the ones of the data flow script:
+        - the first selected column is the key of the inner join
+        - the source rows whose key is in the join dataset are selected
+        - the selected columns are written in the sink dataset
+    """
+
+    # Column names used when the first row is not a header
+    # (same names as Data Factory)
+    DEFAULT_COLUMN_PREFIX = "Prop_"
+    # Suffix added by Data Factory to the name of the sink files
+    SINK_PARTITION_FORMAT = "-{index:05d}"
+
+    CSV_ENGINE = "csv"
+    ARROW_ENGINE = "arrow"
+
+    MAX_SPILL_PARTITIONS = 256
+    # maximum size of the byte ranges of the source file in batches
+    RANGE_BATCHES = 16
+    # size of the windows searched for the end of a record
+    RECORD_WINDOW = 1 << 16
+
+    def __init__(
+        self,
+        root: str,
+        engine: str = ARROW_ENGINE,
+        batch_size: int = 4 << 20,
+        memory_limit: int = 1 << 30,
+        spill_folder: str = None,
+        scan_threads: int = 0,
+        workers: int = 1,
+    ) -> None:
+        self.root = root
+        self.engine = engine
+        # size in bytes of the batches read by the Arrow engine
+        self.batch_size = batch_size
+        # size in bytes of the join dataset above which the Arrow engine
+        # partitions the datasets on disk (grace hash join)
+        self.memory_limit = memory_limit
+        # folder of the partition files, system temporary folder if None
+        self.spill_folder = spill_folder
+        # number of byte ranges of the source file scanned in parallel,
+        # number of CPUs if 0
+        self.scan_threads = scan_threads if scan_threads > 0 else os.cpu_count()
+        # number of processes of the Arrow engine (process pool if > 1)
+        self.workers = workers
+
+    def get_path(self, dataset: Dataset, file_name: str = None) -> str:
+        return get_local_path(self.root, dataset, file_name)
+
+    def get_sink_file_name(self, file_pattern: str, index: int = 1) -> str:
+        """return the name of the sink file for the partition index (1 based)
+        sinkdata.csv or sinkdata-00001.csv -> sinkdata-0000{index}.csv"""
+        name, extension = os.path.splitext(file_pattern.replace("-00001.", "."))
+        if name.endswith(LocalEngineService.SINK_PARTITION_FORMAT.format(index=1)):
+            name = name[
+                : -len(LocalEngineService.SINK_PARTITION_FORMAT.format(index=1))
+            ]
+        suffix = LocalEngineService.SINK_PARTITION_FORMAT.format(index=index)
+        return f"{name}{suffix}{extension}"
+
+    def remove_sink_files(self, dataset: Dataset):
+        """remove the partition files written by a previous run"""
+        name, extension = os.path.splitext(
+            self.get_sink_file_name(dataset.file_pattern_or_name)
+        )
+        pattern = (
+            f"{glob.escape(name[:-5])}[0-9][0-9][0-9][0-9][0-9]{glob.escape(extension)}"
+        )
+        for path in glob.glob(self.get_path(dataset, pattern)):
+            os.remove(path)
+
+    def get_csv_format(self, dataset: Dataset) -> Dict[str, object]:
+        """return the csv module format parameters associated with the dataset"""
+        if dataset.escape_char == dataset.quote_char:
+            return {
+                "delimiter": dataset.column_delimiter,
+                "quotechar": dataset.quote_char,
+                "doublequote": True,
+                "escapechar": None,
+                "lineterminator": "\n",
+            }
+        return {
+            "delimiter": dataset.column_delimiter,
+            "quotechar": dataset.quote_char,
+            "doublequote": False,
+            "escapechar": dataset.escape_char,
+            "lineterminator": "\n",
+        }
+
+    def get_header(self, reader, dataset: Dataset) -> Tuple[List[str], List[str]]:
+        """return the column names and the first data row (if it has been read)"""
+        first_row = next(reader, None)
+        if first_row is None:
+            return [], None
+        if dataset.first_row_as_header:
+            return first_row, None
+        names = [
+            f"{LocalEngineService.DEFAULT_COLUMN_PREFIX}{i}"
+            for i in range(len(first_row))
+        ]
+        return names, first_row
+
+    def get_column_index(self, header: List[str], column: str, path: str) -> int:
+        try:
+            return header.index(column)
+        except ValueError:
+            raise LocalEngineError(f"Column '{column}' not found in {path}")
+
+    def validate(self, input: PipelineRequest):
+        """raise LocalEngineError if the pipeline can't run locally"""
+        if not input.columns:
+            raise LocalEngineError("No column selected")
+        for dataset in [input.source, input.join, input.sink]:
+            if dataset.format != DatasetFormat.DELIMITED_TEXT:
+                raise LocalEngineError(f"Format {dataset.format} not supported")
+            if is_file_pattern(dataset.file_pattern_or_name):
+                raise LocalEngineError(
+                    f"File pattern {dataset.file_pattern_or_name} not supported"
+                )
+        if input.options is not None and input.options.join_type != JoinType.INNER:
+            raise LocalEngineError(f"Join type {input.options.join_type} not supported")
+
+    def read_header(self, path: str, dataset: Dataset) -> List[str]:
+        """return the column names of a dataset reading only its first row"""
+        with open(path, newline="") as file:
+            reader = csv.reader(file, **self.get_csv_format(dataset))
+            header, _ = self.get_header(reader, dataset)
+        return header
+
+    def run(self, input: PipelineRequest) -> Dict[str, int]:
+        """
+        Run the pipeline with the Arrow engine if all the selected columns
+        are in the source dataset, with the csv engine otherwise.
+        Return the metrics of the run.
+        """
+        self.validate(input)
+        self.remove_sink_files(input.sink)
+        if self.engine == LocalEngineService.ARROW_ENGINE:
+            source_path = self.get_path(input.source)
+            header = self.read_header(source_path, input.source)
+            if all(column in header for column in input.columns):
+                return self.run_arrow(input)
+        return self.run_csv(input)
+
+    def get_arrow_column(self, dataset: Dataset, column: str) -> str:
+        """return the name of the column in the Arrow tables,
+        Arrow generated names are f0, f1, ... if the first row is not a header"""
+        if dataset.first_row_as_header:
+            return column
+        return f"f{column[len(LocalEngineService.DEFAULT_COLUMN_PREFIX):]}"
+
+    def get_arrow_options(
+        self, dataset: Dataset, columns: List[str], column_names: List[str] = None
+    ):
+        """return the Arrow read, parse and convert options of the dataset,
+        all the columns are read as strings to keep the values unchanged.
+        With column_names, the first row is read as a data row."""
+        if column_names is None:
+            read_options = pacsv.ReadOptions(
+                block_size=self.batch_size,
+                autogenerate_column_names=not dataset.first_row_as_header,
+            )
+        else:
+            read_options = pacsv.ReadOptions(
+                block_size=self.batch_size, column_names=column_names
+            )
+        parse_options = pacsv.ParseOptions(
+            delimiter=dataset.column_delimiter,
+            quote_char=dataset.quote_char,
+            double_quote=dataset.escape_char == dataset.quote_char,
+            escape_char=False
+            if dataset.escape_char == dataset.quote_char
+            else dataset.escape_char,
+            newlines_in_values=True,
+        )
+        names = [self.get_arrow_column(dataset, column) for column in columns]
+        convert_options = pacsv.ConvertOptions(
+            include_columns=names,
+            column_types={name: pa.string() for name in names},
+        )
+        return read_options, parse_options, convert_options
+
+    def get_unquoted_characters(self, dataset: Dataset) -> List[str]:
+        """return the characters of the dataset format which the Arrow writer
+        writes unchanged: the escape character (if it is not the quote
+        character) and the quote character (if it is not a double quote)"""
+        characters = []
+        if dataset.escape_char and dataset.escape_char != dataset.quote_char:
+            characters.append(dataset.escape_char)
+        if dataset.quote_char != '"':
+            characters.append(dataset.quote_char)
+        return characters
+
+    def write_arrow_batch(self, batch, sink_file, dataset: Dataset):
+        """write the batch without quotes (bulk Arrow writer), with the csv
+        module if some values contain a delimiter, a quote, a new line or a
+        character the Arrow writer doesn't escape"""
+        characters = self.get_unquoted_characters(dataset)
+        if not any(
+            pc.any(pc.match_substring(column, character)).as_py()
+            for column in batch.columns
+            for character in characters
+        ):
+            buffer = pa.BufferOutputStream()
+            try:
+                pacsv.write_csv(
+                    batch,
+                    buffer,
+                    write_options=pacsv.WriteOptions(
+                        include_header=False,
+                        delimiter=dataset.column_delimiter,
+                        quoting_style="none",
+                    ),
+                )
+                sink_file.write(buffer.getvalue().to_pybytes())
+                return
+            except pa.ArrowInvalid:
+                pass
+        text = io.StringIO()
+        writer = csv.writer(text, **self.get_csv_format(dataset))
+        writer.writerows(zip(*[column.to_pylist() for column in batch.columns]))
+        sink_file.write(text.getvalue().encode())
+
+    def read_arrow_batches(self, path: str, dataset: Dataset, columns: List[str]):
+        """yield the record batches of the selected columns of a CSV file"""
+        read_options, parse_options, convert_options = self.get_arrow_options(
+            dataset, columns
+        )
+        try:
+            reader = pacsv.open_csv(
+                pa.memory_map(path),
+                read_options=read_options,
+                parse_options=parse_options,
+                convert_options=convert_options,
+            )
+            for batch in reader:
+                yield batch
+        except pa.ArrowInvalid as ex:
+            raise LocalEngineError(f"Error while reading {path}: {ex}")
+
+    def get_join_index(self, join_keys: "pa.Array"):
+        """return the distinct keys of the join dataset and their number of
+        occurrences (None if the keys are unique)"""
+        value_counts = pc.value_counts(join_keys)
+        unique_keys = value_counts.field("values")
+        # with duplicated keys in the join dataset, the inner join duplicates
+        # the source rows
+        counts = None
+        if len(unique_keys) != len(join_keys):
+            counts = value_counts.field("counts").to_numpy()
+        return unique_keys, counts
+
+    def select_batch(self, batch, unique_keys: "pa.Array", counts: "np.ndarray"):
+        """return the rows of the batch (or table) whose key is in the join
+        dataset"""
+        if counts is None:
+            return batch.filter(pc.is_in(batch.column(0), value_set=unique_keys))
+        indexes = (
+            pc.index_in(batch.column(0), value_set=unique_keys).fill_null(-1).to_numpy()
+        )
+        rows = np.flatnonzero(indexes >= 0)
+        return batch.take(pa.array(np.repeat(rows, counts[indexes[rows]])))
+
+    def get_spill_partitions(self, join_size: int) -> int:
+        """return the number of partitions of the grace hash join, 0 if the
+        join dataset fits in the memory limit"""
+        if join_size <= self.memory_limit:
+            return 0
+        # each partition of the join dataset uses half of the memory limit
+        partitions = -(-join_size // max(self.memory_limit // 2, 1))
+        return min(max(partitions, 2), LocalEngineService.MAX_SPILL_PARTITIONS)
+
+    def run_arrow(self, input: PipelineRequest) -> Dict[str, int]:
+        """
+        Run the pipeline with column batches:
+            - the keys of the join dataset are loaded in an Arrow array
+              (hash table built by Arrow compute functions)
+            - the source dataset is read by batches of columns (only the
+              selected columns are converted)
+            - the rows of each batch are selected with a vectorized lookup
+              and written in bulk.
+        If the join dataset is larger than the memory limit, both datasets
+        are partitioned on disk (grace hash join), otherwise with several
+        workers the byte ranges of the source are joined in a process pool.
+        """
+        join_path = self.get_path(input.join)
+        sink_path = self.get_path(
+            input.sink, self.get_sink_file_name(input.sink.file_pattern_or_name)
+        )
+        partitions = self.get_spill_partitions(os.path.getsize(join_path))
+        os.makedirs(os.path.dirname(sink_path), exist_ok=True)
+        if not partitions and self.workers > 1:
+            return self.run_arrow_parallel(input)
+        with open(sink_path, "wb") as sink_file:
+            if input.sink.first_row_as_header:
+                self.write_arrow_header(sink_file, input.sink, input.columns)
+            if partitions:
+                metrics = self.run_arrow_partitioned(input, sink_file, partitions)
+            else:
+                metrics = self.run_arrow_in_memory(input, sink_file)
+        metrics["sink_files"] = 1
+        return metrics
+
+    def read_join_keys(self, input: PipelineRequest) -> "pa.Array":
+        """return the keys of the join dataset"""
+        join_path = self.get_path(input.join)
+        read_options, parse_options, convert_options = self.get_arrow_options(
+            input.join, [input.columns[0]]
+        )
+        try:
+            join_table = pacsv.read_csv(
+                pa.memory_map(join_path),
+                read_options=read_options,
+                parse_options=parse_options,
+                convert_options=convert_options,
+            )
+        except pa.ArrowInvalid as ex:
+            raise LocalEngineError(f"Error while reading {join_path}: {ex}")
+        return join_table.column(0).combine_chunks()
+
+    def run_arrow_in_memory(self, input: PipelineRequest, sink_file) -> Dict[str, int]:
+        # build side: join dataset
+        join_keys = self.read_join_keys(input)
+        unique_keys, counts = self.get_join_index(join_keys)
+
+        # probe side: source dataset, byte ranges scanned in parallel
+        source_rows = 0
+        sink_rows = 0
+        for range_rows, range_sink_rows, data in self.scan(
+            input, lambda batch: self.select_batch(batch, unique_keys, counts)
+        ):
+            source_rows += range_rows
+            sink_rows += range_sink_rows
+            sink_file.write(data)
+
+        return {
+            "source_rows": source_rows,
+            "join_rows": len(join_keys),
+            "sink_rows": sink_rows,
+            "spill_partitions": 0,
+            "spilled_bytes": 0,
+        }
+
+    def map_file(self, path: str) -> "pa.Buffer":
+        """return the content of the file without copy (memory-mapped)"""
+        if os.path.getsize(path) == 0:
+            return pa.py_buffer(b"")
+        with pa.memory_map(path) as file:
+            return file.read_buffer()
+
+    def get_quote_mask(
+        self, data: "np.ndarray", start: int, end: int, dataset: Dataset
+    ):
+        """return the mask of the quote characters of data[start:end] which
+        open or close a quoted value (the quotes preceded by the escape
+        character are ignored, doubled quotes open and close a value)"""
+        window = data[start:end]
+        mask = window == ord(dataset.quote_char)
+        if dataset.escape_char and dataset.escape_char != dataset.quote_char:
+            escape = ord(dataset.escape_char)
+            escaped = np.empty_like(mask)
+            escaped[0] = start > 0 and data[start - 1] == escape
+            escaped[1:] = window[:-1] == escape
+            mask &= ~escaped
+        return mask
+
+    def find_record_end(
+        self, data: "np.ndarray", position: int, in_quotes: bool, dataset: Dataset
+    ) -> int:
+        """return the position after the first new line from position which is
+        not in a quoted value, in_quotes: position is in a quoted value"""
+        while position < len(data):
+            end = min(position + LocalEngineService.RECORD_WINDOW, len(data))
+            parity = np.cumsum(self.get_quote_mask(data, position, end, dataset)) & 1
+            if in_quotes:
+                parity ^= 1
+            new_lines = np.flatnonzero((data[position:end] == 10) & (parity == 0))
+            if len(new_lines):
+                return position + int(new_lines[0]) + 1
+            in_quotes = bool(parity[-1])
+            position = end
+        return len(data)
+
+    def get_byte_ranges(
+        self, data: "np.ndarray", start: int, range_size: int, dataset: Dataset
+    ) -> List[Tuple[int, int]]:
+        """split data[start:] in ranges of about range_size bytes ending at
+        record boundaries: a new line which is not in a quoted value"""
+        ranges = []
+        while start < len(data):
+            target = start + range_size
+            if target >= len(data):
+                ranges.append((start, len(data)))
+                break
+            in_quotes = bool(
+                np.count_nonzero(self.get_quote_mask(data, start, target, dataset)) & 1
+            )
+            end = self.find_record_end(data, target, in_quotes, dataset)
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    def get_arrow_column_names(self, path: str, dataset: Dataset) -> List[str]:
+        header = self.read_header(path, dataset)
+        return [self.get_arrow_column(dataset, column) for column in header]
+
+    def scan_range(
+        self,
+        buffer: "pa.Buffer",
+        byte_range: Tuple[int, int],
+        column_names: List[str],
+        input: PipelineRequest,
+        select,
+    ) -> Tuple[int, int, bytes]:
+        """read the selected columns of the records of the byte range (the
+        Arrow reader parses the mapped buffer, only the values of the selected
+        columns are converted to strings), select the rows and return the
+        number of rows read and selected and the selected rows in CSV"""
+        start, end = byte_range
+        if start == end:
+            return 0, 0, b""
+        read_options, parse_options, convert_options = self.get_arrow_options(
+            input.source, input.columns, column_names
+        )
+        sink = io.BytesIO()
+        try:
+            # the batches of the range are selected at once: the lookup hash
+            # table of the join keys is built once per range
+            table = pacsv.open_csv(
+                pa.BufferReader(buffer.slice(start, end - start)),
+                read_options=read_options,
+                parse_options=parse_options,
+                convert_options=convert_options,
+            ).read_all()
+        except pa.ArrowInvalid as ex:
+            raise LocalEngineError(
+                f"Error while reading {self.get_path(input.source)} at offset {start}: {ex}"
+            )
+        selected = select(table)
+        if selected.num_rows:
+            self.write_arrow_batch(selected, sink, input.sink)
+        return table.num_rows, selected.num_rows, sink.getvalue()
+
+    def get_source_ranges(self, input: PipelineRequest, count: int):
+        """return the Arrow column names, the memory-mapped content and the
+        byte ranges of the source file (at least count ranges if the file is
+        larger than count batches)"""
+        source_path = self.get_path(input.source)
+        column_names = self.get_arrow_column_names(source_path, input.source)
+        if not column_names:
+            return column_names, None, []
+        buffer = self.map_file(source_path)
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        start = 0
+        if input.source.first_row_as_header:
+            start = self.find_record_end(data, 0, False, input.source)
+        range_size = min(
+            self.batch_size * LocalEngineService.RANGE_BATCHES,
+            max(-(-(len(data) - start) // count), self.batch_size),
+        )
+        return (
+            column_names,
+            buffer,
+            self.get_byte_ranges(data, start, range_size, input.source),
+        )
+
+    def scan(self, input: PipelineRequest, select):
+        """scan the memory-mapped source file by byte ranges in a thread pool
+        (Arrow releases the GIL), yield the results of scan_range in the
+        order of the ranges"""
+        column_names, buffer, ranges = self.get_source_ranges(input, self.scan_threads)
+        with ThreadPoolExecutor(max_workers=self.scan_threads) as executor:
+            # at most two ranges per thread in memory
+            futures = []
+            for byte_range in ranges:
+                futures.append(
+                    executor.submit(
+                        self.scan_range,
+                        buffer,
+                        byte_range,
+                        column_names,
+                        input,
+                        select,
+                    )
+                )
+                if len(futures) >= 2 * self.scan_threads:
+                    yield futures.pop(0).result()
+            for future in futures:
+                yield future.result()
+
+    def write_join_index(self, join_keys: "pa.Array", folder: str) -> str:
+        """write the join index (distinct keys and their number of occurrences)
+        in an Arrow IPC file mapped read-only by the workers"""
+        unique_keys, counts = self.get_join_index(join_keys)
+        columns = [unique_keys] if counts is None else [unique_keys, pa.array(counts)]
+        names = ["keys"] if counts is None else ["keys", "counts"]
+        table = pa.Table.from_arrays(columns, names=names)
+        path = os.path.join(folder, "join-index.arrow")
+        with pa.OSFile(path, "wb") as file:
+            with pa.ipc.new_file(file, table.schema) as writer:
+                writer.write_table(table)
+        return path
+
+    def run_arrow_parallel(self, input: PipelineRequest) -> Dict[str, int]:
+        """
+        Join the byte ranges of the source file in a process pool:
+            - the join index is written once in shared memory (/dev/shm) and
+              memory-mapped read-only by each worker
+            - each worker scans its byte range of the memory-mapped source
+              file and writes the selected rows in its own sink file,
+              named with the Data Factory partition suffix (-00001, -00002...)
+        """
+        join_keys = self.read_join_keys(input)
+        column_names, _, ranges = self.get_source_ranges(input, self.workers)
+        if not ranges:
+            # empty source file: one sink file with the header
+            ranges = [(0, 0)]
+        shared_folder = "/dev/shm" if os.path.isdir("/dev/shm") else self.spill_folder
+        with tempfile.TemporaryDirectory(
+            prefix="join-index-", dir=shared_folder
+        ) as folder:
+            index_path = self.write_join_index(join_keys, folder)
+            engine_options = {
+                "root": self.root,
+                "batch_size": self.batch_size,
+            }
+            tasks = [
+                (
+                    input,
+                    column_names,
+                    byte_range,
+                    self.get_path(
+                        input.sink,
+                        self.get_sink_file_name(input.sink.file_pattern_or_name, index),
+                    ),
+                )
+                for index, byte_range in enumerate(ranges, start=1)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialize_worker,
+                initargs=(engine_options, index_path),
+            ) as executor:
+                results = list(executor.map(_run_worker_task, tasks))
+
+        return {
+            "source_rows": sum(result[0] for result in results),
+            "join_rows": len(join_keys),
+            "sink_rows": sum(result[1] for result in results),
+            "spill_partitions": 0,
+            "spilled_bytes": 0,
+            "sink_files": len(results),
+            "workers": self.workers,
+        }
+
+    def spill_batches(self, batches, folder: str, partitions: int) -> int:
+        """write the rows of the batches in one Arrow IPC file per partition
+        of the key hash, return the number of rows"""
+        rows = 0
+        writers = {}
+        try:
+            for batch in batches:
+                rows += batch.num_rows
+                partition_ids = _hash_partitions(batch.column(0), partitions)
+                order = np.argsort(partition_ids, kind="stable")
+                bounds = np.searchsorted(
+                    partition_ids[order], np.arange(partitions + 1)
+                )
+                batch = batch.take(pa.array(order))
+                for partition in np.flatnonzero(np.diff(bounds)):
+                    if partition not in writers:
+                        writers[partition] = pa.ipc.new_stream(
+                            os.path.join(folder, f"{partition}.arrow"), batch.schema
+                        )
+                    writers[partition].write_batch(
+                        batch.slice(
+                            bounds[partition], bounds[partition + 1] - bounds[partition]
+                        )
+                    )
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return rows
+
+    def run_arrow_partitioned(
+        self, input: PipelineRequest, sink_file, partitions: int
+    ) -> Dict[str, int]:
+        """
+        Grace hash join: the join keys and the source rows are partitioned by
+        key hash in temporary files, then each partition of the join dataset
+        is loaded in memory and joined with the same partition of the source.
+        The sink rows are written partition by partition.
+        """
+        key = input.columns[0]
+        with tempfile.TemporaryDirectory(
+            prefix="spill-", dir=self.spill_folder
+        ) as folder:
+            join_folder = os.path.join(folder, "join")
+            source_folder = os.path.join(folder, "source")
+            os.makedirs(join_folder)
+            os.makedirs(source_folder)
+            join_rows = self.spill_batches(
+                self.read_arrow_batches(self.get_path(input.join), input.join, [key]),
+                join_folder,
+                partitions,
+            )
+            source_rows = self.spill_batches(
+                self.read_arrow_batches(
+                    self.get_path(input.source), input.source, input.columns
+                ),
+                source_folder,
+                partitions,
+            )
+            spilled_bytes = sum(
+                os.path.getsize(os.path.join(path, name))
+                for path in [join_folder, source_folder]
+                for name in os.listdir(path)
+            )
+
+            sink_rows = 0
+            for partition in range(partitions):
+                join_file = os.path.join(join_folder, f"{partition}.arrow")
+                source_file = os.path.join(source_folder, f"{partition}.arrow")
+                if not os.path.exists(join_file) or not os.path.exists(source_file):
+                    continue
+                with pa.OSFile(join_file) as file:
+                    join_keys = (
+                        pa.ipc.open_stream(file).read_all().column(0).combine_chunks()
+                    )
+                unique_keys, counts = self.get_join_index(join_keys)
+                with pa.OSFile(source_file) as file:
+                    for batch in pa.ipc.open_stream(file):
+                        selected = self.select_batch(batch, unique_keys, counts)
+                        if selected.num_rows:
+                            self.write_arrow_batch(selected, sink_file, input.sink)
+                            sink_rows += selected.num_rows
+
+        return {
+            "source_rows": source_rows,
+            "join_rows": join_rows,
+            "sink_rows": sink_rows,
+            "spill_partitions": partitions,
+            "spilled_bytes": spilled_bytes,
+        }
+
+    def write_arrow_header(self, sink_file, dataset: Dataset, columns: List[str]):
+        text = io.StringIO()
+        csv.writer(text, **self.get_csv_format(dataset)).writerow(columns)
+        sink_file.write(text.getvalue().encode())
+
+    def run_csv(self, input: PipelineRequest) -> Dict[str, int]:
+        """
+        Run the pipeline row by row with the csv module: build a hash table with
+        the keys of the join dataset and stream the source dataset through the
+        hash table into the sink dataset.
+        Used when some selected columns are in the join dataset.
+        """
+        key = input.columns[0]
+        source_path = self.get_path(input.source)
+        join_path = self.get_path(input.join)
+        sink_path = self.get_path(
+            input.sink, self.get_sink_file_name(input.sink.file_pattern_or_name)
+        )
+
+        # build side: join dataset
+        join_format = self.get_csv_format(input.join)
+        with open(join_path, newline="") as join_file:
+            reader = csv.reader(join_file, **join_format)
+            join_header, first_row = self.get_header(reader, input.join)
+            join_key_index = self.get_column_index(join_header, key, join_path)
+            # columns selected from the join dataset when they are not in the
+            # source dataset are stored in the hash table with the key
+            join_rows = 0
+            table: Dict[str, List[List[str]]] = {}
+            join_columns = [
+                column for column in input.columns[1:] if column in join_header
+            ]
+            join_column_indexes = [join_header.index(c) for c in join_columns]
+            rows = reader if first_row is None else _prepend(first_row, reader)
+            for row in rows:
+                if not row:
+                    continue
+                join_rows += 1
+                table.setdefault(row[join_key_index], []).append(
+                    [row[i] for i in join_column_indexes]
+                )
+
+        # probe side: source dataset
+        source_format = self.get_csv_format(input.source)
+        sink_format = self.get_csv_format(input.sink)
+        os.makedirs(os.path.dirname(sink_path), exist_ok=True)
+        source_rows = 0
+        sink_rows = 0
+        with open(source_path, newline="") as source_file, open(
+            sink_path, "w", newline=""
+        ) as sink_file:
+            reader = csv.reader(source_file, **source_format)
+            writer = csv.writer(sink_file, **sink_format)
+            source_header, first_row = self.get_header(reader, input.source)
+            source_key_index = self.get_column_index(source_header, key, source_path)
+            # for each selected column: (True, index in the source row) or
+            # (False, index in the join values)
+            selection = []
+            for column in input.columns[1:]:
+                if column in source_header:
+                    selection.append((True, source_header.index(column)))
+                elif column in join_columns:
+                    selection.append((False, join_columns.index(column)))
+                else:
+                    raise LocalEngineError(
+                        f"Column '{column}' not found in {source_path} and {join_path}"
+                    )
+            if input.sink.first_row_as_header:
+                writer.writerow(input.columns)
+            rows = reader if first_row is None else _prepend(first_row, reader)
+            for row in rows:
+                if not row:
+                    continue
+                source_rows += 1
+                matches = table.get(row[source_key_index])
+                if matches is None:
+                    continue
+                for join_values in matches:
+                    writer.writerow(
+                        [row[source_key_index]]
+                        + [
+                            row[index] if from_source else join_values[index]
+                            for from_source, index in selection
+                        ]
+                    )
+                    sink_rows += 1
+
+        return {
+            "source_rows": source_rows,
+            "join_rows": join_rows,
+            "sink_rows": sink_rows,
+            "sink_files": 1,
+        }
+
+
+def _prepend(first_row: List[str], rows):
+    yield first_row
+    yield from rows
+
+
+# state of the process pool workers: engine and join index
+_worker = {}
+
+
+def _initialize_worker(engine_options: Dict[str, object], index_path: str):
+    """load the join index once per worker (mapped without copy)"""
+    with pa.memory_map(index_path) as file:
+        table = pa.ipc.open_file(file).read_all()
+    _worker["engine"] = LocalEngineService(**engine_options)
+    _worker["keys"] = table.column("keys").combine_chunks()
+    _worker["counts"] = (
+        table.column("counts").to_numpy() if "counts" in table.column_names else None
+    )
+
+
+def _run_worker_task(task) -> Tuple[int, int]:
+    """join a byte range of the source file, write the sink partition file and
+    return the number of rows read and written"""
+    input, column_names, byte_range, sink_path = task
+    engine = _worker["engine"]
+    buffer = engine.map_file(engine.get_path(input.source))
+    source_rows, sink_rows, data = engine.scan_range(
+        buffer,
+        byte_range,
+        column_names,
+        input,
+        lambda batch: engine.select_batch(batch, _worker["keys"], _worker["counts"]),
+    )
+    with open(sink_path, "wb") as sink_file:
+        if input.sink.first_row_as_header:
+            engine.write_arrow_header(sink_file, input.sink, input.columns)
+        sink_file.write(data)
+    return source_rows, sink_rows
+
+
+def _hash_partitions(array, partitions: int) -> "np.ndarray":
+    """return the partition of each value of a string array: polynomial hash
+    of the UTF-8 bytes computed with numpy on the Arrow buffers (the same
+    value in both datasets always goes to the same partition)"""
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    _, offsets_buffer, data_buffer = array.buffers()
+    offsets = np.frombuffer(offsets_buffer, dtype=np.int32)[
+        array.offset: array.offset + len(array) + 1
+    ].astype(np.int64)
+    if data_buffer is None or offsets[-1] == offsets[0]:
+        return np.zeros(len(array), dtype=np.int64)
+    data = np.frombuffer(data_buffer, dtype=np.uint8)[offsets[0]: offsets[-1]]
+    offsets = offsets - offsets[0]
+    lengths = np.diff(offsets)
+    positions = np.arange(len(data)) - np.repeat(offsets[:-1], lengths)
+    powers = np.cumprod(
+        np.full(int(lengths.max()), 1099511628211, dtype=np.uint64), dtype=np.uint64
+    )
+    with np.errstate(over="ignore"):
+        values = (data.astype(np.uint64) + np.uint64(1)) * powers[positions]
+        sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(values)])
+        hashes = sums[offsets[1:]] - sums[offsets[:-1]]
+        # finalizer (mixes the high bits into the low bits)
+        hashes ^= hashes >> np.uint64(33)
+        hashes *= np.uint64(0xFF51AFD7ED558CCD)
+        hashes ^= hashes >> np.uint64(33)
+    return (hashes % np.uint64(partitions)).astype(np.int64)
@@ -0,0 +1,281 @@
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from src.factory_service import (
+    FactoryService,
+    FactoryServiceError,
+    get_configuration_service,
+    get_log_service,
+)
+from src.local_engine_service import LocalEngineError, LocalEngineService
+from src.models import (
+    GarbageCollectionReport,
+    GarbageCollectionRequest,
+    PipelineRequest,
+    PipelineResponse,
+    RunResponse,
+    Status,
+)
+from src.run_poller_service import RunPollerService
+from src.schema_service import LocalHeadReader, SchemaService
+
+
+class LocalRun(BaseModel):
+    run_id: str
+    pipeline_name: str
+    status: Status
+    start: datetime
+    end: Optional[datetime] = None
+    duration: int = 0
+    message: str = ""
+    metrics: Dict[str, int] = {}
+
+
+class LocalFactoryService(FactoryService):
+    """Class used to implement the datafactory service with the local engine
+
+    The pipelines and the runs are stored in json files under {root}/.factory
+    so that they are shared by all the workers of the node.
+    The runs are executed in a background thread of the worker which launched
+    the run.
+    """
+
+    RUN_PREFIX = "local-"
+    METADATA_FOLDER = ".factory"
+    PIPELINES_FOLDER = "pipelines"
+    RUNS_FOLDER = "runs"
+
+    def __init__(
+        self,
+        root: str,
+        resource_group_name: str = "",
+        engine: str = LocalEngineService.ARROW_ENGINE,
+        batch_size: int = 4 << 20,
+        memory_limit: int = 1 << 30,
+        spill_folder: str = None,
+        scan_threads: int = 0,
+        workers: int = 1,
+    ):  # pragma: no cover
+        self.root = root
+        self.resource_group_name = resource_group_name
+        self.datafactory_name = "local"
+        self.engine = LocalEngineService(
+            root,
+            engine=engine,
+            batch_size=batch_size,
+            memory_limit=memory_limit,
+            spill_folder=spill_folder,
+            scan_threads=scan_threads,
+            workers=workers,
+        )
+
+    def initialize_azure_clients(self) -> bool:
+        return True
+
+    def get_schema_service(self) -> SchemaService:
+        return SchemaService(
+            LocalHeadReader(self.root),
+            size=get_configuration_service().get_preflight_size(),
+        )
+
+    def collect_garbage(
+        self, request: GarbageCollectionRequest
+    ) -> GarbageCollectionReport:
+        raise HTTPException(
+            status_code=400,
+            detail="Garbage collection not supported by the local backend",
+        )
+
+    def poll_runs(self, poller: RunPollerService, ttl: float) -> List[RunResponse]:
+        # the status of the local runs is read from the files of the node
+        return []
+
+    def get_pipeline_names(self) -> List[str]:
+        folder = os.path.dirname(self.get_pipeline_path(""))
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            file_name[: -len(".json")]
+            for file_name in os.listdir(folder)
+            if file_name.startswith(FactoryService.PIPELINE_PREFIX)
+            and file_name.endswith(".json")
+        )
+
+    def delete_pipeline(self, pipeline_name: str) -> List[str]:
+        try:
+            os.remove(self.get_pipeline_path(pipeline_name))
+        except OSError as ex:
+            return [str(ex)]
+        return []
+
+    def get_pipeline_path(self, pipeline_name: str) -> str:
+        return os.path.join(
+            self.root,
+            LocalFactoryService.METADATA_FOLDER,
+            LocalFactoryService.PIPELINES_FOLDER,
+            f"{os.path.basename(pipeline_name)}.json",
+        )
+
+    def get_run_path(self, run_id: str) -> str:
+        return os.path.join(
+            self.root,
+            LocalFactoryService.METADATA_FOLDER,
+            LocalFactoryService.RUNS_FOLDER,
+            f"{os.path.basename(run_id)}.json",
+        )
+
+    def write_json(self, path: str, model: BaseModel):
+        """write the model in a json file, readers never see a partial file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(model.json())
+        os.replace(temp_path, path)
+
+    def get_pipeline_request(self, pipeline_name: str) -> PipelineRequest:
+        path = self.get_pipeline_path(pipeline_name)
+        if not os.path.exists(path):
+            return None
+        return PipelineRequest.parse_file(path)
+
+    def get_local_run(self, run_id: str) -> LocalRun:
+        path = self.get_run_path(run_id)
+        if not os.path.exists(path):
+            return None
+        return LocalRun.parse_file(path)
+
+    def create_data_flow(
+        self,
+        input: PipelineRequest,
+    ) -> PipelineResponse:
+        pipeline_id = self.get_hash(input)
+        pipeline_name = f"{FactoryService.PIPELINE_PREFIX}{pipeline_id}"
+        try:
+            self.engine.validate(input)
+        except LocalEngineError as ex:
+            return self.create_pipeline_response(
+                pipeline_request=input,
+                pipeline_name=pipeline_name,
+                error_code=FactoryServiceError.LOCAL_ENGINE_ERROR,
+                error_message=f"Pipeline not supported by the local engine: {ex}",
+            )
+        self.write_json(self.get_pipeline_path(pipeline_name), input)
+        return self.create_pipeline_response(
+            pipeline_request=input,
+            pipeline_name=pipeline_name,
+            error_code=FactoryServiceError.NO_ERROR,
+            error_message="",
+        )
+
+    def get_data_flow(
+        self,
+        pipeline_name: str,
+    ) -> PipelineResponse:
+        pipeline_request = self.get_pipeline_request(pipeline_name)
+        if pipeline_request is None:
+            raise HTTPException(
+                status_code=404, detail=f"Pipeline {pipeline_name} not found"
+            )
+        return self.create_pipeline_response(
+            pipeline_request=pipeline_request,
+            pipeline_name=pipeline_name,
+            error_code=FactoryServiceError.NO_ERROR,
+            error_message="",
+        )
+
+    def create_run(
+        self,
+        pipeline_name: str,
+        parameters: Dict[str, str],
+    ) -> RunResponse:
+        pipeline_request = self.get_pipeline_request(pipeline_name)
+        if pipeline_request is None:
+            return self.create_run_response(
+                run_id="",
+                pipeline_name=pipeline_name,
+                status=Status.FAILED,
+                start=datetime.utcnow(),
+                end=datetime.utcnow(),
+                duration_in_ms=0,
+                error_code=FactoryServiceError.RUN_PIPELINE_ERROR,
+                error_message=f"Run pipeline error: pipeline {pipeline_name} not found",
+            )
+
+        local_run = LocalRun(
+            run_id=f"{LocalFactoryService.RUN_PREFIX}{uuid.uuid4()}",
+            pipeline_name=pipeline_name,
+            status=Status.QUEUED,
+            start=datetime.utcnow(),
+        )
+        self.write_json(self.get_run_path(local_run.run_id), local_run)
+        thread = threading.Thread(
+            target=self.execute_run,
+            args=(local_run, pipeline_request),
+            daemon=True,
+        )
+        thread.start()
+        return self.create_run_response(
+            run_id=local_run.run_id,
+            pipeline_name=pipeline_name,
+            status=Status.IN_PROGRESS,
+            start=local_run.start,
+            end=datetime.utcnow(),
+            duration_in_ms=0,
+            error_code=FactoryServiceError.NO_ERROR,
+            error_message="",
+        )
+
+    def execute_run(self, local_run: LocalRun, pipeline_request: PipelineRequest):
+        """execute the run and store its status"""
+        local_run.status = Status.IN_PROGRESS
+        self.write_json(self.get_run_path(local_run.run_id), local_run)
+        try:
+            local_run.metrics = self.engine.run(pipeline_request)
+            local_run.status = Status.SUCCEEDED
+        except Exception as ex:
+            get_log_service().log_error(
+                f"EXCEPTION in local run {local_run.run_id}: {ex}"
+            )
+            local_run.status = Status.FAILED
+            local_run.message = f"Local run exception: {ex}"
+        local_run.end = datetime.utcnow()
+        local_run.duration = int(
+            (local_run.end - local_run.start).total_seconds() * 1000
+        )
+        self.write_json(self.get_run_path(local_run.run_id), local_run)
+        get_log_service().log_information(
+            f"Local run {local_run.run_id} status: {local_run.status} metrics: {local_run.metrics}"
+        )
+
+    def get_run_data_flow_status(self, pipeline_name: str, run_id: str) -> RunResponse:
+        local_run = self.get_local_run(run_id)
+        if local_run is None or local_run.pipeline_name != pipeline_name:
+            pipeline_id = pipeline_name.replace(FactoryService.PIPELINE_PREFIX, "")
+            return self.create_run_response(
+                run_id=run_id,
+                pipeline_name=pipeline_name,
+                status=Status.FAILED,
+                start=datetime.utcnow(),
+                end=datetime.utcnow(),
+                duration_in_ms=0,
+                error_code=FactoryServiceError.PIPELINE_ID_NOT_FOUND,
+                error_message=f"Pipeline id '{pipeline_id}' not found",
+            )
+        run_response = self.create_run_response(
+            run_id=run_id,
+            pipeline_name=pipeline_name,
+            status=local_run.status,
+            start=local_run.start,
+            end=datetime.utcnow() if local_run.end is None else local_run.end,
+            duration_in_ms=local_run.duration,
+            error_code=FactoryServiceError.NO_ERROR,
+            error_message=local_run.message,
+            metrics=local_run.metrics if local_run.metrics else None,
+        )
+        self.get_registry().update_status(run_id, run_response.status.status)
+        return run_response
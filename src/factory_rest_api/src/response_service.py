@@ -0,0 +1,192 @@
+import zlib
+from typing import Any, Optional
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def default(o: Any) -> Any:
+    """encode the objects not supported natively by orjson"""
+    if isinstance(o, BaseModel):
+        return o.dict()
+    if isinstance(o, bytes):
+        return o.decode("utf-8")
+    raise TypeError(f"Type {type(o)} not serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """encode the content in a single pass: the pydantic models, enums and
+    datetimes are encoded by orjson without the intermediate copy of
+    jsonable_encoder"""
+    return orjson.dumps(content, default=default, option=ORJSON_OPTIONS)
+
+
+class FactoryJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, the content can be a pydantic model"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def get_response(content: Optional[BaseModel]) -> FactoryJSONResponse:
+    """return the response of a route: the model returned by the services is
+    encoded directly (no validation and no copy by FastAPI)"""
+    return FactoryJSONResponse(content)
+
+
+async def http_exception_handler(
+    request: Request, exc: HTTPException
+) -> FactoryJSONResponse:
+    """encode the HTTPException detail (string or Error) in a single pass"""
+    headers = getattr(exc, "headers", None)
+    return FactoryJSONResponse(
+        {"detail": exc.detail}, status_code=exc.status_code, headers=headers
+    )
+
+
+def get_accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """return the encoding negotiated with the Accept-Encoding header: brotli
+    if the brotli module is installed, gzip otherwise"""
+    qualities = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip()] = quality
+    encodings = [BROTLI, GZIP] if brotli is not None else [GZIP]
+    accepted = [
+        encoding
+        for encoding in encodings
+        if qualities.get(encoding, qualities.get("*", 0.0)) > 0
+    ]
+    if not accepted:
+        return None
+    return max(accepted, key=lambda encoding: qualities.get(encoding, 0.0))
+
+
+class Compressor:
+    """incremental gzip or brotli compressor"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self.compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self.compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == BROTLI:
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressionMiddleware:
+    """Compress the responses larger than minimum_size with the encoding
+    accepted by the client (brotli or gzip)"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = get_accepted_encoding(
+                Headers(scope=scope).get("Accept-Encoding", "")
+            )
+            if encoding is not None:
+                responder = CompressionResponder(self, encoding, send)
+                await self.app(scope, receive, responder.send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: str, send: Send
+    ) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.next_send = send
+        self.initial_message: Message = {}
+        self.compressor: Optional[Compressor] = None
+        self.started = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # sent with the first body once the headers are known
+            self.initial_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.next_send(message)  # pragma: no cover
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            if (
+                len(body) < self.middleware.minimum_size and not more_body
+            ) or "content-encoding" in headers:
+                await self.next_send(self.initial_message)
+                await self.next_send(message)
+                return
+            self.compressor = Compressor(
+                self.encoding,
+                self.middleware.gzip_level,
+                self.middleware.brotli_quality,
+            )
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            data = self.compressor.compress(body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                data += self.compressor.flush()
+                headers["Content-Length"] = str(len(data))
+            message["body"] = data
+            await self.next_send(self.initial_message)
+            await self.next_send(message)
+            return
+        if self.compressor is None:
+            await self.next_send(message)
+            return
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.flush()
+        message["body"] = data
+        await self.next_send(message)
@@ -0,0 +1,145 @@
+from typing import Dict, Optional
+
+from src.backend_router_service import (
+    BackendRouterService,
+    get_blob_dataset_size,
+    get_local_dataset_size,
+)
+from src.factory_service import FactoryService, FactoryServiceError, get_log_service
+from src.local_engine_service import LocalEngineError
+from src.local_factory_service import LocalFactoryService
+from src.models import (
+    Backend,
+    Dataset,
+    PipelineRequest,
+    PipelineResponse,
+    RoutingDecision,
+    RunResponse,
+    Status,
+)
+from src.run_registry_service import ACTIVE_STATUSES
+
+
+class RoutingFactoryService(FactoryService):
+    """Class used to dispatch each run to Data Factory or to the local backend
+
+    The pipelines are created on both backends (on Data Factory only if the
+    local engine doesn't support them) and each run is launched on the backend
+    with the lowest estimated duration for the size of the input datasets.
+    """
+
+    def __init__(
+        self,
+        subscription_id: str,
+        resource_group_name: str,
+        datafactory_name: str,
+        source_linked_service: str,
+        sink_linked_service: str,
+        local_factory_service: LocalFactoryService,
+        router: BackendRouterService,
+    ):  # pragma: no cover
+        super().__init__(
+            subscription_id=subscription_id,
+            resource_group_name=resource_group_name,
+            datafactory_name=datafactory_name,
+            source_linked_service=source_linked_service,
+            sink_linked_service=sink_linked_service,
+        )
+        self.local = local_factory_service
+        self.router = router
+
+    def create_data_flow(
+        self,
+        input: PipelineRequest,
+    ) -> PipelineResponse:
+        pipeline_response = super().create_data_flow(input)
+        if pipeline_response.error.code == FactoryServiceError.NO_ERROR:
+            local_response = self.local.create_data_flow(input)
+            if local_response.error.code != FactoryServiceError.NO_ERROR:
+                get_log_service().log_information(
+                    f"Pipeline {pipeline_response.pipeline_name} runs on Data Factory only: {local_response.error.message}"
+                )
+        return pipeline_response
+
+    def get_dataset_size(self, dataset: Dataset) -> Optional[int]:
+        """return the size of the local files of the dataset, the size of the
+        blobs if the files are not available locally"""
+        size = get_local_dataset_size(self.local.root, dataset)
+        if size is None:
+            size = get_blob_dataset_size(dataset)
+        return size
+
+    def get_routing_decision(self, pipeline_name: str) -> RoutingDecision:
+        pipeline_request = self.local.get_pipeline_request(pipeline_name)
+        if pipeline_request is None:
+            return self.router.choose(None, local_available=False)
+        reason = None
+        try:
+            # pipeline stored before a change of the local engine
+            self.local.engine.validate(pipeline_request)
+        except LocalEngineError as ex:
+            reason = f"Pipeline not supported by the local engine: {ex}"
+        local_sizes = [
+            get_local_dataset_size(self.local.root, dataset)
+            for dataset in [pipeline_request.source, pipeline_request.join]
+        ]
+        if reason is None and None in local_sizes:
+            reason = "Input datasets not available on the local backend"
+        if reason is not None:
+            sizes = [
+                self.get_dataset_size(dataset)
+                for dataset in [pipeline_request.source, pipeline_request.join]
+            ]
+            return self.router.choose(
+                sum(size for size in sizes if size is not None),
+                local_available=False,
+                reason=reason,
+            )
+        return self.router.choose(sum(local_sizes), local_available=True)
+
+    def create_run(
+        self,
+        pipeline_name: str,
+        parameters: Dict[str, str],
+    ) -> RunResponse:
+        decision = self.get_routing_decision(pipeline_name)
+        if decision.backend == Backend.LOCAL:
+            run_response = self.local.create_run(pipeline_name, parameters)
+        else:
+            run_response = super().create_run(pipeline_name, parameters)
+        if run_response.error.code == FactoryServiceError.NO_ERROR:
+            self.router.register_run(run_response.run_id, decision)
+        get_log_service().log_information(
+            f"Run {run_response.run_id} of pipeline {pipeline_name} routed to {decision.backend}: {decision.reason} {decision.estimated_durations}"
+        )
+        run_response.routing = decision
+        return run_response
+
+    def get_run_data_flow_status(self, pipeline_name: str, run_id: str) -> RunResponse:
+        if run_id.startswith(LocalFactoryService.RUN_PREFIX):
+            return self.local.get_run_data_flow_status(pipeline_name, run_id)
+        return super().get_run_data_flow_status(pipeline_name, run_id)
+
+    def run_status(self, pipeline_name: str, run_id: str) -> RunResponse:
+        run_response = super().run_status(pipeline_name, run_id)
+        # status read from the backend, the cache or the run poller
+        if (
+            run_response is not None
+            and run_response.error.code == FactoryServiceError.NO_ERROR
+        ):
+            self.observe_run(run_response)
+        return run_response
+
+    def observe_run(self, run_response: RunResponse):
+        """learn from the duration of a succeeded run registered by the
+        worker, forget the other completed runs"""
+        if run_response.status.status in ACTIVE_STATUSES:
+            return
+        if run_response.status.status != Status.SUCCEEDED:
+            self.router.forget(run_response.run_id)
+            return
+        model = self.router.observe(run_response.run_id, run_response.status.duration)
+        if model is not None:
+            get_log_service().log_information(
+                f"Backend {model.backend} model: startup {model.startup:.1f} s throughput {model.throughput:.0f} bytes/s ({model.samples} runs)"
+            )
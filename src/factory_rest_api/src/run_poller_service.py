@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from src.cache_service import CacheService
+from src.import_service import ImportService
+from src.models import RunResponse, Status
+
+# imported on first use (see ImportService)
+adf_models = ImportService.lazy_import("azure.mgmt.datafactory.models")
+
+# statuses of the runs in Data Factory
+ACTIVE_STATUSES = [Status.QUEUED, Status.IN_PROGRESS]
+COMPLETED_STATUSES = [Status.SUCCEEDED, Status.FAILED]
+
+
+class RunPollerService:
+    """Class used by the leader to poll the status of the runs of the factory
+    and publish them in the shared cache read by all the workers
+
+    Two queries per poll whatever the number of replicas and workers:
+        - the active runs (Queued, InProgress) updated within the window
+        - the runs completed since the previous poll
+    """
+
+    def __init__(
+        self, window: timedelta, interval: float, pipeline_prefix: str
+    ) -> None:
+        # the active runs not updated within the window are not polled
+        self.window = window
+        self.interval = interval
+        # only the pipelines created by the service are polled
+        self.pipeline_prefix = pipeline_prefix
+        # date of the previous poll of each factory
+        self.last_polls: Dict[str, datetime] = {}
+
+    def query_runs(
+        self,
+        factory_service,
+        last_updated_after: datetime,
+        now: datetime,
+        statuses: List[Status],
+    ) -> Iterator:
+        """return the runs of the factory with the statuses, page by page"""
+        continuation_token = None
+        while True:
+            response = factory_service.adf_client.pipeline_runs.query_by_factory(
+                factory_service.resource_group_name,
+                factory_service.datafactory_name,
+                adf_models.RunFilterParameters(
+                    last_updated_after=last_updated_after,
+                    last_updated_before=now,
+                    continuation_token=continuation_token,
+                    filters=[
+                        adf_models.RunQueryFilter(
+                            operand="Status",
+                            operator="In",
+                            values=[status.value for status in statuses],
+                        )
+                    ],
+                ),
+            )
+            yield from response.value or []
+            continuation_token = response.continuation_token
+            if not continuation_token:
+                return
+
+    def get_run_response(
+        self, factory_service, pipeline_run, now: datetime
+    ) -> RunResponse:
+        return factory_service.create_run_response(
+            run_id=pipeline_run.run_id,
+            pipeline_name=pipeline_run.pipeline_name,
+            status=pipeline_run.status,
+            start=pipeline_run.run_start or now,
+            end=pipeline_run.run_end or now,
+            duration_in_ms=pipeline_run.duration_in_ms or 0,
+            error_code=0,
+            error_message=pipeline_run.message or "",
+        )
+
+    def poll(
+        self, factory_service, cache: CacheService, ttl: float
+    ) -> List[RunResponse]:
+        """publish the status of the active runs and of the runs completed
+        since the previous poll, the status of an active run expires after
+        ttl seconds (lease of the leader) if it's no more polled"""
+        now = datetime.utcnow()
+        factory = (
+            f"{factory_service.resource_group_name}/{factory_service.datafactory_name}"
+        )
+        last_poll = self.last_polls.get(factory)
+        # overlap with the previous poll (runs updated during the query), the
+        # first poll of a new leader covers the lease of the former leader
+        completed_after = (
+            now - timedelta(seconds=ttl + self.interval)
+            if last_poll is None
+            else last_poll - timedelta(seconds=self.interval)
+        )
+        run_responses = []
+        for last_updated_after, statuses in [
+            (now - self.window, ACTIVE_STATUSES),
+            (completed_after, COMPLETED_STATUSES),
+        ]:
+            for pipeline_run in self.query_runs(
+                factory_service, last_updated_after, now, statuses
+            ):
+                if not pipeline_run.pipeline_name.startswith(self.pipeline_prefix):
+                    continue
+                run_response = self.get_run_response(factory_service, pipeline_run, now)
+                cache.publish_run(run_response, ttl)
+                run_responses.append(run_response)
+        self.last_polls[factory] = now
+        return run_responses
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+from src.models import Status
+
+ACTIVE_STATUSES = [Status.QUEUED, Status.IN_PROGRESS, Status.PENDING]
+
+
+class RunRecord(BaseModel):
+    run_id: str
+    pipeline_name: str
+    run_key: str
+    idempotency_key: Optional[str] = None
+    status: Status
+    created: float
+    updated: float
+
+
+class RunLock:
+    """Lock serializing the check and the creation of the runs of a run key
+
+    The lock is kept in the table while requests use it: it is removed by the
+    last request releasing it.
+    """
+
+    def __init__(self, run_key: str) -> None:
+        self.run_key = run_key
+        self.lock = threading.Lock()
+        # requests holding or waiting for the lock
+        self.users = 0
+
+    def __enter__(self) -> "RunLock":
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.lock.release()
+        with RunRegistryService._lock:
+            self.users -= 1
+            if (
+                self.users <= 0
+                and RunRegistryService._run_locks.get(self.run_key) is self
+            ):
+                del RunRegistryService._run_locks[self.run_key]
+
+
+class RunRegistryService:
+    """Class used to track the runs launched by this process (in-flight run table)
+
+    The table is shared by all the instances of the class as a new
+    FactoryService is created for each HTTP request.
+    """
+
+    _lock = threading.RLock()
+    _run_locks: Dict[str, RunLock] = {}
+    _runs: Dict[str, RunRecord] = {}
+    _active_runs: Dict[str, str] = {}
+    _idempotency_keys: Dict[str, str] = {}
+    # time.time() of the last purge
+    _purged = 0.0
+
+    def __init__(self, ttl: int = 86400, purge_interval: int = 60) -> None:
+        self.ttl = ttl
+        # the expired records are purged at most once per interval
+        self.purge_interval = purge_interval
+
+    def lock(self, run_key: str) -> RunLock:
+        """return the lock used to serialize the check and the creation of a run"""
+        with RunRegistryService._lock:
+            run_lock = RunRegistryService._run_locks.get(run_key)
+            if run_lock is None:
+                run_lock = RunLock(run_key)
+                RunRegistryService._run_locks[run_key] = run_lock
+            run_lock.users += 1
+            return run_lock
+
+    def get_run_key(self, pipeline_name: str, parameters: Dict[str, str]) -> str:
+        """return the key identifying a run of a pipeline with its parameters"""
+        text = f"{pipeline_name}-{json.dumps(parameters, sort_keys=True)}"
+        return hashlib.md5(text.encode()).hexdigest()
+
+    def get_idempotency_key(self, pipeline_name: str, idempotency_key: str) -> str:
+        return f"{pipeline_name}-{idempotency_key}"
+
+    def is_expired(self, record: RunRecord) -> bool:
+        return time.time() - record.created > self.ttl
+
+    def purge(self):
+        """remove the expired records from the table"""
+        with RunRegistryService._lock:
+            RunRegistryService._purged = time.time()
+            for run_id in [
+                run_id
+                for run_id, record in RunRegistryService._runs.items()
+                if self.is_expired(record)
+            ]:
+                self.remove_run(run_id)
+
+    def get_run(self, run_id: str) -> Optional[RunRecord]:
+        with RunRegistryService._lock:
+            return RunRegistryService._runs.get(run_id)
+
+    def find_active_run(
+        self, pipeline_name: str, parameters: Dict[str, str]
+    ) -> Optional[RunRecord]:
+        """return the Queued/InProgress run of the pipeline with the same parameters"""
+        run_key = self.get_run_key(pipeline_name, parameters)
+        with RunRegistryService._lock:
+            run_id = RunRegistryService._active_runs.get(run_key)
+            if run_id is None:
+                return None
+            record = RunRegistryService._runs.get(run_id)
+            if (
+                record is None
+                or record.status not in ACTIVE_STATUSES
+                or self.is_expired(record)
+            ):
+                RunRegistryService._active_runs.pop(run_key, None)
+                return None
+            return record
+
+    def find_run_by_idempotency_key(
+        self, pipeline_name: str, idempotency_key: str
+    ) -> Optional[RunRecord]:
+        """return the run already launched with the same idempotency key"""
+        if not idempotency_key:
+            return None
+        key = self.get_idempotency_key(pipeline_name, idempotency_key)
+        with RunRegistryService._lock:
+            run_id = RunRegistryService._idempotency_keys.get(key)
+            if run_id is None:
+                return None
+            record = RunRegistryService._runs.get(run_id)
+            if record is None or self.is_expired(record):
+                RunRegistryService._idempotency_keys.pop(key, None)
+                return None
+            return record
+
+    def register_run(
+        self,
+        run_id: str,
+        pipeline_name: str,
+        parameters: Dict[str, str],
+        status: Status,
+        idempotency_key: Optional[str] = None,
+    ) -> RunRecord:
+        """add a new run in the table"""
+        now = time.time()
+        record = RunRecord(
+            run_id=run_id,
+            pipeline_name=pipeline_name,
+            run_key=self.get_run_key(pipeline_name, parameters),
+            idempotency_key=idempotency_key,
+            status=status,
+            created=now,
+            updated=now,
+        )
+        with RunRegistryService._lock:
+            if now - RunRegistryService._purged >= self.purge_interval:
+                self.purge()
+            RunRegistryService._runs[run_id] = record
+            if status in ACTIVE_STATUSES:
+                RunRegistryService._active_runs[record.run_key] = run_id
+            if idempotency_key:
+                key = self.get_idempotency_key(pipeline_name, idempotency_key)
+                RunRegistryService._idempotency_keys[key] = run_id
+        return record
+
+    def update_status(self, run_id: str, status: Status) -> Optional[RunRecord]:
+        """update the status of a run, a completed run is no more active"""
+        with RunRegistryService._lock:
+            record = RunRegistryService._runs.get(run_id)
+            if record is None:
+                return None
+            record.status = status
+            record.updated = time.time()
+            if status not in ACTIVE_STATUSES:
+                if RunRegistryService._active_runs.get(record.run_key) == run_id:
+                    RunRegistryService._active_runs.pop(record.run_key, None)
+            return record
+
+    def remove_run(self, run_id: str):
+        with RunRegistryService._lock:
+            record = RunRegistryService._runs.pop(run_id, None)
+            if record is None:
+                return
+            if RunRegistryService._active_runs.get(record.run_key) == run_id:
+                RunRegistryService._active_runs.pop(record.run_key, None)
+            if record.idempotency_key:
+                key = self.get_idempotency_key(
+                    record.pipeline_name, record.idempotency_key
+                )
+                if RunRegistryService._idempotency_keys.get(key) == run_id:
+                    RunRegistryService._idempotency_keys.pop(key, None)
+
+    def clear(self):
+        with RunRegistryService._lock:
+            RunRegistryService._runs.clear()
+            RunRegistryService._active_runs.clear()
+            RunRegistryService._idempotency_keys.clear()
+            RunRegistryService._run_locks.clear()
+            RunRegistryService._purged = 0.0
@@ -0,0 +1,293 @@
+import csv
+import fnmatch
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from src.import_service import ImportService
+from src.local_engine_service import get_local_file, is_file_pattern
+from src.models import (
+    ColumnDelimiter,
+    Dataset,
+    DatasetFormat,
+    PipelineRequest,
+    QuoteCharacter,
+)
+
+# imported on first use (see ImportService)
+azure_exceptions = ImportService.lazy_import("azure.core.exceptions")
+blob = ImportService.lazy_import("azure.storage.blob")
+
+
+class SniffedSchema(BaseModel):
+    """schema of a delimited text file sniffed from its first bytes"""
+
+    # name of the file (or blob) read
+    name: str
+    # ETag of the blob (modification time and size of a local file)
+    etag: str
+    columns: List[str]
+    # delimiter and quote character found in the first records,
+    # None if they can't be inferred
+    column_delimiter: Optional[str] = None
+    quote_char: Optional[str] = None
+
+
+class LocalHeadReader:
+    """Class used to read the first bytes of the local files of a dataset
+    ({root}/{storage_account_name}/{container_name}/{folder_path}/{file})"""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def locate(self, dataset: Dataset) -> Optional[Tuple[str, str]]:
+        """return the path and the version of the file read by the local
+        engine, None if no file is found (file patterns not supported)"""
+        path = get_local_file(self.root, dataset)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        return path, f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def read(self, dataset: Dataset, name: str, size: int) -> bytes:
+        with open(name, "rb") as file:
+            return file.read(size)
+
+
+class BlobHeadReader:
+    """Class used to read the first bytes of the blobs of a dataset with a
+    range request, the ETag is read from the blob properties
+
+    The clients (one per storage account) are shared by the instances of the
+    class: the credential and the connections of the process are reused by
+    the next checks.
+    """
+
+    _lock = threading.Lock()
+    _clients: Dict[str, object] = {}
+    # session of the transports of the clients
+    _session = None
+
+    def __init__(self, credential, transport_service=None) -> None:
+        # credential of the process (CredentialService)
+        self.credential = credential
+        # TransportService, transport of the SDK by default
+        self.transport_service = transport_service
+
+    def get_blob_service_client(self, account_name: str):
+        """return the client of the storage account, created again if the
+        session of the transports changed (settings reloaded)"""
+        session = (
+            self.transport_service.get_session()
+            if self.transport_service is not None
+            else None
+        )
+        with BlobHeadReader._lock:
+            if BlobHeadReader._session is not session:
+                BlobHeadReader._clients.clear()
+                BlobHeadReader._session = session
+            client = BlobHeadReader._clients.get(account_name)
+            if client is None:
+                options = {}
+                if self.transport_service is not None:
+                    options["transport"] = self.transport_service.get_transport()
+                client = blob.BlobServiceClient(
+                    account_url=f"https://{account_name}.blob.core.windows.net/",
+                    credential=self.credential,
+                    **options,
+                )
+                BlobHeadReader._clients[account_name] = client
+            return client
+
+    def get_container_client(self, dataset: Dataset):
+        return self.get_blob_service_client(
+            dataset.storage_account_name
+        ).get_container_client(dataset.container_name)
+
+    def locate(self, dataset: Dataset) -> Optional[Tuple[str, str]]:
+        container_client = self.get_container_client(dataset)
+        prefix = f"{dataset.folder_path}/" if dataset.folder_path else ""
+        if not is_file_pattern(dataset.file_pattern_or_name):
+            # a single blob: one HEAD request
+            name = f"{prefix}{dataset.file_pattern_or_name}"
+            try:
+                properties = container_client.get_blob_client(
+                    name
+                ).get_blob_properties()
+            except azure_exceptions.ResourceNotFoundError:
+                return None
+            return name, properties.etag
+        for blob_properties in container_client.list_blobs(name_starts_with=prefix):
+            if fnmatch.fnmatch(
+                blob_properties.name[len(prefix):], dataset.file_pattern_or_name
+            ):
+                return blob_properties.name, blob_properties.etag
+        return None
+
+    def read(self, dataset: Dataset, name: str, size: int) -> bytes:
+        blob_client = self.get_container_client(dataset).get_blob_client(name)
+        return blob_client.download_blob(offset=0, length=size).readall()
+
+
+class SchemaService:
+    """Class used to check the datasets of a pipeline before its creation
+
+    Only the first bytes of the source and join files are read. The sniffed
+    schemas are cached by ETag and shared by all the instances of the class
+    as a new FactoryService is created for each HTTP request.
+    """
+
+    MAX_CACHED_SCHEMAS = 1024
+
+    _lock = threading.Lock()
+    _schemas: "OrderedDict[str, SniffedSchema]" = OrderedDict()
+
+    def __init__(self, reader, size: int = 4096) -> None:
+        # LocalHeadReader or BlobHeadReader
+        self.reader = reader
+        # number of bytes read from the beginning of each file
+        self.size = size
+
+    def get_records(
+        self, text: str, delimiter: str, quote_char: str, complete: bool
+    ) -> List[List[str]]:
+        """return the records of the text, the last one is dropped if the
+        text is only the beginning of the file"""
+        records = list(
+            csv.reader(io.StringIO(text), delimiter=delimiter, quotechar=quote_char)
+        )
+        if not complete and len(records) > 1:
+            records = records[:-1]
+        return [record for record in records if record]
+
+    def sniff_quote_char(self, text: str, delimiter: str) -> Optional[str]:
+        """return the quote character enclosing the most fields"""
+        counts = {
+            quote.value: len(
+                re.findall(
+                    f"(?:^|{re.escape(delimiter)}){re.escape(quote.value)}",
+                    text,
+                    flags=re.MULTILINE,
+                )
+            )
+            for quote in QuoteCharacter
+        }
+        quote_char = max(counts, key=counts.get)
+        return quote_char if counts[quote_char] > 0 else None
+
+    def sniff(
+        self, data: bytes, dataset: Dataset, name: str = "", etag: str = ""
+    ) -> SniffedSchema:
+        """return the column names, the delimiter and the quote character of
+        the first bytes of a delimited text file"""
+        complete = len(data) < self.size
+        text = data.decode("utf-8", errors="replace").lstrip("\ufeff")
+        # the delimiter giving the same number of fields (> 1) in all the
+        # records, the configured delimiter first
+        delimiters = [dataset.column_delimiter] + [
+            delimiter.value
+            for delimiter in ColumnDelimiter
+            if delimiter.value != dataset.column_delimiter
+        ]
+        column_delimiter = None
+        for delimiter in delimiters:
+            records = self.get_records(text, delimiter, dataset.quote_char, complete)
+            counts = {len(record) for record in records}
+            if len(counts) == 1 and counts.pop() > 1:
+                column_delimiter = delimiter
+                break
+        delimiter = column_delimiter or dataset.column_delimiter
+        records = self.get_records(text, delimiter, dataset.quote_char, complete)
+        first_row = records[0] if records else []
+        if dataset.first_row_as_header:
+            columns = first_row
+        else:
+            columns = [f"Prop_{index}" for index in range(len(first_row))]
+        return SniffedSchema(
+            name=name,
+            etag=etag,
+            columns=columns,
+            column_delimiter=column_delimiter,
+            quote_char=self.sniff_quote_char(text, delimiter),
+        )
+
+    def get_schema(self, dataset: Dataset) -> Optional[SniffedSchema]:
+        """return the schema of the first file of the dataset, the file is
+        read only if its version is not in the cache, None if not found"""
+        location = self.reader.locate(dataset)
+        if location is None:
+            return None
+        name, etag = location
+        key = (
+            f"{dataset.storage_account_name}/{dataset.container_name}/{name}|{etag}|"
+            f"{dataset.column_delimiter}|{dataset.quote_char}|{dataset.first_row_as_header}"
+        )
+        with SchemaService._lock:
+            schema = SchemaService._schemas.get(key)
+            if schema is not None:
+                SchemaService._schemas.move_to_end(key)
+                return schema
+        schema = self.sniff(
+            self.reader.read(dataset, name, self.size), dataset, name, etag
+        )
+        with SchemaService._lock:
+            SchemaService._schemas[key] = schema
+            while len(SchemaService._schemas) > SchemaService.MAX_CACHED_SCHEMAS:
+                SchemaService._schemas.popitem(last=False)
+        return schema
+
+    def check_dataset(
+        self, role: str, dataset: Dataset, columns: List[str]
+    ) -> List[str]:
+        """return the errors of the dataset: file not found, delimiter or
+        quote character not found, columns not in the header"""
+        if dataset.format != DatasetFormat.DELIMITED_TEXT:
+            # the schema of a Parquet file is in its footer
+            return []
+        schema = self.get_schema(dataset)
+        if schema is None:
+            return [
+                f"{role} dataset: no file {dataset.folder_path}/{dataset.file_pattern_or_name}"
+            ]
+        errors = []
+        if schema.column_delimiter is None and len(columns) > 1:
+            errors.append(
+                f"{role} dataset: column delimiter {dataset.column_delimiter!r} not found in {schema.name}"
+            )
+        elif (
+            schema.column_delimiter is not None
+            and schema.column_delimiter != dataset.column_delimiter
+        ):
+            errors.append(
+                f"{role} dataset: column delimiter {dataset.column_delimiter!r} expected, "
+                f"{schema.column_delimiter!r} found in {schema.name}"
+            )
+        if schema.quote_char is not None and schema.quote_char != dataset.quote_char:
+            errors.append(
+                f"{role} dataset: quote character {dataset.quote_char!r} expected, "
+                f"{schema.quote_char!r} found in {schema.name}"
+            )
+        missing = [column for column in columns if column not in schema.columns]
+        if missing:
+            errors.append(
+                f"{role} dataset: columns {missing} not in the header {schema.columns} of {schema.name}"
+            )
+        return errors
+
+    def check(self, input: PipelineRequest) -> List[str]:
+        """return the errors of the source and join datasets of the pipeline:
+        the selected columns must be in the source dataset and the key (first
+        column) in the join dataset"""
+        if not input.columns:
+            return ["No column selected"]
+        return self.check_dataset(
+            "source", input.source, input.columns
+        ) + self.check_dataset("join", input.join, input.columns[:1])
+
+    def clear(self):
+        with SchemaService._lock:
+            SchemaService._schemas.clear()
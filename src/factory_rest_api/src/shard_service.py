@@ -0,0 +1,76 @@
+import bisect
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+
+
+class ShardService:
+    """Class used to place the pipelines on the factories by consistent
+    hashing of the pipeline id
+
+    Each factory owns vnodes points of a hash ring, a pipeline is owned by
+    the factory of the first point after the hash of its id. Adding a
+    factory moves only the pipelines placed on its points (1/N of the
+    pipelines), taken from the next factory on the ring: the previous owner
+    of a pipeline is the second factory of its preference list.
+    """
+
+    _lock = threading.Lock()
+    # rings built for the lists of factories: (factories, vnodes) -> ring
+    _rings: Dict[Tuple[Tuple[str, ...], int], Tuple[List[int], List[str]]] = {}
+
+    def __init__(self, factories: List[str], vnodes: int = 100) -> None:
+        if not factories:
+            raise ValueError("No factory in the ring")
+        self.factories = list(factories)
+        self.vnodes = vnodes
+        self.positions, self.owners = self.get_ring()
+
+    @staticmethod
+    def get_position(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def get_ring(self) -> Tuple[List[int], List[str]]:
+        """return the sorted points of the ring and their factory, built
+        once per process for a list of factories"""
+        key = (tuple(self.factories), self.vnodes)
+        with ShardService._lock:
+            ring = ShardService._rings.get(key)
+            if ring is None:
+                points = sorted(
+                    (ShardService.get_position(f"{factory}#{index}"), factory)
+                    for factory in self.factories
+                    for index in range(self.vnodes)
+                )
+                ring = ([point[0] for point in points], [point[1] for point in points])
+                ShardService._rings[key] = ring
+            return ring
+
+    def get_factories(self, pipeline_id: str) -> List[str]:
+        """return the factories in preference order for the pipeline: the
+        owner first, then the next factories on the ring"""
+        index = bisect.bisect(self.positions, ShardService.get_position(pipeline_id))
+        factories: List[str] = []
+        for offset in range(len(self.owners)):
+            factory = self.owners[(index + offset) % len(self.owners)]
+            if factory not in factories:
+                factories.append(factory)
+                if len(factories) == len(self.factories):
+                    break
+        return factories
+
+    def get_factory(self, pipeline_id: str) -> str:
+        """return the factory owning the pipeline"""
+        index = bisect.bisect(self.positions, ShardService.get_position(pipeline_id))
+        return self.owners[index % len(self.owners)]
+
+    def get_moves(self, pipelines: Dict[str, List[str]]) -> List[Tuple[str, str, str]]:
+        """return the pipelines not placed on their owner: (pipeline id,
+        current factory, owner) for the pipeline ids of each factory"""
+        moves = []
+        for factory, pipeline_ids in pipelines.items():
+            for pipeline_id in pipeline_ids:
+                owner = self.get_factory(pipeline_id)
+                if owner != factory:
+                    moves.append((pipeline_id, factory, owner))
+        return moves
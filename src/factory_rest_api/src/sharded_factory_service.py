@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from src.factory_service import FactoryService, FactoryServiceError, get_log_service
+from src.models import (
+    GarbageCollectionReport,
+    GarbageCollectionRequest,
+    PipelineRequest,
+    PipelineResponse,
+    RebalanceReport,
+    RebalanceRequest,
+    RunRequest,
+    RunResponse,
+)
+from src.run_poller_service import RunPollerService
+from src.shard_service import ShardService
+
+
+class ShardedFactoryService(FactoryService):
+    """Class used to place the pipelines on several factories
+
+    Each pipeline is created on the factory owning its id on the hash ring
+    (see ShardService) and the calls on a pipeline are sent to this factory.
+    A pipeline created before a factory was added stays on its previous
+    owner until the rebalance moves it: the calls fall back to the next
+    factories of the preference list if the pipeline (or the run) is not
+    found on the owner. The factories removed from the ring (drain) are
+    tried last until the rebalance has moved their pipelines.
+    """
+
+    def __init__(
+        self,
+        ring: ShardService,
+        create_factory_service: Callable[[str], FactoryService],
+        concurrency: int = 4,
+        drain: List[str] = None,
+    ):
+        # no client of its own: the calls are sent to the factories of the
+        # ring ({resource group}/{factory}), their services are created on
+        # first use
+        self.ring = ring
+        self.create_factory_service = create_factory_service
+        self.factory_services: Dict[str, FactoryService] = {}
+        # number of pipelines moved in parallel by the rebalance
+        self.concurrency = concurrency
+        # factories removed from the ring, their pipelines are moved by the
+        # rebalance
+        self.drain = [
+            factory for factory in drain or [] if factory not in ring.factories
+        ]
+
+    def get_factory_service(self, factory: str) -> FactoryService:
+        factory_service = self.factory_services.get(factory)
+        if factory_service is None:
+            factory_service = self.create_factory_service(factory)
+            self.factory_services[factory] = factory_service
+        return factory_service
+
+    def get_all_factory_services(self) -> List[FactoryService]:
+        return [
+            self.get_factory_service(factory)
+            for factory in self.ring.factories + self.drain
+        ]
+
+    def get_pipeline_id(self, pipeline_name: str) -> str:
+        return pipeline_name.replace(FactoryService.PIPELINE_PREFIX, "")
+
+    def get_factory_services(self, pipeline_name: str) -> List[FactoryService]:
+        """return the factories in preference order for the pipeline"""
+        return [
+            self.get_factory_service(factory)
+            for factory in self.ring.get_factories(self.get_pipeline_id(pipeline_name))
+            + self.drain
+        ]
+
+    def get_owner(self, pipeline_name: str) -> FactoryService:
+        return self.get_factory_service(
+            self.ring.get_factory(self.get_pipeline_id(pipeline_name))
+        )
+
+    def pipeline(self, pipeline: PipelineRequest) -> PipelineResponse:
+        return self.get_owner(
+            f"{FactoryService.PIPELINE_PREFIX}{self.get_hash(pipeline)}"
+        ).pipeline(pipeline)
+
+    def find_pipeline(
+        self, factory_services: List[FactoryService], pipeline_name: str
+    ) -> Optional[FactoryService]:
+        """return the first factory where the pipeline exists"""
+        for factory_service in factory_services:
+            try:
+                pipeline_response = factory_service.pipeline_status(pipeline_name)
+            except HTTPException as ex:
+                if ex.status_code == 404:
+                    continue
+                raise
+            if (
+                pipeline_response is not None
+                and pipeline_response.error.code == FactoryServiceError.NO_ERROR
+            ):
+                return factory_service
+        return None
+
+    def pipeline_status(self, pipeline_name: str) -> PipelineResponse:
+        factory_services = self.get_factory_services(pipeline_name)
+        for factory_service in factory_services[:-1]:
+            try:
+                return factory_service.pipeline_status(pipeline_name)
+            except HTTPException as ex:
+                if ex.status_code != 404:
+                    raise
+        return factory_services[-1].pipeline_status(pipeline_name)
+
+    def run(self, pipeline_name: str, run_request: RunRequest = None) -> RunResponse:
+        factory_services = self.get_factory_services(pipeline_name)
+        run_response = factory_services[0].run(pipeline_name, run_request)
+        if (
+            run_response is not None
+            and run_response.error.code != FactoryServiceError.NO_ERROR
+        ):
+            try:
+                factory_services[0].pipeline_status(pipeline_name)
+            except HTTPException as ex:
+                if ex.status_code != 404:
+                    raise
+                # pipeline not moved yet to its owner
+                factory_service = self.find_pipeline(
+                    factory_services[1:], pipeline_name
+                )
+                if factory_service is not None:
+                    return factory_service.run(pipeline_name, run_request)
+        # error of the owner: the run is not retried on another factory
+        return run_response
+
+    def run_status(self, pipeline_name: str, run_id: str) -> RunResponse:
+        run_responses = []
+        for factory_service in self.get_factory_services(pipeline_name):
+            run_response = factory_service.run_status(pipeline_name, run_id)
+            if (
+                run_response is not None
+                and run_response.error.code == FactoryServiceError.NO_ERROR
+            ):
+                return run_response
+            run_responses.append(run_response)
+        # error of the owner
+        return run_responses[0]
+
+    def collect_garbage(
+        self, request: GarbageCollectionRequest
+    ) -> GarbageCollectionReport:
+        reports = [
+            factory_service.collect_garbage(request)
+            for factory_service in self.get_all_factory_services()
+        ]
+        return GarbageCollectionReport(
+            dry_run=request.dry_run,
+            retention_days=reports[0].retention_days,
+            start=min(report.start for report in reports),
+            end=max(report.end for report in reports),
+            pipelines=sum(report.pipelines for report in reports),
+            stale_pipelines=sorted(
+                name for report in reports for name in report.stale_pipelines
+            ),
+            deleted_objects=[
+                name for report in reports for name in report.deleted_objects
+            ],
+            errors=[error for report in reports for error in report.errors],
+        )
+
+    def poll_runs(self, poller: RunPollerService, ttl: float) -> List[RunResponse]:
+        return [
+            run_response
+            for factory_service in self.get_all_factory_services()
+            for run_response in factory_service.poll_runs(poller, ttl)
+        ]
+
+    def invalidate_pipelines(self, pipeline_names: List[str]):
+        for factory_service in self.get_all_factory_services():
+            factory_service.invalidate_pipelines(pipeline_names)
+
+    def move_pipeline(self, pipeline_name: str, source: str, target: str) -> List[str]:
+        """create the pipeline on the target factory then delete it from the
+        source factory, return the errors"""
+        source_service = self.get_factory_service(source)
+        target_service = self.get_factory_service(target)
+        try:
+            pipeline_response = source_service.get_data_flow(pipeline_name)
+            if pipeline_response.error.code != FactoryServiceError.NO_ERROR:
+                return [f"{pipeline_name}: {pipeline_response.error.message}"]
+            pipeline_request = PipelineRequest(
+                source=pipeline_response.source,
+                join=pipeline_response.join,
+                columns=pipeline_response.columns,
+                sink=pipeline_response.sink,
+                compute=pipeline_response.compute,
+                options=pipeline_response.options,
+            )
+            if self.get_pipeline_id(pipeline_name) != self.get_hash(pipeline_request):
+                return [f"{pipeline_name}: datasets not read from the pipeline"]
+            target_response = target_service.create_data_flow(pipeline_request)
+            if target_response.error.code != FactoryServiceError.NO_ERROR:
+                return [f"{pipeline_name}: {target_response.error.message}"]
+            # the runs of the pipeline stay in the source factory
+            errors = source_service.delete_pipeline(pipeline_name)
+        except Exception as ex:
+            return [f"{pipeline_name}: {ex}"]
+        self.invalidate_pipelines([pipeline_name])
+        return [f"{pipeline_name}: {error}" for error in errors]
+
+    def rebalance(self, request: RebalanceRequest) -> RebalanceReport:
+        """
+        Move the pipelines not placed on the factory owning them: after a
+        factory is added to DATAFACTORY_SHARDS or moved from DATAFACTORY_SHARDS
+        to DATAFACTORY_SHARD_DRAIN
+        """
+        start = datetime.utcnow()
+        pipeline_ids = {
+            factory: [
+                self.get_pipeline_id(pipeline_name)
+                for pipeline_name in factory_service.get_pipeline_names()
+            ]
+            for factory in self.ring.factories + self.drain
+            for factory_service in [self.get_factory_service(factory)]
+        }
+        moves = [
+            (f"{FactoryService.PIPELINE_PREFIX}{pipeline_id}", source, target)
+            for pipeline_id, source, target in self.ring.get_moves(pipeline_ids)
+        ]
+        errors: List[str] = []
+        if not request.dry_run and moves:
+            with ThreadPoolExecutor(max_workers=max(self.concurrency, 1)) as executor:
+                for move_errors in executor.map(
+                    lambda move: self.move_pipeline(*move), moves
+                ):
+                    errors.extend(move_errors)
+        report = RebalanceReport(
+            dry_run=request.dry_run,
+            start=start,
+            end=datetime.utcnow(),
+            factories=self.ring.factories,
+            pipelines=sum(len(ids) for ids in pipeline_ids.values()),
+            moves=[f"{name}:{source}->{target}" for name, source, target in moves],
+            errors=errors,
+        )
+        get_log_service().log_information(f"REBALANCE: {report}")
+        return report
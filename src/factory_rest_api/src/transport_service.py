@@ -0,0 +1,142 @@
+import socket
+import threading
+from typing import Dict, List, Optional
+
+from src.import_service import ImportService
+from src.models import TransportMetrics
+
+# imported on first use (see ImportService)
+requests = ImportService.lazy_import("requests")
+requests_adapters = ImportService.lazy_import("requests.adapters")
+urllib3_connection = ImportService.lazy_import("urllib3.connection")
+urllib3_retry = ImportService.lazy_import("urllib3.util.retry")
+azure_transport = ImportService.lazy_import("azure.core.pipeline.transport")
+
+
+class TransportService:
+    """Class used to share the HTTP connections of the SDK clients
+
+    A new FactoryService (and new SDK clients) is created for each HTTP
+    request: the clients send their requests through a session shared by
+    all the instances of the class, the connections (TCP and TLS handshakes)
+    are reused by the next requests.
+
+    HTTP/2 is not available: the SDK transport is based on requests and
+    urllib3 (HTTP/1.1), the concurrent requests use a connection each.
+    """
+
+    _lock = threading.Lock()
+    _session = None
+    _settings: Optional[tuple] = None
+
+    def __init__(
+        self,
+        pool_size: int = 32,
+        pool_connections: int = 10,
+        connection_timeout: float = 10,
+        read_timeout: float = 60,
+        keep_alive: int = 60,
+    ) -> None:
+        # connections kept per host: the number of threads sending requests
+        self.pool_size = pool_size
+        # number of hosts with a pool
+        self.pool_connections = pool_connections
+        self.connection_timeout = connection_timeout
+        self.read_timeout = read_timeout
+        # seconds before the first TCP keep-alive probe of an idle
+        # connection (the idle connections are closed by the load balancers
+        # after 4 minutes), 0 to disable the probes
+        self.keep_alive = keep_alive
+
+    def get_socket_options(self) -> List[tuple]:
+        options = list(urllib3_connection.HTTPConnection.default_socket_options)
+        if self.keep_alive > 0:
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            for name, value in [
+                ("TCP_KEEPIDLE", self.keep_alive),
+                ("TCP_KEEPINTVL", max(self.keep_alive // 4, 1)),
+                ("TCP_KEEPCNT", 4),
+            ]:
+                # not available on all the platforms
+                if hasattr(socket, name):
+                    options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+        return options
+
+    def create_session(self):
+        session = requests.Session()
+        # the retries are made by the retry policy of the SDK pipeline
+        adapter = requests_adapters.HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_size,
+            max_retries=urllib3_retry.Retry(
+                total=False, redirect=False, raise_on_status=False
+            ),
+        )
+        adapter.init_poolmanager(
+            self.pool_connections,
+            self.pool_size,
+            socket_options=self.get_socket_options(),
+        )
+        for prefix in ["https://", "http://"]:
+            session.mount(prefix, adapter)
+        return session
+
+    def get_session(self):
+        """return the session of the process, created again if the settings
+        changed"""
+        settings = (
+            self.pool_size,
+            self.pool_connections,
+            self.keep_alive,
+        )
+        with TransportService._lock:
+            if (
+                TransportService._session is None
+                or TransportService._settings != settings
+            ):
+                if TransportService._session is not None:
+                    TransportService._session.close()
+                TransportService._session = self.create_session()
+                TransportService._settings = settings
+            return TransportService._session
+
+    def get_transport(self):
+        """return a transport of the SDK clients using the session of the
+        process, the session is not closed with the client"""
+        return azure_transport.RequestsTransport(
+            session=self.get_session(),
+            session_owner=False,
+            connection_timeout=self.connection_timeout,
+            read_timeout=self.read_timeout,
+        )
+
+    def get_metrics(self) -> List[TransportMetrics]:
+        """return the connections created and the requests sent per host"""
+        with TransportService._lock:
+            session = TransportService._session
+        if session is None:
+            return []
+        pools: Dict[str, object] = {}
+        for adapter in set(session.adapters.values()):
+            pool_manager = getattr(adapter, "poolmanager", None)
+            if pool_manager is None:
+                continue
+            for key in pool_manager.pools.keys():
+                pool = pool_manager.pools.get(key)
+                if pool is not None:
+                    pools[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = pool
+        return [
+            TransportMetrics.construct(
+                host=host,
+                pool_size=pool.pool.maxsize if pool.pool is not None else 0,
+                connections=pool.num_connections,
+                requests=pool.num_requests,
+                reused_requests=max(pool.num_requests - pool.num_connections, 0),
+                idle_connections=(
+                    sum(connection is not None for connection in list(pool.pool.queue))
+                    if pool.pool is not None
+                    else 0
+                ),
+            )
+            for host, pool in sorted(pools.items())
+        ]
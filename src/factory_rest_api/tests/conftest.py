@@ -1,9 +1,23 @@
+import fnmatch
 import os
+import shutil
+import socketserver
+import threading
+import time
 
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from src.app import app as application  # pragma: no cover # NOQA: E402
+from src.configuration_service import ConfigurationService
+from src.models import (
+    ColumnDelimiter,
+    Dataset,
+    EscapeCharacter,
+    PipelineRequest,
+    QuoteCharacter,
+    Status,
+)
 
 os.environ["AZURE_TENANT_ID"] = "02020202-aaaa-erty-olki-020202020202"
 os.environ["AZURE_SUBSCRIPTION_ID"] = "03030303-aaaa-yuio-bbbb-030303030303"
@@ -18,6 +32,16 @@ os.environ["DATAFACTORY_SOURCE_LINKED_SERVICE"] = "datafactory-source-ls"
 os.environ["DATAFACTORY_SINK_LINKED_SERVICE"] = "datafactory-sink-ls"
 
 
+@pytest.fixture(autouse=True)
+def settings():
+    """settings of the environment of the test (loaded once by the
+    application): loaded again after the environment variables set by the
+    test are restored"""
+    ConfigurationService.reload()
+    yield
+    ConfigurationService.reload()
+
+
 @pytest.fixture
 def app() -> FastAPI:
     application.dependency_overrides = {}
@@ -27,3 +51,171 @@ def app() -> FastAPI:
 @pytest.fixture
 def client(app) -> TestClient:
     return TestClient(app)
+
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "scripts", "data"
+)
+STORAGE_ACCOUNT_NAME = "storageaccount"
+SOURCE_CONTAINER = "source"
+SINK_CONTAINER = "sink"
+
+
+def get_dataset(container_name: str, folder_path: str, file_name: str) -> Dataset:
+    return Dataset(
+        resource_group_name="datafactory-rg",
+        storage_account_name=STORAGE_ACCOUNT_NAME,
+        container_name=container_name,
+        folder_path=folder_path,
+        file_pattern_or_name=file_name,
+        first_row_as_header=True,
+        column_delimiter=ColumnDelimiter.SEMICOLON.value,
+        quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
+        escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
+    )
+
+
+def get_pipeline_request() -> PipelineRequest:
+    return PipelineRequest(
+        source=get_dataset(SOURCE_CONTAINER, "source/0000", "sourcedata.csv"),
+        join=get_dataset(SOURCE_CONTAINER, "join/0000", "joindata.csv"),
+        columns=["key", "phone", "email"],
+        sink=get_dataset(SINK_CONTAINER, "sink/0000", "sinkdata-00001.csv"),
+    )
+
+
+@pytest.fixture(scope="function")
+def local_root(tmp_path):
+    for folder, file in [
+        ("source/0000", "sourcedata.csv"),
+        ("join/0000", "joindata.csv"),
+    ]:
+        path = tmp_path / STORAGE_ACCOUNT_NAME / SOURCE_CONTAINER / folder
+        path.mkdir(parents=True)
+        shutil.copy(os.path.join(DATA_PATH, file), path / file)
+    return str(tmp_path)
+
+
+def wait_for_run(client: TestClient, pipeline_name: str, run_id: str) -> str:
+    status = Status.IN_PROGRESS
+    for _ in range(100):
+        response = client.get(url=f"/pipeline/{pipeline_name}/run/{run_id}")
+        assert response.status_code == 200
+        status = response.json()["status"]["status"]
+        if status in [Status.SUCCEEDED, Status.FAILED]:
+            break
+        time.sleep(0.1)
+    return status
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """Local stand-in of a Redis server: the commands used by the service"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password: str = None) -> None:
+        super().__init__(("127.0.0.1", 0), RedisStandInHandler)
+        self.password = password
+        self.lock = threading.Lock()
+        # key: (value, expiration time)
+        self.entries = {}
+        self.commands = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        password = f":{self.password}@" if self.password else ""
+        return f"redis://{password}127.0.0.1:{self.server_address[1]}/1"
+
+    def get(self, key: bytes):
+        entry = self.entries.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            self.entries.pop(key, None)
+            return None
+        return entry[0]
+
+    def execute(self, arguments):
+        command = arguments[0].upper()
+        self.commands.append(command)
+        with self.lock:
+            if command == b"AUTH":
+                return b"+OK" if arguments[1].decode() == self.password else b"-ERR"
+            if command in [b"SELECT", b"PING"]:
+                return b"+OK"
+            if command == b"GET":
+                return self.get(arguments[1])
+            if command == b"SET":
+                key, value, options = arguments[1], arguments[2], arguments[3:]
+                upper = [option.upper() for option in options]
+                if b"NX" in upper and self.get(key) is not None:
+                    return None
+                expiration = None
+                if b"PX" in upper:
+                    expiration = (
+                        time.time() + int(options[upper.index(b"PX") + 1]) / 1000
+                    )
+                self.entries[key] = (value, expiration)
+                return b"+OK"
+            if command == b"DEL":
+                count = 0
+                for key in arguments[1:]:
+                    count += self.entries.pop(key, None) is not None
+                return count
+            if command == b"EVAL":
+                # scripts of the leases: compare then expire or delete
+                script, key, owner = arguments[1], arguments[3], arguments[4]
+                if self.get(key) != owner:
+                    return 0
+                if b"pexpire" in script:
+                    self.entries[key] = (owner, time.time() + int(arguments[5]) / 1000)
+                else:
+                    del self.entries[key]
+                return 1
+            if command == b"SCAN":
+                pattern = arguments[arguments.index(b"MATCH") + 1].decode()
+                keys = [
+                    key
+                    for key in list(self.entries)
+                    if fnmatch.fnmatchcase(key.decode(), pattern.replace("\\", ""))
+                ]
+                return [b"0", keys]
+            return b"-ERR unknown command"
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        arguments = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def encode(self, reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self.encode(r) for r in reply)
+        if reply[:1] in [b"+", b"-"]:
+            return reply + b"\r\n"
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    def handle(self):
+        while True:
+            arguments = self.read_command()
+            if arguments is None:
+                return
+            self.wfile.write(self.encode(self.server.execute(arguments)))
+
+
+@pytest.fixture(scope="module")
+def redis_server():
+    server = RedisStandIn(password="p@ss")
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,191 @@
+import os
+import shutil
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from src.backend_router_service import BackendRouterService, get_local_dataset_size
+from src.factory_service import FactoryServiceError
+from src.local_factory_service import LocalFactoryService
+from src.models import Backend, RunResponse, Status
+from src.routing_factory_service import RoutingFactoryService
+from tests.conftest import DATA_PATH, get_dataset, get_pipeline_request
+
+
+@pytest.fixture(scope="function")
+def router():
+    router = BackendRouterService(
+        defaults={
+            Backend.LOCAL: (1.0, 10_000_000.0),
+            Backend.DATA_FACTORY: (300.0, 200_000_000.0),
+        }
+    )
+    router.clear()
+    yield router
+    router.clear()
+
+
+def test_router_choose_default_model(router):
+    # small input: local, large input: Data Factory
+    decision = router.choose(1_000_000, local_available=True)
+    assert decision.backend == Backend.LOCAL
+    assert decision.estimated_durations[Backend.LOCAL] == 1100
+    assert decision.estimated_durations[Backend.DATA_FACTORY] == 300005
+    decision = router.choose(10_000_000_000, local_available=True)
+    assert decision.backend == Backend.DATA_FACTORY
+    decision = router.choose(1_000_000, local_available=False)
+    assert decision.backend == Backend.DATA_FACTORY
+    assert Backend.LOCAL not in decision.estimated_durations
+
+
+def test_router_learn_model(router):
+    # local runs: 2 s start-up, 1 MB/s
+    for index, size in enumerate([1_000_000, 5_000_000, 20_000_000]):
+        decision = router.choose(size, local_available=True)
+        router.register_run(f"local-{index}", decision)
+        model = router.observe(f"local-{index}", 2000 + size // 1000)
+    # a run is learned once
+    assert router.observe("local-2", 1) is None
+    assert model.samples == 3
+    assert model.startup == pytest.approx(2.0)
+    assert model.throughput == pytest.approx(1_000_000.0)
+    assert router.estimate(Backend.LOCAL, 100_000_000) == pytest.approx(102.0)
+    # Data Factory is cheaper above ~ 300 MB with the learned local throughput
+    assert router.choose(400_000_000, local_available=True).backend == (
+        Backend.DATA_FACTORY
+    )
+
+
+def test_router_runs_bounded(router):
+    decision = router.choose(1_000_000, local_available=True)
+    bounded = BackendRouterService(router.defaults, max_runs=3, run_ttl=60)
+    for index in range(5):
+        bounded.register_run(f"run-{index}", decision)
+    assert list(BackendRouterService._runs) == ["run-2", "run-3", "run-4"]
+    bounded.forget("run-3")
+    assert bounded.get_run("run-3") is None
+
+    # runs never completed on the worker expire
+    expiring = BackendRouterService(router.defaults, run_ttl=0.05)
+    time.sleep(0.1)
+    expiring.register_run("run-5", decision)
+    assert list(BackendRouterService._runs) == ["run-5"]
+
+
+def test_get_local_dataset_size(local_root):
+    dataset = get_dataset("source", "source/0000", "sourcedata.csv")
+    assert get_local_dataset_size(local_root, dataset) == os.path.getsize(
+        os.path.join(DATA_PATH, "sourcedata.csv")
+    )
+    dataset.file_pattern_or_name = "unknown.csv"
+    assert get_local_dataset_size(local_root, dataset) is None
+    # the local engine reads a single file
+    dataset.file_pattern_or_name = "*.csv"
+    assert get_local_dataset_size(local_root, dataset) is None
+
+
+def get_routing_factory_service(
+    local: LocalFactoryService, router: BackendRouterService
+) -> RoutingFactoryService:
+    with patch(
+        "src.factory_service.FactoryService.initialize_azure_clients",
+        return_value=True,
+    ):
+        return RoutingFactoryService(
+            subscription_id="",
+            resource_group_name="",
+            datafactory_name="",
+            source_linked_service="",
+            sink_linked_service="",
+            local_factory_service=local,
+            router=router,
+        )
+
+
+def test_routing_factory_service_create_run(local_root, router):
+    local = LocalFactoryService(local_root)
+    factory_service = get_routing_factory_service(local, router)
+    pipeline_request = get_pipeline_request()
+    pipeline_name = local.create_data_flow(pipeline_request).pipeline_name
+    with patch("src.factory_service.FactoryService.create_run") as mock_create_run:
+        run_response = factory_service.create_run(pipeline_name, {})
+        mock_create_run.assert_not_called()
+    assert run_response.run_id.startswith(LocalFactoryService.RUN_PREFIX)
+    assert run_response.routing.backend == Backend.LOCAL
+    assert run_response.routing.input_size == os.path.getsize(
+        os.path.join(DATA_PATH, "sourcedata.csv")
+    ) + os.path.getsize(os.path.join(DATA_PATH, "joindata.csv"))
+    assert router.get_run(run_response.run_id) is not None
+
+    # input dataset missing on the local backend
+    shutil.rmtree(os.path.join(local_root, "storageaccount", "source", "join"))
+    with patch(
+        "src.routing_factory_service.get_blob_dataset_size", return_value=None
+    ), patch("src.factory_service.FactoryService.create_run") as mock_create_run:
+        mock_create_run.return_value = run_response.copy(update={"run_id": "adf-run"})
+        run_response = factory_service.create_run(pipeline_name, {})
+        mock_create_run.assert_called_once()
+    assert run_response.routing.backend == Backend.DATA_FACTORY
+
+
+def test_routing_factory_service_file_pattern(local_root, router):
+    local = LocalFactoryService(local_root)
+    factory_service = get_routing_factory_service(local, router)
+    pipeline_request = get_pipeline_request()
+    pipeline_request.source.file_pattern_or_name = "source*.csv"
+    # not created on the local backend
+    assert (
+        local.create_data_flow(pipeline_request).error.code
+        == FactoryServiceError.LOCAL_ENGINE_ERROR
+    )
+    # stored before the file patterns were rejected
+    pipeline_name = (
+        f"{LocalFactoryService.PIPELINE_PREFIX}{local.get_hash(pipeline_request)}"
+    )
+    local.write_json(local.get_pipeline_path(pipeline_name), pipeline_request)
+    with patch("src.routing_factory_service.get_blob_dataset_size", return_value=10):
+        decision = factory_service.get_routing_decision(pipeline_name)
+    assert decision.backend == Backend.DATA_FACTORY
+    assert decision.reason.startswith("Pipeline not supported by the local engine")
+    assert decision.input_size == 10 + os.path.getsize(
+        os.path.join(DATA_PATH, "joindata.csv")
+    )
+
+
+def test_routing_factory_service_run_status(local_root, router):
+    factory_service = get_routing_factory_service(
+        LocalFactoryService(local_root), router
+    )
+    decision = router.choose(1_000_000, local_available=True)
+    for run_id in ["run-succeeded", "run-failed", "run-in-progress"]:
+        router.register_run(run_id, decision)
+
+    def get_run_response(run_id: str, status: Status) -> RunResponse:
+        return factory_service.create_run_response(
+            run_id=run_id,
+            pipeline_name="Pipeline0001",
+            status=status,
+            start=datetime.utcnow(),
+            end=datetime.utcnow(),
+            duration_in_ms=3000,
+            error_code=FactoryServiceError.NO_ERROR,
+            error_message="",
+        )
+
+    # status returned by the cache or the run poller
+    for run_id, status in [
+        ("run-succeeded", Status.SUCCEEDED),
+        ("run-failed", Status.FAILED),
+        ("run-in-progress", Status.IN_PROGRESS),
+    ]:
+        with patch(
+            "src.factory_service.FactoryService.run_status",
+            return_value=get_run_response(run_id, status),
+        ):
+            factory_service.run_status("Pipeline0001", run_id)
+    assert router.get_run("run-succeeded") is None
+    assert router.get_run("run-failed") is None
+    assert router.get_run("run-in-progress") is not None
+    # the failed run is not learned
+    assert router.get_model(Backend.LOCAL).samples == 1
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from src.cache_service import (
+    CacheService,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+    SQLiteCacheBackend,
+)
+from src.configuration_service import ConfigurationService
+from src.models import Status
+from tests.conftest import get_pipeline_request, wait_for_run
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path, redis_server):
+    if request.param == "memory":
+        return MemoryCacheBackend(max_entries=3)
+    if request.param == "sqlite":
+        return SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    redis_server.entries.clear()
+    return RedisCacheBackend(redis_server.url)
+
+
+def test_cache_backend(backend):
+    assert backend.get("a:1") is None
+    backend.set("a:1", b"value-1", ttl=60)
+    backend.set("a:2", b"value-2", ttl=60)
+    backend.set("b:1", b"value-3", ttl=60)
+    assert backend.get("a:1") == b"value-1"
+    backend.set("a:1", b"value-4", ttl=60)
+    assert backend.get("a:1") == b"value-4"
+
+    backend.set("a:3", b"expired", ttl=0.05)
+    time.sleep(0.1)
+    assert backend.get("a:3") is None
+
+    backend.delete(["a:2", "unknown"])
+    assert backend.get("a:2") is None
+    backend.clear("a:")
+    assert backend.get("a:1") is None
+    assert backend.get("b:1") == b"value-3"
+
+
+def test_memory_cache_backend_lru():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("a", b"1", ttl=60)
+    backend.set("b", b"2", ttl=60)
+    assert backend.get("a") == b"1"
+    backend.set("c", b"3", ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+
+
+def test_sqlite_cache_backend_shared(tmp_path):
+    # two backends on the same database: two workers of the node
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteCacheBackend(path), SQLiteCacheBackend(path)
+    first.set("key", b"value", ttl=60)
+    assert second.get("key") == b"value"
+    second.delete(["key"])
+    assert first.get("key") is None
+
+
+def test_redis_cache_backend_connection_reuse(redis_server):
+    backend = RedisCacheBackend(redis_server.url)
+    redis_server.commands.clear()
+    for index in range(5):
+        backend.set(f"key-{index}", b"value", ttl=60)
+    # one AUTH and one SELECT for the single connection of the pool
+    assert redis_server.commands.count(b"AUTH") == 1
+    assert redis_server.commands.count(b"SELECT") == 1
+    assert backend.get("key-4") == b"value"
+
+
+def test_cache_service_errors():
+    # no server: the cache is a miss, the requests don't fail
+    cache = CacheService(
+        RedisCacheBackend("redis://127.0.0.1:1/0", timeout=0.1), "rg/factory", 60
+    )
+    assert cache.get_pipeline("Pipeline0000") is None
+    cache.invalidate_pipelines(["Pipeline0000"])
+    with pytest.raises(ValueError):
+        CacheService.get_backend("unknown")
+
+
+def test_cache_local_pipeline(client: TestClient, local_root, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "local")
+    monkeypatch.setenv("DATAFACTORY_LOCAL_ROOT", local_root)
+    monkeypatch.setenv("DATAFACTORY_CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("DATAFACTORY_CACHE_URL", str(tmp_path / "cache.db"))
+    ConfigurationService.reload()
+    backend = CacheService.get_backend("sqlite", str(tmp_path / "cache.db"))
+    cache = CacheService(backend, "datafactory-rg/local", 300)
+
+    pipeline_request = get_pipeline_request()
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    pipeline_name = response.json()["pipeline_name"]
+    assert cache.get_pipeline(pipeline_name) is None
+    response = client.get(url=f"/pipeline/{pipeline_name}")
+    assert response.status_code == 200
+    assert cache.get_pipeline(pipeline_name).columns == pipeline_request.columns
+
+    # served from the cache
+    cached = cache.get_pipeline(pipeline_name)
+    cached.columns = ["key", "phone"]
+    cache.set_pipeline(cached)
+    response = client.get(url=f"/pipeline/{pipeline_name}")
+    assert response.json()["columns"] == ["key", "phone"]
+
+    # invalidated when the pipeline is re-created
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    assert cache.get_pipeline(pipeline_name) is None
+    response = client.get(url=f"/pipeline/{pipeline_name}")
+    assert response.json()["columns"] == pipeline_request.columns
+
+    # only the completed runs are cached
+    response = client.post(url=f"/pipeline/{pipeline_name}/run")
+    run_id = response.json()["run_id"]
+    assert wait_for_run(client, pipeline_name, run_id) == Status.SUCCEEDED
+    run_response = cache.get_run(pipeline_name, run_id)
+    assert run_response.status.status == Status.SUCCEEDED
+    assert run_response.metrics["sink_rows"] == 4
@@ -0,0 +1,172 @@
+import os
+import signal
+import time
+
+import pytest
+import src.app as app_module
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from src.configuration_service import ConfigurationService, Settings
+from src.models import Backend
+
+
+def test_settings_load():
+    settings = Settings.load(
+        {
+            "DATAFACTORY_EXECUTION_BACKEND": "Local",
+            "DATAFACTORY_GC_DRY_RUN": "False",
+            "DATAFACTORY_CACHE_TTL": "60.5",
+            # empty: default value
+            "DATAFACTORY_LOCAL_WORKERS": "",
+            "OTHER_VARIABLE": "ignored",
+        }
+    )
+    assert settings.execution_backend == Backend.LOCAL
+    assert settings.gc_dry_run is False
+    assert settings.cache_ttl == 60.5
+    assert settings.local_workers == 1
+    assert settings.http_pool_size == 32
+    configuration = ConfigurationService(settings)
+    assert configuration.get_execution_backend() == "local"
+    assert configuration.get_cache_ttl() == 60.5
+
+    # immutable
+    with pytest.raises(TypeError):
+        settings.cache_ttl = 10
+
+    for name, value in [
+        ("DATAFACTORY_LOCAL_WORKERS", "two"),
+        ("DATAFACTORY_HTTP_POOL_SIZE", "0"),
+        ("DATAFACTORY_CACHE_BACKEND", "memcached"),
+        ("DATAFACTORY_EXECUTION_BACKEND", "spark"),
+    ]:
+        with pytest.raises(ValidationError):
+            Settings.load({name: value})
+
+
+def test_settings_snapshot(monkeypatch):
+    monkeypatch.delenv("DATAFACTORY_GC_CONCURRENCY", raising=False)
+    configuration = ConfigurationService()
+    assert configuration.get_gc_concurrency() == 4
+    # the environment is not changed by the reads
+    assert "DATAFACTORY_GC_CONCURRENCY" not in os.environ
+
+    monkeypatch.setenv("DATAFACTORY_GC_CONCURRENCY", "8")
+    assert ConfigurationService().get_gc_concurrency() == 4
+    report = ConfigurationService.reload()
+    assert report.changed == ["DATAFACTORY_GC_CONCURRENCY"]
+    assert report.restart_required == []
+    assert ConfigurationService().get_gc_concurrency() == 8
+    # snapshot of the instance created before the reload
+    assert configuration.get_gc_concurrency() == 4
+
+    monkeypatch.setenv("DATAFACTORY_GC_CONCURRENCY", "many")
+    with pytest.raises(ValidationError):
+        ConfigurationService.reload()
+    assert ConfigurationService().get_gc_concurrency() == 8
+
+
+def test_reload_endpoint(client: TestClient, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_PREFLIGHT_SIZE", "8192")
+    monkeypatch.setenv("DATAFACTORY_COMPRESSION", "false")
+    response = client.post(url="/admin/config/reload")
+    assert response.status_code == 200
+    assert response.json()["changed"] == [
+        "DATAFACTORY_PREFLIGHT_SIZE",
+        "DATAFACTORY_COMPRESSION",
+    ]
+    assert response.json()["restart_required"] == ["DATAFACTORY_COMPRESSION"]
+    assert ConfigurationService().get_preflight_size() == 8192
+
+    monkeypatch.setenv("DATAFACTORY_PREFLIGHT_SIZE", "-1")
+    response = client.post(url="/admin/config/reload")
+    assert response.status_code == 400
+    assert "DATAFACTORY_PREFLIGHT_SIZE" in response.json()["detail"]
+    assert ConfigurationService().get_preflight_size() == 8192
+
+
+def test_reload_restarts_background_tasks(monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_GC_INTERVAL", "3600")
+    app_module.reload_configuration()
+    stop = app_module.background_tasks["garbage-collection"]
+    assert not stop.is_set()
+
+    monkeypatch.setenv("DATAFACTORY_GC_INTERVAL", "7200")
+    app_module.reload_configuration()
+    assert stop.is_set()
+    assert not app_module.background_tasks["garbage-collection"].is_set()
+
+    monkeypatch.setenv("DATAFACTORY_GC_INTERVAL", "0")
+    app_module.reload_configuration()
+    assert "garbage-collection" not in app_module.background_tasks
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="no SIGHUP")
+def test_reload_signal(monkeypatch):
+    handler = signal.getsignal(signal.SIGHUP)
+    try:
+        app_module.register_reload_signal()
+        monkeypatch.setenv("DATAFACTORY_PREFLIGHT_SIZE", "2048")
+        os.kill(os.getpid(), signal.SIGHUP)
+        deadline = time.time() + 5
+        while (
+            ConfigurationService().get_preflight_size() != 2048
+            and time.time() < deadline
+        ):
+            time.sleep(0.01)
+        assert ConfigurationService().get_preflight_size() == 2048
+    finally:
+        signal.signal(signal.SIGHUP, handler)
+
+
+def test_settings_file(tmp_path, monkeypatch):
+    path = tmp_path / "settings.env"
+    path.write_text(
+        "# settings changed at runtime\n"
+        "DATAFACTORY_GC_CONCURRENCY=8\n"
+        'export DATAFACTORY_CACHE_URL="redis://cache:6379/0"\n'
+        "DATAFACTORY_LOCAL_ROOT='/mnt/factory'\n"
+        'DATAFACTORY_SHARDS="factory-a,\\"factory-b\\""\n'
+        "\n"
+    )
+    assert Settings.read_file(str(path)) == {
+        "DATAFACTORY_GC_CONCURRENCY": "8",
+        "DATAFACTORY_CACHE_URL": "redis://cache:6379/0",
+        "DATAFACTORY_LOCAL_ROOT": "/mnt/factory",
+        "DATAFACTORY_SHARDS": 'factory-a,"factory-b"',
+    }
+
+    # the file overrides the environment variables
+    monkeypatch.setenv("DATAFACTORY_GC_CONCURRENCY", "2")
+    monkeypatch.setenv("DATAFACTORY_PREFLIGHT_SIZE", "2048")
+    monkeypatch.setenv("DATAFACTORY_SETTINGS_FILE", str(path))
+    path.write_text("DATAFACTORY_GC_CONCURRENCY=8\n")
+    ConfigurationService.reload()
+    assert ConfigurationService().get_gc_concurrency() == 8
+    assert ConfigurationService().get_preflight_size() == 2048
+
+    # the file changed at runtime
+    path.write_text("DATAFACTORY_GC_CONCURRENCY=16\n")
+    report = ConfigurationService.reload()
+    assert report.changed == ["DATAFACTORY_GC_CONCURRENCY"]
+    assert ConfigurationService().get_gc_concurrency() == 16
+
+    # the snapshot is kept if the file cannot be read
+    path.unlink()
+    with pytest.raises(OSError):
+        ConfigurationService.reload()
+    assert ConfigurationService().get_gc_concurrency() == 16
+
+
+def test_reload_endpoint_settings_file(client: TestClient, tmp_path, monkeypatch):
+    path = tmp_path / "settings.env"
+    path.write_text("DATAFACTORY_PREFLIGHT_SIZE=1024\n")
+    monkeypatch.setenv("DATAFACTORY_SETTINGS_FILE", str(path))
+    response = client.post(url="/admin/config/reload")
+    assert response.status_code == 200
+    assert ConfigurationService().get_preflight_size() == 1024
+
+    monkeypatch.setenv("DATAFACTORY_SETTINGS_FILE", str(tmp_path / "missing.env"))
+    response = client.post(url="/admin/config/reload")
+    assert response.status_code == 400
+    assert ConfigurationService().get_preflight_size() == 1024
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from azure.core.credentials import AccessToken
+from fastapi.testclient import TestClient
+from src.credential_service import (
+    MANAGEMENT_SCOPE,
+    CredentialService,
+    TokenCacheCredential,
+)
+
+
+class FakeCredential:
+    """credential returning tokens valid for lifetime seconds"""
+
+    def __init__(self, lifetime: float, delay: float = 0.0) -> None:
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return AccessToken(f"token-{calls}", int(time.time() + self.lifetime))
+
+
+@pytest.fixture
+def credential():
+    credential = TokenCacheCredential(FakeCredential(lifetime=3600), refresh_margin=600)
+    yield credential
+    credential.stop()
+
+
+def test_token_cached(credential):
+    tokens = []
+    threads = [
+        threading.Thread(
+            target=lambda: tokens.append(credential.get_token(MANAGEMENT_SCOPE))
+        )
+        for _ in range(8)
+    ]
+    credential.credential.delay = 0.05
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # a single acquisition for the concurrent requests
+    assert credential.credential.calls == 1
+    assert {token.token for token in tokens} == {"token-1"}
+
+    # options: not cached
+    credential.get_token(MANAGEMENT_SCOPE, claims="challenge")
+    assert credential.credential.calls == 2
+
+    [metrics] = credential.get_metrics()
+    assert metrics.scope == MANAGEMENT_SCOPE
+    assert metrics.refreshes == 1
+    assert metrics.blocking_refreshes == 1
+    assert metrics.last_refresh_duration >= 50
+    assert 3500 < metrics.expires_in <= 3600
+
+
+def test_token_refreshed_in_background():
+    # short-lived tokens: refreshed at half of their lifetime
+    credential = TokenCacheCredential(FakeCredential(lifetime=62), refresh_margin=600)
+    try:
+        assert credential.get_token(MANAGEMENT_SCOPE).token == "token-1"
+        [cached] = credential.tokens.values()
+        # due: refreshed by the background thread, not by the requests
+        cached.next_refresh = time.time()
+        with credential.condition:
+            credential.condition.notify_all()
+        deadline = time.time() + 5
+        while credential.credential.calls < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert credential.get_token(MANAGEMENT_SCOPE).token == "token-2"
+        [metrics] = credential.get_metrics()
+        assert metrics.refreshes == 2
+        assert metrics.blocking_refreshes == 1
+        assert metrics.token_age < 5
+        assert cached.next_refresh - time.time() == pytest.approx(31, abs=2)
+    finally:
+        credential.stop()
+
+
+def test_token_refresh_error(credential):
+    assert credential.get_token(MANAGEMENT_SCOPE).token == "token-1"
+    [cached] = credential.tokens.values()
+    credential.credential.error = ValueError("no identity")
+    with pytest.raises(ValueError):
+        credential.refresh(cached)
+    # the current token is served until it expires
+    assert credential.get_token(MANAGEMENT_SCOPE).token == "token-1"
+    [metrics] = credential.get_metrics()
+    assert metrics.refresh_errors == 1
+    assert metrics.last_error == "no identity"
+    assert cached.next_refresh > time.time() + 20
+
+    # expired and not refreshed: the request fails
+    cached.token = AccessToken("token-1", int(time.time()))
+    with pytest.raises(ValueError):
+        credential.get_token(MANAGEMENT_SCOPE)
+
+
+def test_credential_metrics(client: TestClient, credential, monkeypatch):
+    monkeypatch.setattr(CredentialService, "_credential", None)
+    assert client.get(url="/admin/credential").json() == []
+
+    monkeypatch.setattr(CredentialService, "_credential", credential)
+    assert CredentialService().get_credential() is credential
+    CredentialService().prefetch().join()
+    response = client.get(url="/admin/credential")
+    assert response.status_code == 200
+    [metrics] = response.json()
+    assert metrics["scope"] == MANAGEMENT_SCOPE
+    assert metrics["refreshes"] == 1
+    assert metrics["token_age"] < 5
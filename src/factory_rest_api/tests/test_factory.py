@@ -1,16 +1,36 @@
-from unittest.mock import patch
+from datetime import datetime
+from unittest.mock import MagicMock, patch
 
 import pytest
+from azure.mgmt.datafactory.models import (
+    AzureBlobStorageLocation,
+    DelimitedTextDataset,
+    LinkedServiceReference,
+    ParquetDataset,
+)
 from fastapi.testclient import TestClient
+from pydantic import ValidationError
 from src.configuration_service import ConfigurationService
-from src.factory_service import FactoryService
+from src.factory_service import FactoryService, FactoryServiceError
 from src.models import (
+    Broadcast,
     ColumnDelimiter,
+    CompressionCodec,
+    ComputeType,
+    DataFlowCompute,
+    DataFlowOptions,
     Dataset,
+    DatasetFormat,
     EscapeCharacter,
+    JoinType,
+    PartitionType,
     PipelineRequest,
     QuoteCharacter,
+    RunRequest,
+    Status,
 )
+from src.run_registry_service import RunRegistryService
+from tests.conftest import get_pipeline_request
 
 
 def get_configuration_service() -> ConfigurationService:
@@ -154,3 +174,221 @@ def test_factory_service_get_storage_account_name_from_endpoint(factory_service)
         mock_initialize_azure_clients.return_value = True
         storage = factory_service.get_storage_account_name_from_endpoint("")
         assert storage == ""
+
+
+def test_launch_pipeline_run_with_idempotency_key(client: TestClient):
+    with patch(
+        "src.factory_service.FactoryService.initialize_azure_clients"
+    ) as mock_initialize_azure_clients:
+        pipeline_name = "Pipeline0000000"
+        mock_initialize_azure_clients.return_value = True
+        pipeline_response = client.post(
+            url=f"/pipeline/{pipeline_name}/run",
+            json=RunRequest(dedupe=True, idempotency_key="key-0").dict(),
+            headers={"accept": "application/json", "Content-Type": "application/json"},
+        )
+        assert pipeline_response.status_code == 200
+
+
+def test_factory_service_run_dedupe(factory_service):
+    RunRegistryService().clear()
+    pipeline_name = "Pipeline0000001"
+    with patch("src.factory_service.FactoryService.create_run") as mock_create_run:
+        with patch(
+            "src.factory_service.FactoryService.get_run_data_flow_status"
+        ) as mock_get_run_data_flow_status:
+            run_response = factory_service.create_run_response(
+                run_id="run-0",
+                pipeline_name=pipeline_name,
+                status=Status.IN_PROGRESS,
+                start=datetime.utcnow(),
+                end=datetime.utcnow(),
+                duration_in_ms=0,
+                error_code=FactoryServiceError.NO_ERROR,
+                error_message="",
+            )
+            mock_create_run.return_value = run_response
+            mock_get_run_data_flow_status.return_value = run_response
+            first = factory_service.run(pipeline_name, RunRequest(dedupe=True))
+            second = factory_service.run(pipeline_name, RunRequest(dedupe=True))
+            assert first.run_id == "run-0"
+            assert second.run_id == "run-0"
+            assert mock_create_run.call_count == 1
+
+            # without dedupe a new run is always launched
+            factory_service.run(pipeline_name, RunRequest(dedupe=False))
+            assert mock_create_run.call_count == 2
+    RunRegistryService().clear()
+
+
+def test_factory_service_run_idempotency_key(factory_service):
+    RunRegistryService().clear()
+    pipeline_name = "Pipeline0000002"
+    with patch("src.factory_service.FactoryService.create_run") as mock_create_run:
+        with patch(
+            "src.factory_service.FactoryService.get_run_data_flow_status"
+        ) as mock_get_run_data_flow_status:
+            run_response = factory_service.create_run_response(
+                run_id="run-1",
+                pipeline_name=pipeline_name,
+                status=Status.SUCCEEDED,
+                start=datetime.utcnow(),
+                end=datetime.utcnow(),
+                duration_in_ms=0,
+                error_code=FactoryServiceError.NO_ERROR,
+                error_message="",
+            )
+            mock_create_run.return_value = run_response
+            mock_get_run_data_flow_status.return_value = run_response
+            factory_service.run(pipeline_name, RunRequest(idempotency_key="key-1"))
+            # the run is completed but the idempotency key is the same
+            second = factory_service.run(
+                pipeline_name, RunRequest(idempotency_key="key-1")
+            )
+            assert second.run_id == "run-1"
+            assert mock_create_run.call_count == 1
+            factory_service.run(pipeline_name, RunRequest(idempotency_key="key-2"))
+            assert mock_create_run.call_count == 2
+    RunRegistryService().clear()
+
+
+def test_factory_service_get_data_flow_activity(factory_service):
+    activity = factory_service.get_data_flow_activity(
+        activity_name="Activity", dataflow_name="DataFlow-0000000", compute=None
+    )
+    assert activity.compute is None
+    assert activity.integration_runtime is None
+    assert factory_service.get_compute_from_activity(activity) is None
+
+    compute = DataFlowCompute(
+        compute_type=ComputeType.MEMORY_OPTIMIZED,
+        core_count=16,
+        integration_runtime_name="DataFlowRuntime",
+        time_to_live=10,
+    )
+    activity = factory_service.get_data_flow_activity(
+        activity_name="Activity", dataflow_name="DataFlow-0000000", compute=compute
+    )
+    assert activity.compute.compute_type == "MemoryOptimized"
+    assert activity.compute.core_count == 16
+    assert activity.integration_runtime.reference_name == "DataFlowRuntime"
+    result = factory_service.get_compute_from_activity(activity)
+    assert result.compute_type == ComputeType.MEMORY_OPTIMIZED
+    assert result.core_count == 16
+    assert result.integration_runtime_name == "DataFlowRuntime"
+
+
+def get_test_data_flow_script(factory_service, options: DataFlowOptions) -> str:
+    return factory_service.get_data_flow_script(
+        source_data_source_name="SourceDataset0000000",
+        join_data_source_name="JoinDataset0000000",
+        sink_data_source_name="SinkDataset0000000",
+        join_data_flow_name="JoinFlow0000000",
+        select_data_flow_name="SelectFlow0000000",
+        output_file_name="sinkdata.csv",
+        columns=["key", "phone", "email"],
+        source_folder_path="source/2022-01-01",
+        source_file_name="sourcedata.csv",
+        options=options,
+    )
+
+
+def test_factory_service_get_data_flow_script(factory_service):
+    script = get_test_data_flow_script(factory_service, None)
+    assert "joinType:'inner'" in script
+    assert "broadcast: 'auto'" in script
+    assert "partitionBy" not in script
+    assert "allowSchemaDrift: false" not in script
+    assert factory_service.get_options_from_script(script) is None
+    assert factory_service.get_column_list_from_script(script) == [
+        "key",
+        "phone",
+        "email",
+    ]
+    folder, file = factory_service.get_folder_file_from_script(script)
+    assert folder == "source/2022-01-01"
+    assert file == "sourcedata.csv"
+    assert factory_service.get_sink_file_from_script(script) == "sinkdata.csv"
+
+
+def test_factory_service_get_data_flow_script_with_options(factory_service):
+    options = DataFlowOptions(
+        join_type=JoinType.LEFT,
+        broadcast=Broadcast.RIGHT,
+        source_partition_type=PartitionType.HASH,
+        source_partition_count=16,
+        sink_partition_type=PartitionType.ROUND_ROBIN,
+        sink_partition_count=4,
+        projection=True,
+    )
+    script = get_test_data_flow_script(factory_service, options)
+    assert "joinType:'left'" in script
+    assert "broadcast: 'right'" in script
+    assert "partitionBy('hash', 16, {key})) ~> SourceDataset0000000" in script
+    assert "partitionBy('roundRobin', 4)) ~> SinkDataset0000000" in script
+    # both sources are restricted to the declared columns
+    assert script.count("allowSchemaDrift: false") == 2
+    assert factory_service.get_options_from_script(script) == options
+    folder, file = factory_service.get_folder_file_from_script(script)
+    assert folder == "source/2022-01-01"
+    assert file == "sourcedata.csv"
+    assert factory_service.get_sink_file_from_script(script) == "sinkdata.csv"
+
+
+def test_factory_service_get_dataset_resource(factory_service):
+    dataset = Dataset(
+        resource_group_name="datafactory-rg",
+        storage_account_name="storageaccount",
+        container_name="SINK_CONTAINER",
+        folder_path="SINK_BLOB_FOLDER",
+        file_pattern_or_name="SINK_BLOB_FILE",
+        first_row_as_header=True,
+        column_delimiter=ColumnDelimiter.SEMICOLON.value,
+        quote_char=QuoteCharacter.DOUBLE_QUOTE.value,
+        escape_char=EscapeCharacter.DOUBLE_QUOTE.value,
+    )
+    service = MagicMock()
+    service.properties.service_endpoint = (
+        "https://storageaccount.blob.core.windows.net/"
+    )
+    location = AzureBlobStorageLocation(
+        container=dataset.container_name,
+        folder_path=dataset.folder_path,
+        file_name=dataset.file_pattern_or_name,
+    )
+    linked_service = LinkedServiceReference(reference_name="datafactory-sink-ls")
+
+    resource = factory_service.get_dataset_resource(linked_service, location, dataset)
+    assert isinstance(resource.properties, DelimitedTextDataset)
+    assert resource.properties.compression_codec is None
+    assert factory_service.get_dataset_from_resource(resource, service) == dataset
+
+    dataset.format = DatasetFormat.PARQUET
+    resource = factory_service.get_dataset_resource(linked_service, location, dataset)
+    assert isinstance(resource.properties, ParquetDataset)
+    assert resource.properties.compression_codec == "snappy"
+    result = factory_service.get_dataset_from_resource(resource, service)
+    assert result.format == DatasetFormat.PARQUET
+    assert result.compression_codec == CompressionCodec.SNAPPY
+
+    # none kept by the round trip
+    dataset.format = DatasetFormat.DELIMITED_TEXT
+    dataset.compression_codec = CompressionCodec.NONE
+    resource = factory_service.get_dataset_resource(linked_service, location, dataset)
+    assert resource.properties.compression_codec == "none"
+    assert factory_service.get_dataset_from_resource(resource, service) == dataset
+
+
+def test_dataset_compression_codec(client: TestClient):
+    pipeline_request = get_pipeline_request()
+    parameters = pipeline_request.sink.dict()
+    Dataset(**{**parameters, "format": "Parquet", "compression_codec": "lzo"})
+    Dataset(**{**parameters, "compression_codec": "gzip"})
+    # lzo: Parquet datasets only
+    with pytest.raises(ValidationError):
+        Dataset(**{**parameters, "compression_codec": "lzo"})
+    data = pipeline_request.dict()
+    data["sink"]["compression_codec"] = "lzo"
+    response = client.post(url="/pipeline", json=data)
+    assert response.status_code == 422
+    assert "compression codec lzo" in response.text
@@ -0,0 +1,254 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import src.app as app_module
+from fastapi.testclient import TestClient
+from src.configuration_service import ConfigurationService
+from src.factory_service import FactoryService
+from src.garbage_collector_service import GarbageCollectorService, RateLimiter
+from src.models import GarbageCollectionRequest
+
+
+class FakeOperations:
+    def __init__(self, client, object_type: str, names):
+        self.client = client
+        self.object_type = object_type
+        self.names = set(names)
+
+    def delete(self, resource_group_name, factory_name, name):
+        if name in self.client.failures:
+            raise Exception("Conflict")
+        with self.client.lock:
+            self.names.discard(name)
+            self.client.deleted.append(f"{self.object_type}:{name}")
+
+
+class FakePipelines(FakeOperations):
+    def __init__(self, client, pipelines):
+        super().__init__(client, "pipeline", [pipeline.name for pipeline in pipelines])
+        self.pipelines = pipelines
+
+    def list_by_factory(self, resource_group_name, factory_name):
+        return [pipeline for pipeline in self.pipelines if pipeline.name in self.names]
+
+
+class FakePipelineRuns:
+    def __init__(self, runs):
+        self.runs = runs
+        self.queries = 0
+
+    def query_by_factory(self, resource_group_name, factory_name, filter_parameters):
+        # one run per page
+        self.queries += 1
+        index = int(filter_parameters.continuation_token or 0)
+        runs = [
+            run
+            for run in self.runs
+            if filter_parameters.last_updated_after
+            < run.last_updated
+            <= filter_parameters.last_updated_before
+        ]
+        return SimpleNamespace(
+            value=runs[index: index + 1],
+            continuation_token=str(index + 1) if index + 1 < len(runs) else None,
+        )
+
+
+class FakeDataFactoryClient:
+    def __init__(self, pipelines, runs):
+        self.lock = threading.Lock()
+        self.deleted = []
+        self.failures = set()
+        ids = [pipeline.name[len("Pipeline"):] for pipeline in pipelines]
+        self.pipelines = FakePipelines(self, pipelines)
+        self.data_flows = FakeOperations(
+            self, "dataflow", [f"DataFlow-{id}" for id in ids]
+        )
+        self.datasets = FakeOperations(
+            self,
+            "dataset",
+            [
+                f"{prefix}{id}"
+                for id in ids
+                for prefix in ["SourceDataset", "JoinDataset", "SinkDataset"]
+            ],
+        )
+        self.pipeline_runs = FakePipelineRuns(runs)
+
+
+def get_pipeline(name: str, created: datetime = None):
+    annotations = [f"Pipeline_id:{name[len('Pipeline'):]}"]
+    if created is not None:
+        annotations.append(f"Created:{created.isoformat()}")
+    return SimpleNamespace(name=name, annotations=annotations)
+
+
+@pytest.fixture(scope="function")
+def adf_client():
+    now = datetime.utcnow()
+    return FakeDataFactoryClient(
+        pipelines=[
+            # run yesterday
+            get_pipeline("Pipeline0001", now - timedelta(days=100)),
+            # run 60 days ago
+            get_pipeline("Pipeline0002", now - timedelta(days=100)),
+            # never run, created yesterday
+            get_pipeline("Pipeline0003", now - timedelta(days=1)),
+            # never run, created before the annotation
+            get_pipeline("Pipeline0004"),
+            # not created by the service
+            get_pipeline("CustomPipeline"),
+        ],
+        runs=[
+            SimpleNamespace(
+                pipeline_name="Pipeline0001", last_updated=now - timedelta(days=1)
+            ),
+            SimpleNamespace(
+                pipeline_name="Pipeline0001", last_updated=now - timedelta(days=2)
+            ),
+            SimpleNamespace(
+                pipeline_name="Pipeline0002", last_updated=now - timedelta(days=60)
+            ),
+        ],
+    )
+
+
+def get_collector(adf_client, concurrency: int = 4) -> GarbageCollectorService:
+    return GarbageCollectorService(
+        adf_client,
+        "datafactory-rg",
+        "datafactory-account",
+        pipeline_prefix="Pipeline",
+        object_prefixes=[
+            ("dataflow", "DataFlow-"),
+            ("dataset", "SourceDataset"),
+            ("dataset", "JoinDataset"),
+            ("dataset", "SinkDataset"),
+        ],
+        concurrency=concurrency,
+        rate_limit=0,
+    )
+
+
+def test_collect_dry_run(adf_client):
+    report = get_collector(adf_client).collect(retention_days=30, dry_run=True)
+    assert report.dry_run
+    assert report.pipelines == 4
+    assert report.stale_pipelines == ["Pipeline0002", "Pipeline0004"]
+    assert report.deleted_objects[:5] == [
+        "pipeline:Pipeline0002",
+        "dataflow:DataFlow-0002",
+        "dataset:SourceDataset0002",
+        "dataset:JoinDataset0002",
+        "dataset:SinkDataset0002",
+    ]
+    assert len(report.deleted_objects) == 10
+    assert adf_client.deleted == []
+    # runs read page by page
+    assert adf_client.pipeline_runs.queries == 2
+
+    report = get_collector(adf_client).collect(retention_days=90, dry_run=True)
+    assert report.stale_pipelines == ["Pipeline0004"]
+
+
+def test_collect(adf_client):
+    adf_client.failures.add("JoinDataset0004")
+    report = get_collector(adf_client).collect(retention_days=30, dry_run=False)
+    assert not report.dry_run
+    assert report.stale_pipelines == ["Pipeline0002", "Pipeline0004"]
+    assert sorted(report.deleted_objects) == sorted(adf_client.deleted)
+    assert len(report.deleted_objects) == 8
+    assert report.errors == ["dataset JoinDataset0004: Conflict"]
+    # dependency order for each pipeline
+    for pipeline_id in ["0002", "0004"]:
+        deleted = [name for name in adf_client.deleted if name.endswith(pipeline_id)]
+        assert deleted[:2] == [
+            f"pipeline:Pipeline{pipeline_id}",
+            f"dataflow:DataFlow-{pipeline_id}",
+        ]
+    assert "dataset:SinkDataset0004" not in adf_client.deleted
+    assert [
+        pipeline.name for pipeline in adf_client.pipelines.list_by_factory("", "")
+    ] == [
+        "Pipeline0001",
+        "Pipeline0003",
+        "CustomPipeline",
+    ]
+
+
+def test_rate_limiter():
+    rate_limiter = RateLimiter(rate=100, burst=2)
+    start = time.monotonic()
+    for _ in range(12):
+        rate_limiter.acquire()
+    # 2 requests immediately then 100 requests per second
+    assert time.monotonic() - start >= 0.09
+
+
+def test_collect_garbage_endpoint(client: TestClient, adf_client, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_GC_RETENTION_DAYS", "90")
+    monkeypatch.setenv("DATAFACTORY_GC_RATE_LIMIT", "0")
+    ConfigurationService.reload()
+
+    def initialize_azure_clients(factory_service):
+        factory_service.adf_client = adf_client
+        return True
+
+    with patch.object(
+        FactoryService, "initialize_azure_clients", initialize_azure_clients
+    ):
+        response = client.post(url="/admin/gc")
+        assert response.status_code == 200
+        assert response.json()["dry_run"]
+        assert response.json()["stale_pipelines"] == ["Pipeline0004"]
+        assert adf_client.deleted == []
+
+        response = client.post(
+            url="/admin/gc",
+            json=GarbageCollectionRequest(dry_run=False, retention_days=30).dict(),
+        )
+        assert response.status_code == 200
+        assert response.json()["retention_days"] == 30
+        assert len(adf_client.deleted) == 10
+
+
+def test_collect_garbage_local_backend(client: TestClient, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "local")
+    monkeypatch.setenv("DATAFACTORY_LOCAL_ROOT", str(tmp_path))
+    ConfigurationService.reload()
+    response = client.post(url="/admin/gc")
+    assert response.status_code == 400
+
+
+def test_scheduled_garbage_collection_leader(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_GC_INTERVAL", "1")
+    monkeypatch.setenv("DATAFACTORY_LEADER_BACKEND", "file")
+    monkeypatch.setenv("DATAFACTORY_LEADER_URL", str(tmp_path))
+    ConfigurationService.reload()
+    collections = []
+
+    class FakeFactoryService:
+        def collect_garbage(self, request):
+            collections.append(request)
+            return "report"
+
+    monkeypatch.setattr(app_module, "get_factory_service", FakeFactoryService)
+    # two workers: a single one holds the lease and collects
+    stops = [threading.Event(), threading.Event()]
+    threads = [
+        threading.Thread(target=app_module.run_garbage_collection, args=(stop,))
+        for stop in stops
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(1.5)
+    for stop in stops:
+        stop.set()
+    for thread in threads:
+        thread.join()
+    assert len(collections) == 1
+    assert collections[0].dry_run
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+from src.import_service import ImportService, LazyModule
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       303 |       303 |     azure.mgmt.datafactory._version
+import time:       470 |     68887 |   azure.mgmt.datafactory
+import time:     11604 |     98190 | src.factory_service
+not an import time line
+"""
+
+
+def test_lazy_import():
+    module = ImportService.lazy_import("colorsys")
+    assert isinstance(module, LazyModule)
+    assert ImportService.lazy_import("colorsys") is module
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "colorsys" in ImportService().get_durations()
+
+
+def test_warm_up():
+    ImportService.lazy_import("wave")
+    durations = ImportService().warm_up(["wave"])
+    assert "wave" in durations
+    ImportService().start_warm_up(["wave"]).join()
+
+
+def test_get_import_times():
+    assert ImportService().get_import_times(IMPORTTIME_OUTPUT) == [
+        ("azure.mgmt.datafactory._version", 303, 303, 2),
+        ("azure.mgmt.datafactory", 470, 68887, 1),
+        ("src.factory_service", 11604, 98190, 0),
+    ]
+
+
+def test_heavy_modules_not_imported_by_app():
+    # new interpreter: the tests already imported the modules
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.app; "
+            "print(sorted({m.split('.')[0] for m in sys.modules} "
+            "& {'pyarrow', 'numpy', 'msal'}), "
+            "sorted(m for m in sys.modules if m.startswith('azure.')))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[] []"
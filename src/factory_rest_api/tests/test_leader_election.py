@@ -0,0 +1,203 @@
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import src.app as app_module
+from src.cache_service import CacheService, MemoryCacheBackend
+from src.configuration_service import ConfigurationService, Settings
+from src.factory_service import FactoryService
+from src.leader_election_service import (
+    FileLeaseBackend,
+    LeaderElectionService,
+    RedisLeaseBackend,
+    SQLiteLeaseBackend,
+)
+from src.models import Status
+from src.run_poller_service import RunPollerService
+
+
+@pytest.fixture(params=["file", "sqlite", "redis"])
+def lease_backend(request, tmp_path, redis_server):
+    if request.param == "file":
+        # one backend per worker: the lock files are opened by each worker
+        return lambda: FileLeaseBackend(str(tmp_path))
+    if request.param == "sqlite":
+        return lambda: SQLiteLeaseBackend(str(tmp_path / "leases.db"))
+    redis_server.entries.clear()
+    return lambda: RedisLeaseBackend(redis_server.url)
+
+
+def test_leader_election(lease_backend):
+    first = LeaderElectionService(lease_backend(), "run-poller", ttl=60)
+    second = LeaderElectionService(lease_backend(), "run-poller", ttl=60)
+    other = LeaderElectionService(lease_backend(), "gc", ttl=60)
+    assert first.acquire()
+    assert not second.acquire()
+    assert other.acquire()
+    # renewal
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert not first.leader
+    assert second.acquire()
+    assert not first.acquire()
+    second.release()
+    other.release()
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_leader_election_expiration(kind, tmp_path, redis_server):
+    if kind == "sqlite":
+        backend = SQLiteLeaseBackend(str(tmp_path / "leases.db"))
+    else:
+        redis_server.entries.clear()
+        backend = RedisLeaseBackend(redis_server.url)
+    first = LeaderElectionService(backend, "run-poller", ttl=0.1)
+    second = LeaderElectionService(backend, "run-poller", ttl=0.1)
+    assert first.acquire()
+    assert not second.acquire()
+    # the leader stopped without releasing its lease
+    time.sleep(0.2)
+    assert second.acquire()
+    assert not first.acquire()
+
+
+class FakePipelineRuns:
+    def __init__(self, runs):
+        self.runs = runs
+        self.queries = []
+
+    def query_by_factory(self, resource_group_name, factory_name, filter_parameters):
+        # one run per page
+        self.queries.append(filter_parameters)
+        index = int(filter_parameters.continuation_token or 0)
+        statuses = filter_parameters.filters[0].values
+        runs = [
+            run
+            for run in self.runs
+            if run.status in statuses
+            and filter_parameters.last_updated_after
+            < run.last_updated
+            <= filter_parameters.last_updated_before
+        ]
+        return SimpleNamespace(
+            value=runs[index:][:1],
+            continuation_token=str(index + 1) if index + 1 < len(runs) else None,
+        )
+
+
+def get_run(run_id: str, pipeline_name: str, status: Status, last_updated: datetime):
+    return SimpleNamespace(
+        run_id=run_id,
+        pipeline_name=pipeline_name,
+        status=status.value,
+        last_updated=last_updated,
+        run_start=last_updated - timedelta(minutes=1),
+        run_end=None if status == Status.IN_PROGRESS else last_updated,
+        duration_in_ms=None if status == Status.IN_PROGRESS else 60000,
+        message="",
+    )
+
+
+def test_run_poller():
+    now = datetime.utcnow()
+    pipeline_runs = FakePipelineRuns(
+        [
+            get_run(
+                "run-1", "Pipeline0001", Status.IN_PROGRESS, now - timedelta(hours=2)
+            ),
+            get_run("run-2", "Pipeline0001", Status.QUEUED, now - timedelta(seconds=5)),
+            get_run(
+                "run-3", "Pipeline0002", Status.SUCCEEDED, now - timedelta(seconds=5)
+            ),
+            # completed before the previous poll
+            get_run("run-4", "Pipeline0002", Status.FAILED, now - timedelta(hours=1)),
+            # not created by the service
+            get_run("run-5", "CustomPipeline", Status.IN_PROGRESS, now),
+        ]
+    )
+    with patch.object(FactoryService, "initialize_azure_clients", return_value=True):
+        factory_service = FactoryService(
+            "subscription", "datafactory-rg", "datafactory", "source", "sink"
+        )
+    factory_service.adf_client = SimpleNamespace(pipeline_runs=pipeline_runs)
+    cache = CacheService(MemoryCacheBackend(), "datafactory-rg/datafactory", ttl=300)
+    poller = RunPollerService(
+        window=timedelta(hours=24), interval=10, pipeline_prefix="Pipeline"
+    )
+
+    with patch.object(FactoryService, "get_cache", return_value=cache):
+        run_responses = factory_service.poll_runs(poller, ttl=30)
+        assert sorted(run_response.run_id for run_response in run_responses) == [
+            "run-1",
+            "run-2",
+            "run-3",
+        ]
+        # active runs (3 pages) and completed runs (1 page)
+        assert len(pipeline_runs.queries) == 4
+        assert (
+            cache.get_run("Pipeline0001", "run-1").status.status == Status.IN_PROGRESS
+        )
+        assert cache.get_run("Pipeline0002", "run-3").status.duration == 60000
+        assert cache.get_run("Pipeline0002", "run-4") is None
+
+        # the workers read the status published by the leader
+        with patch.object(
+            FactoryService, "get_run_data_flow_status"
+        ) as mock_get_run_data_flow_status:
+            run_response = factory_service.run_status("Pipeline0001", "run-2")
+            assert run_response.status.status == Status.QUEUED
+            assert mock_get_run_data_flow_status.call_count == 0
+
+
+def test_lease_scope_of_the_cache():
+    for environ, backend, url in [
+        ({}, "file", ""),
+        ({"DATAFACTORY_CACHE_BACKEND": "memory"}, "file", ""),
+        ({"DATAFACTORY_CACHE_BACKEND": "sqlite"}, "sqlite", ""),
+        (
+            {
+                "DATAFACTORY_CACHE_BACKEND": "redis",
+                "DATAFACTORY_CACHE_URL": "redis://cache:6379/0",
+            },
+            "redis",
+            "redis://cache:6379/0",
+        ),
+        (
+            {
+                "DATAFACTORY_CACHE_BACKEND": "redis",
+                "DATAFACTORY_LEADER_BACKEND": "file",
+                "DATAFACTORY_LEADER_URL": "/tmp/leases",
+            },
+            "file",
+            "/tmp/leases",
+        ),
+    ]:
+        configuration = ConfigurationService(Settings.load(environ))
+        assert configuration.get_leader_backend() == backend
+        assert configuration.get_leader_url() == url
+
+
+def test_run_poller_start(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_RUN_POLL_INTERVAL", "60")
+    monkeypatch.setenv("DATAFACTORY_LEADER_URL", str(tmp_path / "leases.db"))
+    try:
+        for cache_backend, leader_backend, started in [
+            ("none", "", False),
+            ("memory", "", False),
+            # a leader per replica
+            ("redis", "file", False),
+            ("redis", "sqlite", False),
+            ("sqlite", "", True),
+            ("sqlite", "sqlite", True),
+        ]:
+            monkeypatch.setenv("DATAFACTORY_CACHE_BACKEND", cache_backend)
+            monkeypatch.setenv("DATAFACTORY_LEADER_BACKEND", leader_backend)
+            ConfigurationService.reload()
+            app_module.start_run_poller()
+            assert ("run-poller" in app_module.background_tasks) == started
+            app_module.stop_run_poller()
+    finally:
+        app_module.stop_run_poller()
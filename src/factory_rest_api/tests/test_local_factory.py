@@ -0,0 +1,315 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from src.configuration_service import ConfigurationService
+from src.local_engine_service import LocalEngineError, LocalEngineService
+from src.local_factory_service import LocalFactoryService
+from src.models import DatasetFormat, EscapeCharacter, PipelineRequest, Status
+from tests.conftest import (
+    DATA_PATH,
+    SINK_CONTAINER,
+    SOURCE_CONTAINER,
+    STORAGE_ACCOUNT_NAME,
+    get_dataset,
+    get_pipeline_request,
+    wait_for_run,
+)
+
+
+def read_file(path: str) -> str:
+    with open(path) as file:
+        return file.read()
+
+
+def test_local_engine_get_sink_file_name():
+    engine = LocalEngineService("")
+    assert engine.get_sink_file_name("sinkdata.csv") == "sinkdata-00001.csv"
+    assert engine.get_sink_file_name("sinkdata-00001.csv") == "sinkdata-00001.csv"
+    assert engine.get_sink_file_name("sinkdata.csv", 12) == "sinkdata-00012.csv"
+
+
+@pytest.mark.parametrize(
+    "engine", [LocalEngineService.CSV_ENGINE, LocalEngineService.ARROW_ENGINE]
+)
+def test_local_engine_run(local_root, engine):
+    engine = LocalEngineService(local_root, engine=engine)
+    pipeline_request = get_pipeline_request()
+    metrics = engine.run(pipeline_request)
+    assert metrics["source_rows"] == 8
+    assert metrics["join_rows"] == 4
+    assert metrics["sink_rows"] == 4
+    assert read_file(engine.get_path(pipeline_request.sink)) == read_file(
+        os.path.join(DATA_PATH, "sinkdata.csv")
+    )
+
+
+@pytest.mark.parametrize(
+    "engine", [LocalEngineService.CSV_ENGINE, LocalEngineService.ARROW_ENGINE]
+)
+def test_local_engine_run_duplicated_keys_and_quotes(tmp_path, engine):
+    folder = tmp_path / STORAGE_ACCOUNT_NAME / SOURCE_CONTAINER
+    folder.mkdir(parents=True)
+    (folder / "source.csv").write_text(
+        'key;name;address\n1;"Fred; Jr";"4 ""Los Gatos"" street"\n2;Bob;8 street\n'
+    )
+    (folder / "join.csv").write_text("key\n1\n1\n3\n")
+    pipeline_request = PipelineRequest(
+        source=get_dataset(SOURCE_CONTAINER, "", "source.csv"),
+        join=get_dataset(SOURCE_CONTAINER, "", "join.csv"),
+        columns=["key", "name", "address"],
+        sink=get_dataset(SINK_CONTAINER, "", "sink.csv"),
+    )
+    engine = LocalEngineService(str(tmp_path), engine=engine, batch_size=64)
+    metrics = engine.run(pipeline_request)
+    assert metrics["sink_rows"] == 2
+    assert read_file(engine.get_path(pipeline_request.sink, "sink-00001.csv")) == (
+        'key;name;address\n1;"Fred; Jr";"4 ""Los Gatos"" street"\n'
+        '1;"Fred; Jr";"4 ""Los Gatos"" street"\n'
+    )
+
+
+def test_local_engine_run_partitioned(local_root, tmp_path):
+    # memory limit lower than the size of the join dataset: grace hash join
+    engine = LocalEngineService(local_root, memory_limit=1, spill_folder=str(tmp_path))
+    pipeline_request = get_pipeline_request()
+    metrics = engine.run(pipeline_request)
+    assert metrics["spill_partitions"] > 1
+    assert metrics["spilled_bytes"] > 0
+    assert metrics["source_rows"] == 8
+    assert metrics["join_rows"] == 4
+    assert metrics["sink_rows"] == 4
+    # the rows are grouped by partition
+    lines = read_file(engine.get_path(pipeline_request.sink)).splitlines()
+    expected = read_file(os.path.join(DATA_PATH, "sinkdata.csv")).splitlines()
+    assert lines[0] == expected[0]
+    assert sorted(lines[1:]) == sorted(expected[1:])
+    # the temporary partition files are removed
+    assert [path.name for path in tmp_path.iterdir()] == [STORAGE_ACCOUNT_NAME]
+
+
+def test_local_engine_run_partitioned_duplicated_keys(tmp_path):
+    folder = tmp_path / STORAGE_ACCOUNT_NAME / SOURCE_CONTAINER
+    folder.mkdir(parents=True)
+    keys = [f"k{i % 50}" for i in range(500)]
+    (folder / "source.csv").write_text(
+        "key;value\n" + "".join(f"{key};{i}\n" for i, key in enumerate(keys))
+    )
+    (folder / "join.csv").write_text(
+        "key\n" + "".join(f"k{i % 20}\n" for i in range(0, 60, 2))
+    )
+    pipeline_request = PipelineRequest(
+        source=get_dataset(SOURCE_CONTAINER, "", "source.csv"),
+        join=get_dataset(SOURCE_CONTAINER, "", "join.csv"),
+        columns=["key", "value"],
+        sink=get_dataset(SINK_CONTAINER, "", "sink.csv"),
+    )
+    sink_path = LocalEngineService(str(tmp_path)).get_path(
+        pipeline_request.sink, "sink-00001.csv"
+    )
+    results = []
+    for memory_limit in [1 << 30, 32]:
+        engine = LocalEngineService(
+            str(tmp_path), batch_size=256, memory_limit=memory_limit
+        )
+        metrics = engine.run(pipeline_request)
+        results.append(sorted(read_file(sink_path).splitlines()))
+    assert metrics["spill_partitions"] > 1
+    assert metrics["sink_rows"] == len(results[0]) - 1
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("escape_char", ['"', "\\"])
+def test_local_engine_byte_ranges(escape_char):
+    engine = LocalEngineService("")
+    dataset = get_dataset(SOURCE_CONTAINER, "", "source.csv")
+    dataset.escape_char = escape_char
+    escaped_quote = escape_char + '"'
+    records = [
+        f'{i};"a;{escaped_quote}\n{i}";b\n' if i % 3 else f"{i};a;b\n"
+        for i in range(100)
+    ]
+    text = "".join(records)
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    ranges = engine.get_byte_ranges(data, 0, 10, dataset)
+    assert len(ranges) > 50
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    # each range starts with a record
+    record_starts = np.cumsum([0] + [len(record) for record in records])
+    assert all(start in record_starts for start, _ in ranges)
+    assert all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1))
+
+
+def test_local_engine_run_byte_ranges(tmp_path):
+    folder = tmp_path / STORAGE_ACCOUNT_NAME / SOURCE_CONTAINER
+    folder.mkdir(parents=True)
+    (folder / "source.csv").write_text(
+        "key;name;address\n"
+        + "".join(f'{i};"Name; {i}";"{i} ""Los\nGatos"" street"\n' for i in range(200))
+    )
+    (folder / "join.csv").write_text(
+        "key\n" + "".join(f"{i}\n" for i in range(0, 200, 3))
+    )
+    pipeline_request = PipelineRequest(
+        source=get_dataset(SOURCE_CONTAINER, "", "source.csv"),
+        join=get_dataset(SOURCE_CONTAINER, "", "join.csv"),
+        columns=["key", "address"],
+        sink=get_dataset(SINK_CONTAINER, "", "sink.csv"),
+    )
+    # several ranges of 4 batches scanned by 4 threads
+    engine = LocalEngineService(str(tmp_path), batch_size=64, scan_threads=4)
+    metrics = engine.run(pipeline_request)
+    assert metrics["source_rows"] == 200
+    assert metrics["sink_rows"] == 67
+    assert read_file(engine.get_path(pipeline_request.sink, "sink-00001.csv")) == (
+        "key;address\n"
+        + "".join(f'{i};"{i} ""Los\nGatos"" street"\n' for i in range(0, 200, 3))
+    )
+
+
+def test_local_engine_run_workers(local_root):
+    pipeline_request = get_pipeline_request()
+    # stale partition file of a previous run
+    engine = LocalEngineService(local_root, batch_size=128, workers=2)
+    stale_path = engine.get_path(pipeline_request.sink, "sinkdata-00009.csv")
+    os.makedirs(os.path.dirname(stale_path))
+    open(stale_path, "w").close()
+    metrics = engine.run(pipeline_request)
+    assert not os.path.exists(stale_path)
+    assert metrics["source_rows"] == 8
+    assert metrics["sink_rows"] == 4
+    assert metrics["sink_files"] > 1
+    # each partition file has a header, the rows are in the source order
+    expected = read_file(os.path.join(DATA_PATH, "sinkdata.csv")).splitlines()
+    lines = []
+    for index in range(1, metrics["sink_files"] + 1):
+        path = engine.get_path(
+            pipeline_request.sink,
+            engine.get_sink_file_name(
+                pipeline_request.sink.file_pattern_or_name, index
+            ),
+        )
+        partition = read_file(path).splitlines()
+        assert partition[0] == expected[0]
+        lines += partition[1:]
+    assert lines == expected[1:]
+
+
+@pytest.mark.parametrize("quote_char", ['"', "'"])
+@pytest.mark.parametrize("first_row_as_header", [True, False])
+def test_local_engine_run_escape_char(tmp_path, quote_char, first_row_as_header):
+    datasets = [
+        get_dataset(SOURCE_CONTAINER, "", "source.csv"),
+        get_dataset(SOURCE_CONTAINER, "", "join.csv"),
+        get_dataset(SINK_CONTAINER, "", "sink.csv"),
+    ]
+    for dataset in datasets:
+        dataset.quote_char = quote_char
+        dataset.escape_char = EscapeCharacter.BACKSLASH.value
+        dataset.first_row_as_header = first_row_as_header
+    source, join, sink = datasets
+    engine = LocalEngineService(str(tmp_path))
+    values = ["C:\\temp", 'say "hi"', "it's", "a;b", "\\'\"", "plain"]
+    rows = [
+        [str(i), values[i % len(values)], values[-i % len(values)]] for i in range(300)
+    ]
+    for dataset, dataset_rows in [
+        (source, rows),
+        (join, [[str(i)] for i in range(0, 300, 2)]),
+    ]:
+        path = engine.get_path(dataset)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file, **engine.get_csv_format(dataset))
+            if first_row_as_header:
+                writer.writerow(["key", "name", "address"][: len(dataset_rows[0])])
+            writer.writerows(dataset_rows)
+    columns = (
+        ["key", "name", "address"]
+        if first_row_as_header
+        else ["Prop_0", "Prop_1", "Prop_2"]
+    )
+    pipeline_request = PipelineRequest(
+        source=source, join=join, columns=columns, sink=sink
+    )
+
+    results = []
+    for options in [
+        {"engine": LocalEngineService.CSV_ENGINE},
+        {"batch_size": 256},
+        {"batch_size": 256, "memory_limit": 32},
+        {"batch_size": 256, "workers": 2},
+    ]:
+        engine = LocalEngineService(str(tmp_path), **options)
+        metrics = engine.run(pipeline_request)
+        assert metrics["sink_rows"] == 150
+        records = []
+        for index in range(1, metrics["sink_files"] + 1):
+            path = engine.get_path(sink, engine.get_sink_file_name("sink.csv", index))
+            with open(path, newline="") as file:
+                reader = csv.reader(file, **engine.get_csv_format(sink))
+                if first_row_as_header:
+                    assert next(reader) == columns
+                records += list(reader)
+        results.append(sorted(records))
+    # same records read back by the csv module for all the engines
+    assert results[0] == sorted(row for row in rows if int(row[0]) % 2 == 0)
+    assert all(result == results[0] for result in results[1:])
+
+
+def test_local_engine_validate():
+    engine = LocalEngineService("")
+    pipeline_request = get_pipeline_request()
+    pipeline_request.sink.format = DatasetFormat.PARQUET
+    with pytest.raises(LocalEngineError):
+        engine.validate(pipeline_request)
+    # a single file read: the wildcards of Data Factory are not supported
+    pipeline_request = get_pipeline_request()
+    pipeline_request.source.file_pattern_or_name = "source-*.csv"
+    with pytest.raises(LocalEngineError, match="File pattern source-"):
+        engine.validate(pipeline_request)
+
+
+def test_local_engine_unknown_column(local_root):
+    engine = LocalEngineService(local_root)
+    pipeline_request = get_pipeline_request()
+    pipeline_request.columns = ["key", "unknown"]
+    with pytest.raises(LocalEngineError):
+        engine.run(pipeline_request)
+
+
+def test_local_pipeline_run(client: TestClient, local_root, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "local")
+    monkeypatch.setenv("DATAFACTORY_LOCAL_ROOT", local_root)
+    ConfigurationService.reload()
+    pipeline_request = get_pipeline_request()
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    assert response.status_code == 200
+    assert response.json()["error"]["code"] == 0
+    pipeline_name = response.json()["pipeline_name"]
+
+    response = client.get(url=f"/pipeline/{pipeline_name}")
+    assert response.status_code == 200
+    assert response.json()["columns"] == pipeline_request.columns
+
+    response = client.post(url=f"/pipeline/{pipeline_name}/run")
+    assert response.status_code == 200
+    run_id = response.json()["run_id"]
+    assert run_id.startswith(LocalFactoryService.RUN_PREFIX)
+
+    assert wait_for_run(client, pipeline_name, run_id) == Status.SUCCEEDED
+    response = client.get(url=f"/pipeline/{pipeline_name}/run/{run_id}")
+    assert response.json()["metrics"]["sink_rows"] == 4
+    sink_path = LocalEngineService(local_root).get_path(pipeline_request.sink)
+    assert read_file(sink_path) == read_file(os.path.join(DATA_PATH, "sinkdata.csv"))
+
+
+def test_local_pipeline_not_found(client: TestClient, local_root, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "local")
+    monkeypatch.setenv("DATAFACTORY_LOCAL_ROOT", local_root)
+    ConfigurationService.reload()
+    response = client.get(url="/pipeline/Pipeline0000000")
+    assert response.status_code == 404
@@ -0,0 +1,213 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from src.factory_service import FactoryService, FactoryServiceError
+from src.models import (
+    Backend,
+    CompressionCodec,
+    Dataset,
+    DatasetFormat,
+    Error,
+    PipelineResponse,
+    RoutingDecision,
+    RunResponse,
+    Status,
+    StatusDetails,
+)
+from src.response_service import (
+    CompressionMiddleware,
+    FactoryJSONResponse,
+    dumps,
+    get_accepted_encoding,
+    http_exception_handler,
+)
+from tests.conftest import get_pipeline_request
+
+
+def get_run_response() -> RunResponse:
+    return RunResponse(
+        run_id="run-id",
+        pipeline_name="pipeline-name",
+        status=StatusDetails(
+            status="Succeeded",
+            start=datetime(2022, 1, 3, 10, 2, 22, 123456),
+            end=datetime(2022, 1, 3, 10, 3, 22),
+            duration=60000,
+        ),
+        error=Error(
+            code=0, message="", source="factory_rest_api", date=datetime.utcnow()
+        ),
+        metrics={"sink_rows": 4},
+        routing=RoutingDecision(
+            backend=Backend.LOCAL,
+            input_size=100,
+            estimated_durations={Backend.LOCAL: 1000, Backend.DATA_FACTORY: 300000},
+            reason="",
+        ),
+    )
+
+
+def test_dumps_same_as_jsonable_encoder():
+    for model in [get_run_response(), get_pipeline_request()]:
+        assert json.loads(dumps(model)) == jsonable_encoder(model)
+    run_response = get_run_response()
+    assert json.loads(dumps([run_response])) == [jsonable_encoder(run_response)]
+
+
+def test_http_exception_single_encoding():
+    error = Error(
+        code=404, message="not found", source="factory_rest_api", date=datetime.utcnow()
+    )
+    response = asyncio.run(
+        http_exception_handler(None, HTTPException(status_code=404, detail=error))
+    )
+    assert response.status_code == 404
+    # the error is an object, not a json string in a json string
+    assert json.loads(response.body)["detail"] == jsonable_encoder(error)
+
+
+@pytest.fixture(scope="module")
+def factory_service() -> FactoryService:
+    with patch.object(FactoryService, "initialize_azure_clients", return_value=True):
+        return FactoryService(
+            "subscription", "datafactory-rg", "datafactory", "source", "sink"
+        )
+
+
+def test_trusted_construction_same_as_validation(factory_service: FactoryService):
+    run_response = factory_service.create_run_response(
+        run_id="run-id",
+        pipeline_name="pipeline-name",
+        status="InProgress",
+        start=datetime(2022, 1, 3, 10, 2, 22),
+        end=datetime(2022, 1, 3, 10, 3, 22),
+        duration_in_ms=60000,
+        error_code=FactoryServiceError.NO_ERROR,
+        error_message=None,
+    )
+    assert run_response.status.status is Status.IN_PROGRESS
+    assert type(run_response.error.code) is int
+    assert run_response == RunResponse(**jsonable_encoder(run_response))
+    assert dumps(run_response) == dumps(RunResponse(**jsonable_encoder(run_response)))
+    with pytest.raises(ValueError):
+        factory_service.create_run_response(
+            run_id="run-id",
+            pipeline_name="pipeline-name",
+            status="Cancelled",
+            start=datetime.utcnow(),
+            end=datetime.utcnow(),
+            duration_in_ms=0,
+            error_code=0,
+            error_message="",
+        )
+
+    pipeline_request = get_pipeline_request()
+    pipeline_response = factory_service.create_pipeline_response(
+        pipeline_request, "Pipeline0001", FactoryServiceError.NO_ERROR, ""
+    )
+    assert pipeline_response == PipelineResponse(**jsonable_encoder(pipeline_response))
+    pipeline_response = factory_service.create_pipeline_response(
+        None, "Pipeline0001", FactoryServiceError.PIPELINE_ID_NOT_FOUND, "not found"
+    )
+    assert pipeline_response == PipelineResponse(**jsonable_encoder(pipeline_response))
+
+    dataset = factory_service.get_dataset_from_resource(
+        SimpleNamespace(
+            properties=SimpleNamespace(
+                location=SimpleNamespace(
+                    container="source", folder_path="folder", file_name="data.csv"
+                ),
+                compression_codec="GZIP",
+            )
+        ),
+        SimpleNamespace(
+            properties=SimpleNamespace(
+                service_endpoint="https://storageaccount.blob.core.windows.net/"
+            )
+        ),
+    )
+    assert dataset.compression_codec is CompressionCodec.GZIP
+    assert dataset.format is DatasetFormat.DELIMITED_TEXT
+    assert dataset == Dataset(**jsonable_encoder(dataset))
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip, deflate", "gzip"),
+        ("identity", None),
+        ("gzip;q=0", None),
+        ("*", "gzip"),
+        ("", None),
+    ],
+)
+def test_get_accepted_encoding(accept_encoding, encoding):
+    if accept_encoding == "*" and get_accepted_encoding("br") == "br":
+        # brotli module installed
+        encoding = "br"
+    assert get_accepted_encoding(accept_encoding) == encoding
+
+
+@pytest.fixture(scope="module")
+def compression_client() -> TestClient:
+    app = FastAPI(default_response_class=FactoryJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/runs")
+    def get_runs(count: int):
+        return FactoryJSONResponse([get_run_response() for _ in range(count)])
+
+    @app.get("/stream")
+    def get_stream():
+        return StreamingResponse(
+            (f"line {index}\n".encode() for index in range(1000)),
+            media_type="text/plain",
+        )
+
+    return TestClient(app)
+
+
+def test_compression(compression_client: TestClient):
+    response = compression_client.get(
+        "/runs", params={"count": 100}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(response.content)
+    assert len(response.json()) == 100
+
+    # small response
+    response = compression_client.get(
+        "/runs", params={"count": 1}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert "Content-Encoding" not in response.headers
+    assert len(response.json()) == 1
+
+    # not accepted by the client
+    response = compression_client.get(
+        "/runs", params={"count": 100}, headers={"Accept-Encoding": "identity"}
+    )
+    assert "Content-Encoding" not in response.headers
+
+    response = compression_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.text.splitlines()[-1] == "line 999"
+
+
+def test_compression_brotli(compression_client: TestClient):
+    pytest.importorskip("brotli")
+    response = compression_client.get(
+        "/runs", params={"count": 100}, headers={"Accept-Encoding": "gzip, br"}
+    )
+    assert response.headers["Content-Encoding"] == "br"
+    # decoded by urllib3 with the brotli module
+    assert len(response.json()) == 100
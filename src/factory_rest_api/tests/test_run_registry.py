@@ -0,0 +1,111 @@
+import threading
+import time
+
+from src.models import Status
+from src.run_registry_service import RunRegistryService
+
+
+def test_run_registry_find_active_run():
+    registry = RunRegistryService()
+    registry.clear()
+    parameters = {"Pipeline_id": "0000000"}
+    registry.register_run(
+        run_id="run-0",
+        pipeline_name="Pipeline0000000",
+        parameters=parameters,
+        status=Status.QUEUED,
+    )
+    record = registry.find_active_run("Pipeline0000000", parameters)
+    assert record.run_id == "run-0"
+    assert registry.find_active_run("Pipeline0000000", {"Pipeline_id": "1"}) is None
+    registry.update_status("run-0", Status.SUCCEEDED)
+    assert registry.find_active_run("Pipeline0000000", parameters) is None
+    registry.clear()
+
+
+def test_run_registry_find_run_by_idempotency_key():
+    registry = RunRegistryService()
+    registry.clear()
+    registry.register_run(
+        run_id="run-0",
+        pipeline_name="Pipeline0000000",
+        parameters={},
+        status=Status.SUCCEEDED,
+        idempotency_key="key-0",
+    )
+    record = registry.find_run_by_idempotency_key("Pipeline0000000", "key-0")
+    assert record.run_id == "run-0"
+    assert registry.find_run_by_idempotency_key("Pipeline0000001", "key-0") is None
+    assert registry.find_run_by_idempotency_key("Pipeline0000000", "") is None
+    registry.clear()
+
+
+def test_run_registry_expiration():
+    registry = RunRegistryService(ttl=60)
+    registry.clear()
+    record = registry.register_run(
+        run_id="run-0",
+        pipeline_name="Pipeline0000000",
+        parameters={},
+        status=Status.IN_PROGRESS,
+        idempotency_key="key-0",
+    )
+    record.created = time.time() - 120
+    assert registry.find_active_run("Pipeline0000000", {}) is None
+    assert registry.find_run_by_idempotency_key("Pipeline0000000", "key-0") is None
+    registry.purge()
+    assert registry.get_run("run-0") is None
+
+
+def test_run_registry_lock():
+    registry = RunRegistryService()
+    registry.clear()
+    run_key = registry.get_run_key("Pipeline0000000", {})
+    entered = []
+
+    def run():
+        with registry.lock(run_key) as run_lock:
+            entered.append(run_lock)
+
+    with registry.lock(run_key) as run_lock:
+        # the same lock for the requests of the run key
+        thread = threading.Thread(target=run)
+        thread.start()
+        while run_lock.users < 2:
+            time.sleep(0.01)
+        assert entered == []
+        assert RunRegistryService._run_locks == {run_key: run_lock}
+    thread.join()
+    assert entered == [run_lock]
+    # removed by the last request
+    assert RunRegistryService._run_locks == {}
+
+    registry.lock(run_key)
+    registry.clear()
+    assert RunRegistryService._run_locks == {}
+
+
+def test_run_registry_purge_interval():
+    registry = RunRegistryService(ttl=60, purge_interval=60)
+    registry.clear()
+    for index in range(2):
+        record = registry.register_run(
+            run_id=f"run-{index}",
+            pipeline_name="Pipeline0000000",
+            parameters={},
+            status=Status.SUCCEEDED,
+        )
+        record.created = time.time() - 120
+    # purged by the first registration only
+    assert registry.get_run("run-1") is not None
+    RunRegistryService._purged = time.time() - 60
+    registry.register_run(
+        run_id="run-2",
+        pipeline_name="Pipeline0000000",
+        parameters={},
+        status=Status.SUCCEEDED,
+    )
+    assert registry.get_run("run-0") is None
+    assert registry.get_run("run-1") is None
+    assert registry.get_run("run-2") is not None
+    registry.clear()
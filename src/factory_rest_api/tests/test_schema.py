@@ -0,0 +1,190 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+from fastapi.testclient import TestClient
+from src.configuration_service import ConfigurationService
+from src.models import ColumnDelimiter, QuoteCharacter
+from src.schema_service import BlobHeadReader, LocalHeadReader, SchemaService
+from tests.conftest import (
+    SOURCE_CONTAINER,
+    STORAGE_ACCOUNT_NAME,
+    get_dataset,
+    get_pipeline_request,
+)
+
+
+class CountingReader(LocalHeadReader):
+    def __init__(self, root: str) -> None:
+        super().__init__(root)
+        self.reads = 0
+
+    def read(self, dataset, name, size):
+        self.reads += 1
+        return super().read(dataset, name, size)
+
+
+@pytest.fixture(scope="function")
+def schema_service(local_root):
+    schema_service = SchemaService(CountingReader(local_root), size=64)
+    schema_service.clear()
+    yield schema_service
+    schema_service.clear()
+
+
+def write_source(local_root: str, text: str):
+    path = os.path.join(
+        local_root,
+        STORAGE_ACCOUNT_NAME,
+        SOURCE_CONTAINER,
+        "source/0000",
+        "sourcedata.csv",
+    )
+    with open(path, "w") as file:
+        file.write(text)
+    # new version of the file
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+
+
+def test_sniff(schema_service):
+    dataset = get_dataset(SOURCE_CONTAINER, "source/0000", "sourcedata.csv")
+    schema = schema_service.sniff(b'key;name\n"1";"a"\n', dataset)
+    assert schema.columns == ["key", "name"]
+    assert schema.column_delimiter == ColumnDelimiter.SEMICOLON
+    assert schema.quote_char == QuoteCharacter.DOUBLE_QUOTE
+    schema = schema_service.sniff(b"key,name\n'1','a'\n", dataset)
+    assert schema.column_delimiter == ColumnDelimiter.COMMA
+    assert schema.columns == ["key", "name"]
+    assert schema.quote_char == QuoteCharacter.SINGLE_QUOTE
+    # the last record of the first bytes is incomplete
+    schema = schema_service.sniff(b"key|name\n1|a\n" + b"2" * 64, dataset)
+    assert schema.column_delimiter == ColumnDelimiter.PIPE
+    dataset.first_row_as_header = False
+    schema = schema_service.sniff(b"1;a;b\n2;c;d\n", dataset)
+    assert schema.columns == ["Prop_0", "Prop_1", "Prop_2"]
+
+
+def test_check(local_root, schema_service):
+    pipeline_request = get_pipeline_request()
+    assert schema_service.check(pipeline_request) == []
+    assert schema_service.reader.reads == 2
+    # cached by version
+    assert schema_service.check(pipeline_request) == []
+    assert schema_service.reader.reads == 2
+
+    pipeline_request.columns = ["key", "phone", "mail"]
+    errors = schema_service.check(pipeline_request)
+    assert len(errors) == 1
+    assert errors[0].startswith("source dataset: columns ['mail'] not in the header")
+    assert schema_service.reader.reads == 2
+
+    pipeline_request.columns = ["id", "phone"]
+    errors = schema_service.check(pipeline_request)
+    assert [error.split(":")[0] for error in errors] == [
+        "source dataset",
+        "join dataset",
+    ]
+
+    pipeline_request = get_pipeline_request()
+    pipeline_request.join.file_pattern_or_name = "unknown.csv"
+    assert schema_service.check(pipeline_request) == [
+        "join dataset: no file join/0000/unknown.csv"
+    ]
+    # the file read by the local engine: no pattern
+    pipeline_request.join.file_pattern_or_name = "*.csv"
+    assert schema_service.reader.locate(pipeline_request.join) is None
+    assert schema_service.check(pipeline_request) == [
+        "join dataset: no file join/0000/*.csv"
+    ]
+
+
+def test_check_delimiter_and_quote(local_root, schema_service):
+    write_source(local_root, 'key,phone,email\n"124","+336","fred@example.com"\n')
+    pipeline_request = get_pipeline_request()
+    errors = schema_service.check(pipeline_request)
+    assert errors == [
+        "source dataset: column delimiter ';' expected, ',' found in "
+        f"{schema_service.reader.locate(pipeline_request.source)[0]}"
+    ]
+    write_source(local_root, "key;phone;email\n'124';'+336';'fred@example.com'\n")
+    errors = schema_service.check(pipeline_request)
+    assert len(errors) == 1
+    assert errors[0].startswith("source dataset: quote character '\"' expected, \"'\"")
+    assert schema_service.reader.reads == 3
+
+
+def test_local_pipeline_preflight(
+    client: TestClient, local_root, schema_service, monkeypatch
+):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "local")
+    monkeypatch.setenv("DATAFACTORY_LOCAL_ROOT", local_root)
+    ConfigurationService.reload()
+    pipeline_request = get_pipeline_request()
+    pipeline_request.columns = ["key", "phone", "mail"]
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    assert response.status_code == 200
+    assert response.json()["error"]["code"] == 0
+
+    pipeline_request.preflight = True
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    assert response.status_code == 200
+    assert response.json()["error"]["code"] == 10
+    assert "'mail'" in response.json()["error"]["message"]
+
+    # enabled by default
+    monkeypatch.setenv("DATAFACTORY_PREFLIGHT", "true")
+    ConfigurationService.reload()
+    pipeline_request.preflight = None
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    assert response.json()["error"]["code"] == 10
+    pipeline_request.preflight = False
+    response = client.post(url="/pipeline", json=pipeline_request.dict())
+    assert response.json()["error"]["code"] == 0
+
+
+class FakeBlobServiceClient:
+    created = []
+
+    def __init__(self, account_url, credential, **options):
+        self.account_url = account_url
+        self.requests = []
+        FakeBlobServiceClient.created.append(self)
+
+    def get_container_client(self, container_name):
+        return SimpleNamespace(get_blob_client=self.get_blob_client)
+
+    def get_blob_client(self, name):
+        def get_blob_properties():
+            self.requests.append(("HEAD", name))
+            if name != "source/0000/sourcedata.csv":
+                raise ResourceNotFoundError("The specified blob does not exist.")
+            return SimpleNamespace(etag='"0x8D9"')
+
+        return SimpleNamespace(get_blob_properties=get_blob_properties)
+
+
+def test_blob_head_reader_locate(monkeypatch):
+    monkeypatch.setattr(
+        "src.schema_service.blob",
+        SimpleNamespace(BlobServiceClient=FakeBlobServiceClient),
+    )
+    monkeypatch.setattr(BlobHeadReader, "_clients", {})
+    FakeBlobServiceClient.created = []
+    dataset = get_dataset(SOURCE_CONTAINER, "source/0000", "sourcedata.csv")
+    for _ in range(3):
+        # a reader per request
+        assert BlobHeadReader(credential=object()).locate(dataset) == (
+            "source/0000/sourcedata.csv",
+            '"0x8D9"',
+        )
+    dataset.file_pattern_or_name = "missing.csv"
+    assert BlobHeadReader(credential=object()).locate(dataset) is None
+    # one client for the account, one request per check
+    [client] = FakeBlobServiceClient.created
+    assert (
+        client.account_url == f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/"
+    )
+    assert client.requests == [("HEAD", "source/0000/sourcedata.csv")] * 3 + [
+        ("HEAD", "source/0000/missing.csv")
+    ]
@@ -0,0 +1,298 @@
+import os
+import shutil
+from typing import Dict, List
+
+import pytest
+import src.app as app_module
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from src.configuration_service import ConfigurationService
+from src.factory_service import FactoryServiceError
+from src.local_factory_service import LocalFactoryService
+from src.models import PipelineRequest, RebalanceRequest
+from src.shard_service import ShardService
+from src.sharded_factory_service import ShardedFactoryService
+from tests.conftest import (
+    DATA_PATH,
+    SINK_CONTAINER,
+    SOURCE_CONTAINER,
+    STORAGE_ACCOUNT_NAME,
+    get_dataset,
+    get_pipeline_request,
+)
+
+
+def get_pipeline_requests(count: int) -> List[PipelineRequest]:
+    # a pipeline (and a pipeline id) per sink folder
+    pipeline_requests = []
+    for index in range(count):
+        pipeline_request = get_pipeline_request()
+        pipeline_request.sink = get_dataset(
+            SINK_CONTAINER, f"sink/{index:04d}", "sinkdata-00001.csv"
+        )
+        pipeline_requests.append(pipeline_request)
+    return pipeline_requests
+
+
+@pytest.fixture(scope="function")
+def local_factories(tmp_path, monkeypatch) -> Dict[str, LocalFactoryService]:
+    # the pipelines of a factory are read from its folder only
+    monkeypatch.setenv("DATAFACTORY_CACHE_BACKEND", "none")
+    monkeypatch.setenv("DATAFACTORY_PREFLIGHT", "false")
+    ConfigurationService.reload()
+    factories = {}
+    for factory in ["rg/factory-a", "rg/factory-b", "rg/factory-c"]:
+        root = tmp_path / factory.replace("/", "-")
+        for folder, file in [
+            ("source/0000", "sourcedata.csv"),
+            ("join/0000", "joindata.csv"),
+        ]:
+            path = root / STORAGE_ACCOUNT_NAME / SOURCE_CONTAINER / folder
+            path.mkdir(parents=True)
+            shutil.copy(os.path.join(DATA_PATH, file), path / file)
+        factories[factory] = LocalFactoryService(str(root))
+    return factories
+
+
+def get_sharded_factory_service(
+    factories: Dict[str, LocalFactoryService],
+    names: List[str],
+    drain: List[str] = None,
+) -> ShardedFactoryService:
+    return ShardedFactoryService(
+        ring=ShardService(names, vnodes=50),
+        create_factory_service=lambda factory: factories[factory],
+        drain=drain,
+    )
+
+
+def test_ring_stability():
+    pipeline_ids = [f"{index:08x}" for index in range(4000)]
+    ring = ShardService(["rg/factory-a", "rg/factory-b", "rg/factory-c"])
+    owners = {
+        pipeline_id: ring.get_factory(pipeline_id) for pipeline_id in pipeline_ids
+    }
+    for factory in ring.factories:
+        assert 0.2 < list(owners.values()).count(factory) / len(pipeline_ids) < 0.47
+
+    # same ring for the same factories
+    assert ShardService(list(ring.factories)).owners is ring.owners
+    assert ring.get_factories(pipeline_ids[0])[0] == owners[pipeline_ids[0]]
+    assert sorted(ring.get_factories(pipeline_ids[0])) == sorted(ring.factories)
+
+    ring = ShardService(ring.factories + ["rg/factory-d"])
+    moved = [
+        pipeline_id
+        for pipeline_id in pipeline_ids
+        if ring.get_factory(pipeline_id) != owners[pipeline_id]
+    ]
+    # about 1/4 of the pipelines, all moved to the new factory
+    assert 0.15 < len(moved) / len(pipeline_ids) < 0.35
+    assert {ring.get_factory(pipeline_id) for pipeline_id in moved} == {"rg/factory-d"}
+    # the previous owner is next in the preference list
+    for pipeline_id in moved:
+        assert ring.get_factories(pipeline_id)[1] == owners[pipeline_id]
+    assert ring.get_moves({"rg/factory-a": moved + pipeline_ids[:10]}) == [
+        (pipeline_id, "rg/factory-a", ring.get_factory(pipeline_id))
+        for pipeline_id in moved + pipeline_ids[:10]
+        if ring.get_factory(pipeline_id) != "rg/factory-a"
+    ]
+
+    with pytest.raises(ValueError):
+        ShardService([])
+
+
+def test_sharded_pipeline(local_factories):
+    factory_service = get_sharded_factory_service(
+        local_factories, list(local_factories)
+    )
+    pipeline_names = []
+    for pipeline_request in get_pipeline_requests(12):
+        pipeline_response = factory_service.pipeline(pipeline_request)
+        assert pipeline_response.error.code == FactoryServiceError.NO_ERROR
+        pipeline_names.append(pipeline_response.pipeline_name)
+
+    # each pipeline created on its owner only
+    for factory, local_factory in local_factories.items():
+        assert local_factory.get_pipeline_names() == sorted(
+            pipeline_name
+            for pipeline_name in pipeline_names
+            if factory_service.ring.get_factory(
+                factory_service.get_pipeline_id(pipeline_name)
+            )
+            == factory
+        )
+    assert len({factory_service.get_owner(name) for name in pipeline_names}) == 3
+
+    pipeline_name = pipeline_names[0]
+    pipeline_response = factory_service.pipeline_status(pipeline_name)
+    assert pipeline_response.pipeline_name == pipeline_name
+    run_response = factory_service.run(pipeline_name)
+    assert run_response.error.code == FactoryServiceError.NO_ERROR
+    run_response = factory_service.run_status(pipeline_name, run_response.run_id)
+    assert run_response.error.code == FactoryServiceError.NO_ERROR
+
+
+def test_rebalance(local_factories):
+    factories = list(local_factories)
+    factory_service = get_sharded_factory_service(local_factories, factories[:2])
+    pipeline_names = [
+        factory_service.pipeline(pipeline_request).pipeline_name
+        for pipeline_request in get_pipeline_requests(20)
+    ]
+    report = factory_service.rebalance(RebalanceRequest())
+    assert report.pipelines == 20
+    assert report.moves == []
+
+    # factory added: the pipelines are found on their previous owner
+    factory_service = get_sharded_factory_service(local_factories, factories)
+    moved = [
+        pipeline_name
+        for pipeline_name in pipeline_names
+        if factory_service.ring.get_factory(
+            factory_service.get_pipeline_id(pipeline_name)
+        )
+        == factories[2]
+    ]
+    assert moved
+    for pipeline_name in moved:
+        pipeline_response = factory_service.pipeline_status(pipeline_name)
+        assert pipeline_response.pipeline_name == pipeline_name
+        run_response = factory_service.run(pipeline_name)
+        assert run_response.error.code == FactoryServiceError.NO_ERROR
+
+    report = factory_service.rebalance(RebalanceRequest(dry_run=True))
+    assert report.dry_run
+    assert report.factories == factories
+    assert sorted(move.split(":")[0] for move in report.moves) == sorted(moved)
+    assert all(move.endswith(f"->{factories[2]}") for move in report.moves)
+    assert local_factories[factories[2]].get_pipeline_names() == []
+
+    report = factory_service.rebalance(RebalanceRequest(dry_run=False))
+    assert report.errors == []
+    assert len(report.moves) == len(moved)
+    assert local_factories[factories[2]].get_pipeline_names() == sorted(moved)
+    assert factory_service.rebalance(RebalanceRequest()).moves == []
+    for pipeline_name in pipeline_names:
+        assert factory_service.pipeline_status(pipeline_name) is not None
+    run_response = factory_service.run(moved[0])
+    assert run_response.error.code == FactoryServiceError.NO_ERROR
+
+
+def test_rebalance_drain(local_factories):
+    factories = list(local_factories)
+    factory_service = get_sharded_factory_service(local_factories, factories)
+    pipeline_names = [
+        factory_service.pipeline(pipeline_request).pipeline_name
+        for pipeline_request in get_pipeline_requests(20)
+    ]
+    removed = local_factories[factories[2]].get_pipeline_names()
+    assert removed
+
+    # factory removed from the ring: its pipelines are found until moved
+    factory_service = get_sharded_factory_service(
+        local_factories, factories[:2], drain=factories[1:]
+    )
+    assert factory_service.drain == factories[2:]
+    for pipeline_name in removed:
+        assert factory_service.pipeline_status(pipeline_name) is not None
+        run_response = factory_service.run(pipeline_name)
+        assert run_response.error.code == FactoryServiceError.NO_ERROR
+
+    report = factory_service.rebalance(RebalanceRequest(dry_run=True))
+    assert report.pipelines == 20
+    assert sorted(move.split(":")[0] for move in report.moves) == sorted(removed)
+    assert all(f":{factories[2]}->" in move for move in report.moves)
+
+    report = factory_service.rebalance(RebalanceRequest(dry_run=False))
+    assert report.errors == []
+    assert local_factories[factories[2]].get_pipeline_names() == []
+    for pipeline_name in pipeline_names:
+        assert factory_service.pipeline_status(pipeline_name) is not None
+
+
+def test_run_fallback(local_factories, monkeypatch):
+    factories = list(local_factories)
+    factory_service = get_sharded_factory_service(local_factories, factories)
+    pipeline_request = get_pipeline_request()
+    pipeline_name = factory_service.pipeline(pipeline_request).pipeline_name
+    owner, other = factory_service.get_factory_services(pipeline_name)[:2]
+    other.pipeline(pipeline_request)
+    runs = []
+    monkeypatch.setattr(other, "run", lambda *args: runs.append(args))
+
+    # pipeline found on the owner: its run error is returned
+    def run(pipeline_name, run_request=None):
+        run_response = LocalFactoryService.run(owner, pipeline_name, run_request)
+        run_response.error = owner.get_error(
+            FactoryServiceError.RUN_PIPELINE_ERROR, "run failed"
+        )
+        return run_response
+
+    monkeypatch.setattr(owner, "run", run)
+    run_response = factory_service.run(pipeline_name)
+    assert run_response.error.code == FactoryServiceError.RUN_PIPELINE_ERROR
+    assert runs == []
+
+    # owner not reachable: no fallback either
+    def pipeline_status(pipeline_name):
+        raise HTTPException(status_code=503, detail="factory not reachable")
+
+    monkeypatch.setattr(owner, "pipeline_status", pipeline_status)
+    with pytest.raises(HTTPException):
+        factory_service.run(pipeline_name)
+    assert runs == []
+
+
+def test_sharded_factory_settings(monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "datafactory")
+    monkeypatch.setenv("DATAFACTORY_SHARDS", "factory-a, other-rg/factory-b,factory-a")
+    ConfigurationService.reload()
+    factory_service = app_module.get_factory_service()
+    assert isinstance(factory_service, ShardedFactoryService)
+    assert factory_service.ring.factories == [
+        "datafactory-rg/factory-a",
+        "other-rg/factory-b",
+    ]
+    factory = factory_service.get_factory_service("other-rg/factory-b")
+    assert factory.resource_group_name == "other-rg"
+    assert factory.datafactory_name == "factory-b"
+
+    # a single factory: not sharded
+    monkeypatch.setenv("DATAFACTORY_SHARDS", "factory-a")
+    ConfigurationService.reload()
+    assert not isinstance(app_module.get_factory_service(), ShardedFactoryService)
+
+    # a single factory and the factories removed: sharded
+    monkeypatch.setenv("DATAFACTORY_SHARD_DRAIN", "factory-a,other-rg/factory-b")
+    ConfigurationService.reload()
+    factory_service = app_module.get_factory_service()
+    assert isinstance(factory_service, ShardedFactoryService)
+    assert factory_service.drain == ["other-rg/factory-b"]
+
+    monkeypatch.setenv("DATAFACTORY_SHARDS", "rg/factory/a")
+    with pytest.raises(ValueError):
+        ConfigurationService.reload()
+
+
+def test_rebalance_endpoint(client: TestClient, local_factories, monkeypatch):
+    monkeypatch.setenv("DATAFACTORY_EXECUTION_BACKEND", "local")
+    ConfigurationService.reload()
+    response = client.post(url="/admin/rebalance", json={"dry_run": True})
+    assert response.status_code == 400
+
+    factory_service = get_sharded_factory_service(
+        local_factories, list(local_factories)
+    )
+    factory_service.pipeline(get_pipeline_request())
+    client.app.dependency_overrides[
+        app_module.get_factory_service
+    ] = lambda: factory_service
+    try:
+        response = client.post(url="/admin/rebalance")
+    finally:
+        client.app.dependency_overrides = {}
+    assert response.status_code == 200
+    assert response.json()["dry_run"] is True
+    assert response.json()["pipelines"] == 1
+    assert response.json()["moves"] == []
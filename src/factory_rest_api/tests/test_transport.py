@@ -0,0 +1,103 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from azure.core.pipeline.transport import HttpRequest
+from fastapi.testclient import TestClient
+from src.transport_service import TransportService
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"value": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport_service(monkeypatch):
+    # session of the test, not shared with the other tests
+    monkeypatch.setattr(TransportService, "_session", None)
+    monkeypatch.setattr(TransportService, "_settings", None)
+    yield TransportService(pool_size=4, keep_alive=30)
+    if TransportService._session is not None:
+        TransportService._session.close()
+
+
+def test_connections_reused(http_server, transport_service):
+    # a new transport per SDK client, the session of the process
+    for _ in range(5):
+        transport = transport_service.get_transport()
+        response = transport.send(HttpRequest("GET", f"{http_server}/factories"))
+        assert response.status_code == 200
+        assert response.text() == '{"value": []}'
+        transport.close()
+    assert transport.session is TransportService._session
+    [metrics] = transport_service.get_metrics()
+    assert metrics.host == http_server
+    assert metrics.pool_size == 4
+    assert metrics.connections == 1
+    assert metrics.requests == 5
+    assert metrics.reused_requests == 4
+    assert metrics.idle_connections == 1
+
+
+def test_concurrent_connections(http_server, transport_service):
+    barrier = threading.Barrier(4)
+
+    def send():
+        barrier.wait()
+        for _ in range(5):
+            transport_service.get_transport().send(
+                HttpRequest("GET", f"{http_server}/factories")
+            )
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    [metrics] = transport_service.get_metrics()
+    assert metrics.requests == 20
+    # a connection per thread at most, kept in the pool
+    assert metrics.connections <= 4
+    assert metrics.idle_connections == metrics.connections
+
+
+def test_session_settings(transport_service):
+    session = transport_service.get_session()
+    assert TransportService(pool_size=4, keep_alive=30).get_session() is session
+    adapter = session.get_adapter("https://management.azure.com/")
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total is False
+    assert "socket_options" in adapter.poolmanager.connection_pool_kw
+    # new settings: new session
+    assert TransportService(pool_size=8).get_session() is not session
+
+
+def test_transport_metrics(client: TestClient, http_server, transport_service):
+    assert client.get(url="/admin/transport").json() == []
+    transport_service.get_transport().send(HttpRequest("GET", f"{http_server}/"))
+    response = client.get(url="/admin/transport")
+    assert response.status_code == 200
+    [metrics] = response.json()
+    assert metrics["requests"] == 1
+    assert metrics["connections"] == 1